@@ -1,20 +1,53 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-import joblib
-import pandas as pd
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from pydantic import BaseModel, ValidationError
+from contextlib import asynccontextmanager
+from typing import List, Optional
+import json
+import os
 import numpy as np
+import time
 import traceback
+from src import metrics
+from src.feature_extractor import FEATURE_COLUMNS, SOURCE_FEATURE_COLUMNS
+from src.flow_codec import CONTENT_TYPE as BINARY_CONTENT_TYPE, decode_columns
+from src.micro_batcher import MicroBatcher
+from src.model_registry import ModelRegistry
 
-# 1. Initialize App
-app = FastAPI(title="0xGuard AI Security API", version="3.0 - Production")
-
-# 2. Load Model
+# 1. Load Model (memory-mapped artifact shared by all workers, pickle as fallback)
+models = ModelRegistry('models/isolation_forest.flat', 'models/isolation_forest.pkl',
+                       poll_interval=float(os.environ.get("OXGUARD_MODEL_POLL_SECONDS", "5")))
 try:
-    model = joblib.load('models/isolation_forest.pkl')
-    print("✅ Model loaded. Ready for inference.")
+    models.load()
+    print(f"✅ Model {models.current.version} loaded. Ready for inference.")
 except Exception as e:
     print(f"❌ CRITICAL: Model failed to load: {e}")
-    model = None
+
+# 2. Initialize App (the watcher hot-swaps retrained models while serving)
+@asynccontextmanager
+async def lifespan(app):
+    models.start()
+    yield
+    models.stop()
+
+app = FastAPI(title="0xGuard AI Security API", version="3.0 - Production", lifespan=lifespan)
+
+# Metrics are per process: with several uvicorn workers, each serves its own /metrics
+REQUEST_SECONDS = metrics.histogram("oxguard_api_request_seconds", "API request latency", ["path"])
+REQUESTS = metrics.counter("oxguard_api_requests_total", "API requests by path and status", ["path", "status"])
+THREATS = metrics.counter("oxguard_api_threats_total", "Flows scored as threats")
+PROFILING = os.environ.get("OXGUARD_PROFILING", "0") == "1"  # Enables /debug/profile/* (runtime profiler)
+
+@app.middleware("http")
+async def time_requests(request, call_next):
+    started = time.perf_counter()
+    response = await call_next(request)
+    # Streaming bodies are still being produced here: this is time to first byte for /analyze/stream
+    path = request.scope.get("route").path if request.scope.get("route") else "unmatched"
+    REQUEST_SECONDS.observe(time.perf_counter() - started, path=path)
+    REQUESTS.inc(path=path, status=response.status_code)
+    return response
 
 # 3. Define EXACT Input Schema (Matching your Model)
 class NetworkFlow(BaseModel):
@@ -26,32 +59,90 @@ class NetworkFlow(BaseModel):
     packet_rate: float
     byte_rate: float
     tcp_flags_sum: int
+    # Per-source context (sensor sketches); a lone flow is its own context when omitted
+    src_distinct_ports: Optional[int] = None
+    src_distinct_hosts: Optional[int] = None
+    src_packets: Optional[int] = None
+
+class FlowBatch(BaseModel):
+    flows: List[NetworkFlow]
+
+# Request field names, in model column order (FEATURE_COLUMNS / SOURCE_FEATURE_COLUMNS)
+FLOW_FIELDS = ["dst_port", "protocol", "flow_packets", "flow_bytes",
+               "flow_duration", "packet_rate", "byte_rate", "tcp_flags_sum"]
+SOURCE_FIELDS = ["src_distinct_ports", "src_distinct_hosts", "src_packets"]
+
+THRESHOLD = 0.00
+STREAM_CHUNK_ROWS = 1000  # Max flows scored per call on /analyze/stream
+
+# Micro-batching of concurrent /analyze calls (MAX_BATCH <= 1 disables it)
+MICROBATCH_MAX_WAIT_MS = float(os.environ.get("OXGUARD_BATCH_MAX_WAIT_MS", "2"))
+MICROBATCH_MAX_BATCH = int(os.environ.get("OXGUARD_BATCH_MAX_ROWS", "256"))
+
+def feature_row(get):
+    """Flow + source feature values (11) from a field getter; missing source fields get neutral defaults."""
+    row = [get(name) for name in FLOW_FIELDS]
+    defaults = [1, 1, row[2]]  # One port, one host, this flow's packets
+    return row + [default if (value := get(name)) is None else value
+                  for name, default in zip(SOURCE_FIELDS, defaults)]
+
+def with_source_columns(matrix):
+    """Pads an 8-column (flow only) matrix with the neutral source columns."""
+    if matrix.shape[1] == len(FEATURE_COLUMNS) + len(SOURCE_FEATURE_COLUMNS):
+        return matrix
+    if matrix.shape[1] != len(FEATURE_COLUMNS):
+        raise ValueError(f"Expected {len(FEATURE_COLUMNS)} or {len(FEATURE_COLUMNS) + len(SOURCE_FEATURE_COLUMNS)} "
+                         f"columns, got {matrix.shape[1]}")
+    ones = np.ones((len(matrix), 2), dtype=matrix.dtype)
+    return np.hstack([matrix, ones, matrix[:, 2:3]])
+
+def score_matrix(matrix):
+    """Scores an (n_flows, 11) matrix in one vectorized call."""
+    # One model reference per call: a hot swap never splits a batch
+    model = models.current
+    metrics.INFERENCE_ROWS.observe(len(matrix))
+    with metrics.stage("predict"):
+        scores = model.decision_function(matrix[:, :model.n_features])  # 8-feature models ignore source columns
+    THREATS.inc(int((scores <= THRESHOLD).sum()))
+    return scores
+
+def batch_verdict(scores):
+    """Columnar verdicts for a batch: one list per field."""
+    threats = scores <= THRESHOLD
+    return {
+        "count": int(len(scores)),
+        "threats": int(threats.sum()),
+        "anomaly_score": scores.tolist(),
+        "status": np.where(threats, "THREAT", "SAFE").tolist(),
+        "action": np.where(threats, "BLOCK", "ALLOW").tolist()
+    }
+
+batcher = MicroBatcher(score_matrix, MICROBATCH_MAX_WAIT_MS, MICROBATCH_MAX_BATCH) \
+    if MICROBATCH_MAX_BATCH > 1 else None
+if batcher is not None:
+    metrics.counter("oxguard_api_microbatches_total", "Coalesced /analyze scoring calls").set_function(
+        lambda: batcher.batches)
+metrics.gauge("oxguard_model_loaded_timestamp_seconds", "When the active model went live").set_function(
+    lambda: models.loaded_at)
 
 # 4. Predict Endpoint
 @app.post("/analyze")
-def analyze_traffic(flow: NetworkFlow):
-    if not model:
+async def analyze_traffic(flow: NetworkFlow):
+    if models.current is None:
         raise HTTPException(status_code=500, detail="Model is offline")
 
     try:
-        # Create DataFrame with EXACT column names and order
-        input_data = pd.DataFrame([{
-            'Dst_Port': flow.dst_port,
-            'Protocol': flow.protocol,
-            'Flow_Packets': flow.flow_packets,
-            'Flow_Bytes': flow.flow_bytes,
-            'Flow_Duration': flow.flow_duration,
-            'Packet_Rate': flow.packet_rate,
-            'Byte_Rate': flow.byte_rate,
-            'TCP_Flags_Sum': flow.tcp_flags_sum
-        }])
-
-        # Get Anomaly Score
-        score = model.decision_function(input_data)[0]
-
-        # Threshold Logic (Tweak this if needed)
-        threshold = 0.00
-        status = "SAFE" if score > threshold else "THREAT"
+        # Feature row in EXACT model column order
+        row = feature_row(lambda name: getattr(flow, name))
+
+        # Get Anomaly Score (coalesced with concurrent requests when batching)
+        if batcher is not None:
+            score = await batcher.submit(row)
+        else:
+            score = (await run_in_threadpool(score_matrix, np.array([row], dtype=np.float64)))[0]
+
+        # Threshold Logic (Tweak THRESHOLD if needed)
+        status = "SAFE" if score > THRESHOLD else "THREAT"
         action = "ALLOW" if status == "SAFE" else "BLOCK"
 
         return {
@@ -65,6 +156,109 @@ def analyze_traffic(flow: NetworkFlow):
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Prediction Failed: {str(e)}")
 
+# 5. Batch Endpoint: JSON {"flows": [...]} or the columnar binary format
+@app.post("/analyze/batch")
+async def analyze_batch(request: Request):
+    if models.current is None:
+        raise HTTPException(status_code=500, detail="Model is offline")
+
+    body = await request.body()
+    content_type = request.headers.get("content-type", "")
+    try:
+        if content_type.startswith(BINARY_CONTENT_TYPE):
+            matrix = with_source_columns(decode_columns(body))
+        else:
+            batch = FlowBatch.model_validate_json(body)
+            matrix = np.array([feature_row(lambda name: getattr(f, name)) for f in batch.flows],
+                              dtype=np.float64).reshape(-1, len(FLOW_FIELDS) + len(SOURCE_FIELDS))
+    except (ValueError, ValidationError) as e:
+        raise HTTPException(status_code=422, detail=f"Invalid batch: {e}")
+
+    if len(matrix) == 0:
+        return batch_verdict(np.empty(0))
+
+    try:
+        scores = await run_in_threadpool(score_matrix, matrix)
+    except Exception as e:
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=f"Prediction Failed: {str(e)}")
+    return batch_verdict(scores)
+
+# 6. Streaming Endpoint: NDJSON flows in, NDJSON verdicts out
+class DuplexStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse that leaves `receive` to the endpoint. The stock class
+    may listen for client disconnects on the same channel, which would steal
+    the request body chunks the verdict generator is still reading.
+    """
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+
+def _parse_line(line):
+    flow = json.loads(line)
+    return [float(value) for value in feature_row(lambda name: flow[name] if name in FLOW_FIELDS else flow.get(name))]
+
+@app.post("/analyze/stream")
+async def analyze_stream(request: Request):
+    if models.current is None:
+        raise HTTPException(status_code=500, detail="Model is offline")
+
+    async def verdicts():
+        buffer = b""
+        line_no = 0
+        async for chunk in request.stream():
+            lines = (buffer + chunk).split(b"\n")
+            buffer = lines.pop()  # Partial line, completed by the next chunk
+            async for out in _score_lines(lines, line_no):
+                yield out
+            line_no += len(lines)
+        if buffer.strip():
+            async for out in _score_lines([buffer], line_no):
+                yield out
+
+    return DuplexStreamingResponse(verdicts(), media_type="application/x-ndjson")
+
+async def _score_lines(lines, first_line_no):
+    """Scores whatever full lines a network chunk delivered, in bounded calls."""
+    rows, line_nos = [], []
+    for i, line in enumerate(lines):
+        if not line.strip():
+            continue
+        try:
+            rows.append(_parse_line(line))
+            line_nos.append(first_line_no + i + 1)
+        except (ValueError, KeyError, TypeError) as e:
+            yield json.dumps({"line": first_line_no + i + 1, "error": f"Invalid flow: {e}"}) + "\n"
+
+    for start in range(0, len(rows), STREAM_CHUNK_ROWS):
+        matrix = np.array(rows[start:start + STREAM_CHUNK_ROWS], dtype=np.float64)
+        scores = await run_in_threadpool(score_matrix, matrix)
+        out = []
+        for line_no, score in zip(line_nos[start:start + STREAM_CHUNK_ROWS], scores):
+            safe = score > THRESHOLD
+            out.append(json.dumps({
+                "line": line_no,
+                "status": "SAFE" if safe else "THREAT",
+                "action": "ALLOW" if safe else "BLOCK",
+                "anomaly_score": float(score)
+            }))
+        yield "\n".join(out) + "\n"
+
+@app.get("/metrics")
+def metrics_endpoint():
+    return PlainTextResponse(metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
+@app.api_route("/debug/profile/{action}", methods=["GET", "POST"])
+def profile_endpoint(action: str, mode: str = "sample"):
+    if not PROFILING:
+        raise HTTPException(status_code=404, detail="Profiling is disabled (set OXGUARD_PROFILING=1)")
+    status, text = metrics.profile_request(action, {"mode": mode})
+    return PlainTextResponse(text, status_code=status)
+
+@app.get("/model")
+def model_info():
+    return models.info()
+
 @app.get("/")
 def health_check():
-    return {"status": "active", "system": "0xGuard API"}
\ No newline at end of file
+    return {"status": "active", "system": "0xGuard API", "model_version": models.info()["version"]}
\ No newline at end of file
@@ -0,0 +1,344 @@
+import os
+import asyncio
+import argparse
+import logging
+import socket
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+from src import metrics
+from src.event_sink import EventSink
+from src.feature_extractor import FlowKeys, pack_ip
+from src.flow_export import ACK, BATCH, EXPORT_COLUMNS, FRAME_HEADER_SIZE, HELLO, ProtocolError, \
+    decode_batch, decode_hello, encode_ack, encode_frame, frame_payload, parse_address, parse_frame_header
+from src.model_registry import ModelRegistry
+from src.sketches import SOURCE_COUNT_COLUMNS
+from src.verdicts import VerdictFilter, source_verdicts
+
+# --- CONFIGURATION ---
+LISTEN = ["127.0.0.1:7700"]  # "host:port" and/or "unix:/path"; sensors export with main.py --export
+MODEL_PATH = "models/isolation_forest.pkl"
+MODEL_ARTIFACT = "models/isolation_forest.flat"
+MODEL_POLL_SECONDS = 5
+BATCH_MAX_ROWS = 65536  # Rows scored per model call, pooled across sensors
+BATCH_MAX_WAIT_MS = 5  # Wait for other sensors' batches once one is queued
+QUEUE_BATCHES = 1024  # Decoded batches awaiting scoring; beyond this sensors are slowed down (TCP backpressure)
+MAX_SESSIONS = 4096  # Sensor sessions remembered for resend detection
+ACK_HISTORY = 64  # Scored batches per session whose block lists are replayed to resends (>= sensor max_inflight)
+BLOCK_SCORE = 0.00  # Sources whose worst flow scores below this are blocked by their sensor
+# Repeat verdicts for a sensor's source are dropped for this long (sliding-table sensors re-emit
+# active flows every tick); just under main.py's 5 s CAPTURE_WINDOW so tumbling windows all count
+VERDICT_HOLD_SECONDS = 4.5
+LOG_DIR = "logs"
+LOG_FILE = os.path.join(LOG_DIR, "security_log.csv")  # Dashboard feed, all sensors
+EVENT_DB = os.path.join(LOG_DIR, "security_events.db")  # The central event store
+METRICS_PORT = 9109  # Prometheus /metrics (0 = off)
+METRICS_HOST = "127.0.0.1"
+
+# Batch matrix columns holding how many flows / distinct ports each row stands for
+FLOWS_COLUMN, PORTS_COLUMN = (EXPORT_COLUMNS.index(column) for column in SOURCE_COUNT_COLUMNS)
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - [0xGUARD] - %(levelname)s - %(message)s',
+    datefmt='%H:%M:%S'
+)
+logger = logging.getLogger("0xGuard")
+
+# --- METRICS ---
+SENSOR_ROWS = metrics.counter("oxguard_collector_rows_total", "Flows received per sensor", ["sensor"])
+SENSOR_BATCHES = metrics.counter("oxguard_collector_batches_total", "Batches received per sensor", ["sensor"])
+WIRE_BYTES = metrics.counter("oxguard_collector_wire_bytes_total", "BATCH bytes received, as sent (compressed)")
+RAW_BYTES = metrics.counter("oxguard_collector_raw_bytes_total", "BATCH bytes received, decompressed")
+RESENDS = metrics.counter("oxguard_collector_resent_batches_total", "Batches already queued or scored, not scored again")
+ERRORS = metrics.counter("oxguard_collector_protocol_errors_total", "Connections dropped on malformed frames")
+VERDICTS = metrics.counter("oxguard_verdicts_total", "Per-source verdicts by action", ["action"])
+
+
+class FlowCollector:
+    """
+    Central scoring service for sensors running in export mode.
+
+    Each sensor connection is one asyncio task that reads frames, decodes
+    BATCH payloads and queues them. A single scoring task takes whatever
+    batches are queued (waiting max_wait_ms for more once the first
+    arrives), scores them together in one model call on a worker thread,
+    logs per-source verdicts for every window to the event store (repeats
+    within VERDICT_HOLD_SECONDS dropped) and acknowledges each batch to
+    its sensor with the sources to block.
+    Batches a sensor resends after a reconnect are not scored twice: an
+    already scored batch is acknowledged again with its original block
+    list, and one still queued is acknowledged on the new connection once
+    scored.
+    """
+
+    def __init__(self, listen=LISTEN, models=None, events=None, max_batch_rows=BATCH_MAX_ROWS,
+                 max_wait_ms=BATCH_MAX_WAIT_MS, queue_batches=QUEUE_BATCHES):
+        self.listen = list(listen)
+        self.models = models
+        self.events = events
+        self.max_batch_rows = max_batch_rows
+        self.max_wait = max_wait_ms / 1000.0
+        self.queue_batches = queue_batches
+        self.ready = threading.Event()  # Set once every listener is bound
+        self._sessions = OrderedDict()  # (sensor, session) -> last queued seq
+        self._acks = OrderedDict()  # (sensor, session) -> OrderedDict(seq -> block list) of recent ACKs
+        self._links = {}  # (sensor, session) -> writer of its live connection
+        self.verdicts = VerdictFilter(VERDICT_HOLD_SECONDS)  # Keyed by (sensor, source IP)
+        self._servers = []
+        self._writers = set()
+        self._queue = None
+        self._loop = None
+        self._stopping = None
+
+        # Counters for reporting
+        self.sensors = 0  # Connected now
+        self.batches = 0
+        self.rows = 0
+        self.scoring_calls = 0
+        self.blocks = 0
+
+    # --- LIFECYCLE ---
+    async def serve(self):
+        """Listens and scores until stop() is called."""
+        self._loop = asyncio.get_running_loop()
+        self._stopping = asyncio.Event()
+        self._queue = asyncio.Queue(self.queue_batches)
+        for address in self.listen:
+            family, target = parse_address(address)
+            if family == socket.AF_UNIX:
+                if os.path.exists(target):
+                    os.unlink(target)  # Stale socket from a previous run
+                server = await asyncio.start_unix_server(self._handle, path=target)
+            else:
+                server = await asyncio.start_server(self._handle, *target)
+            self._servers.append(server)
+            logger.info(f"Collector listening on {address}")
+        self.ready.set()
+
+        scorer = asyncio.create_task(self._score_loop())
+        await self._stopping.wait()
+        for server in self._servers:
+            server.close()
+        for writer in list(self._writers):
+            writer.close()  # Sensors reconnect elsewhere or resend on restart
+        for server in self._servers:
+            await server.wait_closed()
+        await self._queue.put(None)  # Score what is queued, then exit
+        await scorer
+        self._loop = None
+
+    def queue_depth(self):
+        """Batches waiting to be scored."""
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def stop(self):
+        """Thread-safe: ends serve() after the queued batches are scored."""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._stopping.set)
+
+    # --- SENSOR CONNECTIONS ---
+    async def _handle(self, reader, writer):
+        peer = writer.get_extra_info("peername") or "unix socket"
+        sensor = None
+        self.sensors += 1
+        self._writers.add(writer)
+        try:
+            sensor, session, n_cols, order = await self._hello(reader)
+            logger.info(f"Sensor {sensor} connected from {peer}")
+            key = (sensor, session)
+            self._links[key] = writer  # ACKs for its batches still queued come here
+            while True:
+                header = await reader.readexactly(FRAME_HEADER_SIZE)
+                frame_type, flags, length = parse_frame_header(header)
+                if frame_type != BATCH:
+                    raise ProtocolError(f"Unexpected frame type {frame_type}")
+                payload = frame_payload(flags, await reader.readexactly(length))
+                batch = decode_batch(payload, n_cols)
+                WIRE_BYTES.inc(length)
+                RAW_BYTES.inc(len(payload))
+
+                if batch.seq <= self._sessions.get(key, 0):
+                    RESENDS.inc()
+                    acks = self._acks.get(key)
+                    block = acks.get(batch.seq) if acks else None
+                    if block is None and acks and batch.seq < next(iter(acks)):
+                        block = []  # Scored too long ago to remember
+                    if block is not None:
+                        writer.write(encode_frame(ACK, encode_ack(batch.seq, len(batch.matrix), block)))
+                    continue  # Otherwise still queued: acknowledged here once scored
+                self._sessions[key] = batch.seq
+                self._sessions.move_to_end(key)
+                if len(self._sessions) > MAX_SESSIONS:
+                    self._sessions.popitem(last=False)
+
+                matrix = batch.matrix if order is None else batch.matrix[:, order]
+                self.batches += 1
+                self.rows += len(matrix)
+                SENSOR_BATCHES.inc(sensor=sensor)
+                SENSOR_ROWS.inc(len(matrix), sensor=sensor)
+                await self._queue.put((writer, key, batch, matrix))  # Blocks when scoring falls behind
+        except asyncio.IncompleteReadError:
+            pass  # Sensor disconnected
+        except (ProtocolError, ValueError) as e:
+            ERRORS.inc()
+            logger.warning(f"Dropping sensor {sensor or peer}: {e}")
+        except ConnectionError as e:
+            logger.warning(f"Sensor {sensor or peer} connection lost: {e}")
+        finally:
+            self.sensors -= 1
+            self._writers.discard(writer)
+            if sensor is not None and self._links.get(key) is writer:
+                del self._links[key]
+            writer.close()
+            if sensor is not None:
+                logger.info(f"Sensor {sensor} disconnected")
+
+    async def _hello(self, reader):
+        header = await reader.readexactly(FRAME_HEADER_SIZE)
+        frame_type, flags, length = parse_frame_header(header)
+        if frame_type != HELLO:
+            raise ProtocolError("Expected HELLO as the first frame")
+        sensor, session, columns = decode_hello(frame_payload(flags, await reader.readexactly(length)))
+        missing = [column for column in EXPORT_COLUMNS if column not in columns]
+        if missing:
+            raise ProtocolError(f"Sensor {sensor} does not send {', '.join(missing)}")
+        # Column order the model expects, when the sensor's differs
+        order = [columns.index(column) for column in EXPORT_COLUMNS]
+        return sensor, session, len(columns), None if order == list(range(len(columns))) else np.array(order)
+
+    # --- SCORING ---
+    async def _score_loop(self):
+        while True:
+            item = await self._queue.get()
+            if item is None:
+                return
+            items, rows = [item], len(item[3])
+            deadline = time.monotonic() + self.max_wait
+            # Pool batches from every sensor up to max_batch_rows
+            while rows < self.max_batch_rows:
+                try:
+                    if self._queue.empty():
+                        item = await asyncio.wait_for(self._queue.get(), max(0.0, deadline - time.monotonic()))
+                    else:
+                        item = self._queue.get_nowait()
+                except asyncio.TimeoutError:
+                    break
+                if item is None:
+                    self._queue.put_nowait(None)  # Exit after this call
+                    break
+                items.append(item)
+                rows += len(item[3])
+
+            try:
+                blocks = await self._loop.run_in_executor(None, self._score, items)
+            except Exception as e:
+                logger.error(f"Inference error: {e}")
+                # Forget the batches and drop their sensors: they resend them after reconnecting
+                for writer, key, batch, _ in items:
+                    self._sessions[key] = min(self._sessions.get(key, 0), batch.seq - 1)
+                    self._links.get(key, writer).close()
+                continue
+            for (writer, key, batch, matrix), block in zip(items, blocks):
+                self._remember_ack(key, batch.seq, block)
+                writer = self._links.get(key, writer)  # The sensor may have reconnected since
+                if not writer.is_closing():
+                    writer.write(encode_frame(ACK, encode_ack(batch.seq, len(matrix), block)))
+
+    def _remember_ack(self, key, seq, block):
+        """Keeps a scored batch's block list so a resend gets the same ACK."""
+        acks = self._acks.get(key)
+        if acks is None:
+            acks = self._acks[key] = OrderedDict()
+            if len(self._acks) > MAX_SESSIONS:
+                self._acks.popitem(last=False)
+        self._acks.move_to_end(key)
+        acks[seq] = block
+        if len(acks) > ACK_HISTORY:
+            acks.popitem(last=False)
+
+    def _score(self, items):
+        """Worker thread: one model call for all queued batches, then verdicts per window."""
+        model = self.models.current  # One model for the whole call
+        matrix = np.concatenate([item[3] for item in items]) if len(items) > 1 else items[0][3]
+        metrics.INFERENCE_ROWS.observe(len(matrix))
+        with metrics.stage("predict"):
+            scores, predictions = model.score(matrix[:, :model.n_features])
+        self.scoring_calls += 1
+
+        blocks = []
+        base = 0  # First row of the current batch in the pooled matrix
+        with metrics.stage("respond"):
+            for _, (sensor, _), batch, _ in items:
+                block = set()
+                keys = batch.flow_keys
+                first = 0
+                for window_end, rows in batch.windows:
+                    window = slice(first, first + rows)
+                    pooled = slice(base + first, base + first + rows)
+                    window_keys = FlowKeys(keys.src[window], keys.dst[window], keys.dst_port[window],
+                                           keys.proto[window])
+                    for verdict in source_verdicts(window_keys, scores[pooled], predictions[pooled],
+                                                   matrix[pooled, FLOWS_COLUMN], matrix[pooled, PORTS_COLUMN]):
+                        self._respond(sensor, verdict, window_end, block)
+                    first += rows
+                base += first
+                blocks.append(sorted(block))
+        return blocks
+
+    def _respond(self, sensor, verdict, window_end, block):
+        """Logs one source verdict to the central event store; blocked sources go back to the sensor."""
+        ip, score = verdict.source_ip, verdict.worst_score
+        risk, action = ("CRITICAL", "BLOCKED") if score < BLOCK_SCORE else ("MEDIUM", "LOGGED")
+        if not self.verdicts.admit((sensor, ip), action, window_end):
+            return  # Already acted on for this sensor within the hold
+        if action == "BLOCKED":
+            block.add(pack_ip(ip))
+            self.blocks += 1
+        VERDICTS.inc(action=action)
+        if self.events is not None:
+            self.events.emit(ip, risk, action, verdict.protocol, score, timestamp=window_end)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="0xGuard central collector: scores flows exported by sensors")
+    parser.add_argument("--listen", action="append", help="host:port or unix:/path (repeatable)")
+    parser.add_argument("--metrics-port", type=int, default=METRICS_PORT)
+    args = parser.parse_args()
+
+    os.makedirs(LOG_DIR, exist_ok=True)
+    models = ModelRegistry(MODEL_ARTIFACT, MODEL_PATH, poll_interval=MODEL_POLL_SECONDS)
+    try:
+        models.load()
+    except FileNotFoundError:
+        logger.critical(f"Model not found at {MODEL_ARTIFACT} or {MODEL_PATH}. Run tools/train_model.py first.")
+        raise SystemExit(1)
+    events = EventSink(EVENT_DB, csv_path=LOG_FILE)
+    collector = FlowCollector(args.listen or LISTEN, models, events)
+    metrics.gauge("oxguard_collector_sensors", "Connected sensors").set_function(lambda: collector.sensors)
+    metrics.gauge("oxguard_collector_queue_batches", "Batches waiting to be scored").set_function(
+        collector.queue_depth)
+    metrics.counter("oxguard_collector_scoring_calls_total", "Pooled model calls").set_function(
+        lambda: collector.scoring_calls)
+    metrics.counter("oxguard_verdicts_suppressed_total", "Repeat source verdicts dropped within the hold").set_function(
+        lambda: collector.verdicts.suppressed)
+    server = metrics.MetricsServer(args.metrics_port, METRICS_HOST) if args.metrics_port else None
+
+    if server is not None:
+        server.start()
+    events.start()
+    models.start()
+    try:
+        asyncio.run(collector.serve())
+    except KeyboardInterrupt:
+        logger.info("Shutting down collector.")
+    finally:
+        models.stop()
+        events.close()
+        if server is not None:
+            server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -2,11 +2,12 @@ import streamlit as st
 import pandas as pd
 import plotly.express as px
 import time
-import os
+from src.log_aggregator import LogAggregator
 
 # --- CONFIGURATION ---
 LOG_FILE = "logs/security_log.csv"
 REFRESH_RATE = 2  # Seconds
+CHART_MINUTES = 120  # Per-minute buckets kept for the chart
 
 st.set_page_config(
     page_title="0xGuard Security Console",
@@ -49,46 +50,37 @@ with col_log:
     st.subheader("Live Audit Log")
     log_placeholder = st.empty()
 
-def load_logs():
-    if not os.path.exists(LOG_FILE):
-        return pd.DataFrame(columns=["Timestamp", "Source_IP", "Risk_Level", "Action", "Protocol", "Anomaly_Score"])
-    try:
-        df = pd.read_csv(LOG_FILE)
-        return df
-    except Exception:
-        return pd.DataFrame()
+@st.cache_resource
+def get_aggregator():
+    """One tailing aggregator shared by every browser session."""
+    return LogAggregator(LOG_FILE, minutes=CHART_MINUTES)
+
+def color_risk(val):
+    color = '#ff4b4b' if val == 'CRITICAL' else '#ffa726' if val == 'HIGH' else '#ffffff'
+    return f'color: {color}'
 
 # --- MAIN LOOP ---
+logs = get_aggregator()
 while True:
-    df = load_logs()
-    
-    if not df.empty:
-        # Metrics
-        total_events = len(df)
-        blocked_count = len(df[df['Action'] == 'BLOCKED'])
-        critical_count = len(df[df['Risk_Level'] == 'CRITICAL'])
-        last_event = df['Timestamp'].iloc[-1] if not df.empty else "N/A"
+    # Reads only what was appended since the last refresh (any session's)
+    logs.refresh()
 
-        metric_total.metric("Total Anomalies", total_events)
-        metric_blocked.metric("⛔ Threats Mitigated", blocked_count, delta_color="inverse")
-        metric_critical.metric("🔥 Critical Alerts", critical_count, delta_color="inverse")
-        metric_last_seen.metric("Last Event", last_event.split(' ')[-1])
+    if logs.total:
+        # Metrics
+        metric_total.metric("Total Anomalies", logs.total)
+        metric_blocked.metric("⛔ Threats Mitigated", logs.blocked, delta_color="inverse")
+        metric_critical.metric("🔥 Critical Alerts", logs.critical, delta_color="inverse")
+        metric_last_seen.metric("Last Event", logs.last_event.split(' ')[-1])
 
         # Chart: Anomalies over time
-        if 'Timestamp' in df.columns:
-            df['Time'] = pd.to_datetime(df['Timestamp'])
-            hourly_counts = df.resample('1min', on='Time').count()['Source_IP']
-            fig = px.area(hourly_counts, x=hourly_counts.index, y='Source_IP', title="Anomalies / Minute")
-            fig.update_traces(line_color='#FF4B4B', fillcolor="rgba(255, 75, 75, 0.2)")
-            fig.update_layout(xaxis_title="Time", yaxis_title="Events", template="plotly_dark")
-            chart_placeholder.plotly_chart(fig, use_container_width=True, key=time.time())
+        per_minute = logs.per_minute()
+        fig = px.area(per_minute, x=per_minute.index, y='Events', title="Anomalies / Minute")
+        fig.update_traces(line_color='#FF4B4B', fillcolor="rgba(255, 75, 75, 0.2)")
+        fig.update_layout(xaxis_title="Time", yaxis_title="Events", template="plotly_dark")
+        chart_placeholder.plotly_chart(fig, use_container_width=True, key=time.time())
 
         # Log Table
-        latest_logs = df.tail(15)[::-1]
-        
-        def color_risk(val):
-            color = '#ff4b4b' if val == 'CRITICAL' else '#ffa726' if val == 'HIGH' else '#ffffff'
-            return f'color: {color}'
+        latest_logs = logs.latest()
 
         log_placeholder.dataframe(
             latest_logs[['Timestamp', 'Risk_Level', 'Action']].style.applymap(color_risk, subset=['Risk_Level']),
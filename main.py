@@ -1,18 +1,69 @@
 import os
 import time
-import joblib
+import argparse
+import importlib
+import threading
 import logging
-import pandas as pd
+import numpy as np
 from datetime import datetime
-from scapy.all import sniff
-from src.feature_extractor import FlowExtractor
-from src.response_manager import ResponseManager
+from src import metrics
+from src.capture_engine import CaptureEngine
+from src.event_sink import EventSink
+from src.feature_extractor import FEATURE_COLUMNS, FLOW_TABLES, model_columns
+from src.flow_export import EXPORT_COLUMNS, EXPORT_FEATURES, FlowExporter
+from src.model_registry import ModelRegistry
+from src.pcap_reader import replay_windows
+from src.response_manager import DEFAULT_NOTIFIER, FIREWALLS, NOTIFIERS, ResponseManager
+from src.sharded_capture import ShardedCaptureEngine, sharded_replay_windows
+from src.sketches import COLLAPSE_HOSTS, COLLAPSE_PORTS, SourceSketches, collapse_sources
+from src.verdicts import VerdictFilter, source_verdicts
 
 # --- CONFIGURATION ---
 MODEL_PATH = "models/isolation_forest.pkl"
+MODEL_ARTIFACT = "models/isolation_forest.flat"  # Shared, memory-mapped (tools/export_model.py)
+MODEL_POLL_SECONDS = 5  # Hot-reload check interval
 LOG_DIR = "logs"
-LOG_FILE = os.path.join(LOG_DIR, "security_log.csv")
+LOG_FILE = os.path.join(LOG_DIR, "security_log.csv")  # Dashboard feed (CSV compatibility output)
+EVENT_DB = os.path.join(LOG_DIR, "security_events.db")  # Indexed by time and source IP
+EVENT_CSV = True  # Also write LOG_FILE for the dashboard
+EVENT_QUEUE_SIZE = 100000  # Events buffered before new ones are dropped
+EVENT_FLUSH_SECONDS = 1.0
+EVENT_ROTATE_MB = 64
+EVENT_ROTATE_HOURS = 24
+RESPONSE_NOTIFIER = DEFAULT_NOTIFIER  # "macos", "log" or "record" (no-op)
+RESPONSE_FIREWALL = "simulate"  # "simulate" (print only), "nftables" (root), "dry-run" (logs/firewall.nft) or "record"
 CAPTURE_WINDOW = 5  # Seconds
+CAPTURE_TICK = 1  # Sliding table: seconds between emissions (and sub-window bucket size)
+CAPTURE_BUFFERS = 2  # Flow tables in rotation (2 = double-buffered)
+# "dict" / "array" (every flow, every window), "timeout" (flows emitted when they close) or
+# "sliding" (last CAPTURE_WINDOW seconds of each active flow, emitted every CAPTURE_TICK)
+FLOW_TABLE = "sliding"
+FLOW_OPTIONS = {
+    # Persistent table: idle/active timeouts (seconds) and an LRU cap on open flows
+    "timeout": {"idle_timeout": 15, "active_timeout": 120, "max_flows": 500_000},
+    # Persistent table: ring of CAPTURE_WINDOW / CAPTURE_TICK sub-window buckets per flow
+    "sliding": {"window": CAPTURE_WINDOW, "tick": CAPTURE_TICK}
+}
+CAPTURE_BACKEND = "scapy"  # "scapy" (portable) or "raw" (Linux AF_PACKET, no dissection)
+CAPTURE_WORKERS = 1  # >1: flow accounting sharded across processes (live capture uses the raw backend)
+SKETCH_PERIOD = 60  # Seconds per generation of the per-source scan/fan-out sketches (features cover 1-2 periods)
+# Sources opening flows to this many distinct destination ports or hosts in a window are scored as
+# one summed row instead of one row per flow (only with models trained on the source features)
+SOURCE_COLLAPSE_PORTS = COLLAPSE_PORTS
+SOURCE_COLLAPSE_HOSTS = COLLAPSE_HOSTS
+EMIT_INTERVAL = CAPTURE_TICK if FLOW_TABLE == "sliding" else CAPTURE_WINDOW  # Seconds between analyses
+METRICS_PORT = 9108  # Prometheus /metrics (0 = off)
+METRICS_HOST = "127.0.0.1"  # "0.0.0.0" to let a remote Prometheus scrape it
+METRICS_PROFILING = True  # /debug/profile/start?mode=sample|cprofile and /debug/profile/stop on the same port
+# Export mode: ship each window's features to collector.py ("host:port" or "unix:/path") instead of
+# scoring locally; the collector logs the events and sends back the sources to block
+EXPORT_TO = None
+EXPORT_BATCH_ROWS = 65536  # Rows per batch sent to the collector
+EXPORT_FLUSH_SECONDS = 0.5  # Max wait for a small batch to fill
+EXPORT_BUFFER_ROWS = 2_000_000  # Rows kept while the collector is unreachable (oldest dropped beyond)
+EXPORT_COLLAPSE = False  # Collapse scanning sources before export; only if the collector's model has source features
+REPLAY_OUTPUT = os.path.join(LOG_DIR, "replay_scores.csv")
+REPLAY_FLUSH_ROWS = 100000  # Scored flows buffered per bulk write in replay mode
 
 # --- LOGGING SETUP ---
 # Ensure log directory exists
@@ -27,88 +78,321 @@ logging.basicConfig(
 )
 logger = logging.getLogger("0xGuard")
 
+# --- METRICS ---
+WINDOW_ANOMALIES = metrics.histogram("oxguard_window_anomalies", "Anomalous flows per analysis window",
+                                     buckets=metrics.SIZE_BUCKETS)
+ANOMALIES = metrics.counter("oxguard_anomalies_total", "Flows scored as anomalous")
+VERDICTS = metrics.counter("oxguard_verdicts_total", "Per-source verdicts by action", ["action"])
+
+def collapse_thresholds(n_features):
+    """(ports, hosts) for collapse_sources; None (one row per flow) for models without the source features."""
+    if n_features > len(FEATURE_COLUMNS):
+        return SOURCE_COLLAPSE_PORTS, SOURCE_COLLAPSE_HOSTS
+    return None, None
+
 class NIDS:
     """
     Network Intrusion Detection System (NIDS) v2.0
     Uses Isolation Forest (Unsupervised Learning) to detect zero-day anomalies.
     """
 
-    def __init__(self):
-        self._load_model()
-        self.extractor = FlowExtractor()
-        self.responder = ResponseManager()
-        self._init_csv_logger()
+    def __init__(self, backend=CAPTURE_BACKEND, iface=None, workers=CAPTURE_WORKERS, metrics_port=METRICS_PORT,
+                 export=EXPORT_TO, sensor=None):
+        self.models = None
+        if export is None:
+            self._load_model()  # Export mode scores on the collector
+        self.workers = workers
+        self.sketches = SourceSketches(SKETCH_PERIOD)  # Fixed memory, however many sources
+        # Sliding tables re-emit active flows every tick: act on each source once per window
+        self.verdicts = VerdictFilter(CAPTURE_WINDOW) if EMIT_INTERVAL < CAPTURE_WINDOW and workers == 1 else None
+        if workers > 1:
+            if backend != "raw":
+                logger.info("Sharded capture uses the raw backend (PACKET_FANOUT)")
+            if FLOW_TABLES[FLOW_TABLE].persistent:
+                logger.info("Sharded capture emits tumbling windows (persistent flow tables are single-process)")
+            self.engine = ShardedCaptureEngine(self.analyze_traffic, workers=workers,
+                                               window=CAPTURE_WINDOW, iface=iface)
+        else:
+            self.engine = CaptureEngine(self.analyze_traffic, window=EMIT_INTERVAL,
+                                        buffers=CAPTURE_BUFFERS, flow_table=FLOW_TABLE,
+                                        flow_options=FLOW_OPTIONS.get(FLOW_TABLE),
+                                        backend=backend, iface=iface)
+        self.responder = ResponseManager(notifier=NOTIFIERS[RESPONSE_NOTIFIER](),
+                                         firewall=FIREWALLS[RESPONSE_FIREWALL]())
+        self.events = EventSink(EVENT_DB, csv_path=LOG_FILE if EVENT_CSV else None,
+                                queue_size=EVENT_QUEUE_SIZE, flush_interval=EVENT_FLUSH_SECONDS,
+                                rotate_bytes=EVENT_ROTATE_MB << 20, rotate_seconds=EVENT_ROTATE_HOURS * 3600)
+        self.exporter = FlowExporter(export, sensor, max_batch_rows=EXPORT_BATCH_ROWS,
+                                     flush_interval=EXPORT_FLUSH_SECONDS, max_buffer_rows=EXPORT_BUFFER_ROWS,
+                                     on_block=self.responder.block_ip) if export else None
+        self.metrics = metrics.MetricsServer(metrics_port, METRICS_HOST, profiling=METRICS_PROFILING) \
+            if metrics_port else None
+        self._register_metrics()
+
+    def _register_metrics(self):
+        """Scrape-time views of the components' own counters."""
+        if hasattr(self.engine, "open_flows"):
+            metrics.gauge("oxguard_flow_table_flows", "Flows in the capture flow table").set_function(
+                self.engine.open_flows)
+        metrics.gauge("oxguard_analysis_queue_depth", "Windows waiting for analysis").set_function(
+            self.engine.queue_depth)
+        metrics.gauge("oxguard_event_queue_depth", "Security events waiting to be written").set_function(
+            lambda: len(self.events))
+        metrics.counter("oxguard_events_written_total", "Security events written").set_function(
+            lambda: self.events.written)
+        metrics.counter("oxguard_events_dropped_total", "Security events dropped (queue full)").set_function(
+            lambda: self.events.dropped)
+        metrics.counter("oxguard_blocked_ips_total", "IPs blocked by the response manager").set_function(
+            lambda: self.responder.blocked)
+        metrics.counter("oxguard_block_failures_total", "Firewall blocks that failed (retried)").set_function(
+            lambda: self.responder.block_failures)
+        if self.verdicts is not None:
+            metrics.counter("oxguard_verdicts_suppressed_total",
+                            "Repeat source verdicts dropped within a window").set_function(
+                lambda: self.verdicts.suppressed)
+        if self.models is not None:
+            metrics.gauge("oxguard_model_loaded_timestamp_seconds", "When the active model went live").set_function(
+                lambda: self.models.loaded_at)
+        if self.exporter is not None:
+            exporter = self.exporter
+            metrics.gauge("oxguard_export_connected", "1 while connected to the collector").set_function(
+                lambda: int(exporter.connected))
+            metrics.gauge("oxguard_export_buffered_rows", "Flows not yet acknowledged by the collector").set_function(
+                lambda: len(exporter))
+            metrics.counter("oxguard_export_acked_rows_total", "Flows acknowledged by the collector").set_function(
+                lambda: exporter.acked_rows)
+            metrics.counter("oxguard_export_dropped_rows_total", "Flows dropped (export buffer full)").set_function(
+                lambda: exporter.dropped_rows)
+            metrics.counter("oxguard_export_wire_bytes_total", "Bytes sent to the collector").set_function(
+                lambda: exporter.sent_bytes)
+            metrics.counter("oxguard_export_reconnects_total", "Reconnections to the collector").set_function(
+                lambda: exporter.reconnects)
 
     def _load_model(self):
-        """Loads the pre-trained Isolation Forest model."""
-        if not os.path.exists(MODEL_PATH):
-            logger.critical(f"Model not found at {MODEL_PATH}. Run tools/train_model.py first.")
+        """Loads the pre-trained Isolation Forest model (hot-reloaded while running)."""
+        self.models = ModelRegistry(MODEL_ARTIFACT, MODEL_PATH, poll_interval=MODEL_POLL_SECONDS)
+        try:
+            self.models.load()
+        except FileNotFoundError:
+            logger.critical(f"Model not found at {MODEL_ARTIFACT} or {MODEL_PATH}. Run tools/train_model.py first.")
             exit(1)
-        self.clf = joblib.load(MODEL_PATH)
-        logger.info(f"Model loaded successfully from {MODEL_PATH}")
-
-    def _init_csv_logger(self):
-        """Initializes the CSV audit log for the dashboard."""
-        if not os.path.exists(LOG_FILE):
-            with open(LOG_FILE, "w") as f:
-                f.write("Timestamp,Source_IP,Risk_Level,Action,Protocol,Anomaly_Score\n")
 
     def _log_threat(self, ip, risk, action, protocol, score):
-        """Writes threat details to the persistent CSV log."""
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        with open(LOG_FILE, "a") as f:
-            f.write(f"{timestamp},{ip},{risk},{action},{protocol},{score:.4f}\n")
+        """Queues a threat for the security event log (written off the detection thread)."""
+        self.events.emit(ip, risk, action, protocol, score)
 
-    def analyze_traffic(self):
-        """Main loop: Captures, Features Extracts, Predicts, and Responds."""
-        # 1. Capture Traffic
-        # logger.info(f"Capturing traffic for {CAPTURE_WINDOW}s...")
-        sniff(timeout=CAPTURE_WINDOW, prn=self.extractor.process_packet, store=0)
+    def analyze_traffic(self, df, flow_keys, stats):
+        """Analysis worker: Predicts and Responds on one closed capture window.
 
-        # 2. Extract Features
-        df, _ = self.extractor.extract_features()
+        Capture keeps running on its own thread while this executes; see
+        CaptureEngine for the window hand-off.
+        """
+        logger.debug(f"Window {stats.window_id}: {stats.packets} packets, {stats.flows} flows, "
+                     f"queue depth {stats.queue_depth}, dropped {stats.dropped_packets} "
+                     f"(total {stats.total_dropped})")
 
         if df.empty:
             return
 
-        # 3. Inference
-        feature_cols = ["Dst_Port", "Protocol", "Flow_Packets", "Flow_Bytes", 
-                        "Flow_Duration", "Packet_Rate", "Byte_Rate", "TCP_Flags_Sum"]
-        
+        # 3. Inference (source features are added for models trained with them)
         try:
-            predictions = self.clf.predict(df[feature_cols])
-            scores = self.clf.decision_function(df[feature_cols])
+            if self.exporter is not None:
+                model = None
+                n_features = len(EXPORT_FEATURES) if EXPORT_COLLAPSE else len(FEATURE_COLUMNS)
+            else:
+                model = self.models.current
+                n_features = model.n_features
+            with metrics.stage("sketch"):
+                flow_keys = self.sketches.annotate(df, flow_keys, stats.closed)
+                df, flow_keys = collapse_sources(df, flow_keys, *collapse_thresholds(n_features))
+            if model is None:
+                # Export mode: the collector scores, logs and answers with blocks
+                with metrics.stage("export"):
+                    self.exporter.export(stats.closed, df[EXPORT_COLUMNS].to_numpy(dtype=np.float32), flow_keys)
+                return
+            with metrics.stage("predict"):
+                scores, predictions = model.score(df[model_columns(model.n_features)])
+            metrics.INFERENCE_ROWS.observe(len(df))
         except Exception as e:
             logger.error(f"Inference error: {e}")
             return
+        anomalies = int((predictions == -1).sum())
+        WINDOW_ANOMALIES.observe(anomalies)
+        ANOMALIES.inc(anomalies)
 
-        # 4. Response Logic
-        for i, result in enumerate(predictions):
-            if result == -1:  # Anomaly Detected
-                ip_src = "192.168.0.195"  # (Note: In live deploy, extract from packet metadata)
-                score = scores[i]
-                protocol = df.iloc[i]["Protocol"]
+        # 4. Response Logic: one verdict per offending source IP
+        with metrics.stage("respond"):
+            for verdict in source_verdicts(flow_keys, scores, predictions, df["Source_Flows"], df["Source_Ports"]):
+                ip_src, score = verdict.source_ip, verdict.worst_score
+                action = "BLOCKED" if score < 0.00 else "ALERT" if score < -0.05 else "LOGGED"
+                if self.verdicts is not None and not self.verdicts.admit(ip_src, action, stats.closed):
+                    continue  # Already acted on in this window
 
-                if score < 0.00:
-                    logger.warning(f"BLOCKING MALICIOUS TRAFFIC: {ip_src} (Score: {score:.3f})")
+                if action == "BLOCKED":
+                    logger.warning(f"BLOCKING MALICIOUS TRAFFIC: {ip_src} (Score: {score:.3f}, "
+                                   f"{verdict.flows} flows, {verdict.ports} ports)")
                     self.responder.block_ip(ip_src)
-                    self._log_threat(ip_src, "CRITICAL", "BLOCKED", protocol, score)
-                
-                elif score < -0.05:
+                    self._log_threat(ip_src, "CRITICAL", "BLOCKED", verdict.protocol, score)
+
+                elif action == "ALERT":
                     logger.info(f"Suspicious Activity Detected: {ip_src}")
-                    self._log_threat(ip_src, "HIGH", "ALERT", protocol, score)
-                
+                    self._log_threat(ip_src, "HIGH", "ALERT", verdict.protocol, score)
+
                 else:
                     # Low confidence anomalies are logged but not printed to console to reduce noise
-                    self._log_threat(ip_src, "MEDIUM", "LOGGED", protocol, score)
+                    self._log_threat(ip_src, "MEDIUM", "LOGGED", verdict.protocol, score)
+                VERDICTS.inc(action=action)
+
+    def replay(self, pcap_path, out_path=REPLAY_OUTPUT):
+        """Forensic mode: re-scores a capture file window by window.
+
+        Windows follow packet timestamps, so results are reproducible and
+        independent of how fast the file is read. No response actions run.
+        """
+        import pandas as pd  # Bulk CSV output
+        clf = self.models.current  # Pinned for the whole replay
+        columns = model_columns(clf.n_features)
+        sketches = SourceSketches(SKETCH_PERIOD)
+        logger.info(f"Replaying with model {clf.version}")
+        if self.workers > 1:
+            interval = CAPTURE_WINDOW
+            windows = sharded_replay_windows(pcap_path, interval, self.workers)
+        else:
+            interval = EMIT_INTERVAL
+            windows = replay_windows(pcap_path, FLOW_TABLES[FLOW_TABLE](**FLOW_OPTIONS.get(FLOW_TABLE, {})),
+                                     interval)
+        pending = []
+        pending_rows = 0
+        header = True
+        total_packets = total_anomalies = total_rows = 0
+        # Packed flow keys seen so far: sliding tables re-emit active flows every tick,
+        # so flows are counted by distinct key, not by emitted row
+        seen_keys, unmerged_rows = [], 0
+        first_ts = last_ts = None
+        started = time.perf_counter()
+
+        def flush():
+            nonlocal pending, pending_rows, header
+            if pending:
+                pd.concat(pending, ignore_index=True).to_csv(out_path, mode="w" if header else "a",
+                                                              header=header, index=False)
+                header = False
+            pending, pending_rows = [], 0
+
+        def distinct_keys():
+            nonlocal seen_keys, unmerged_rows
+            if len(seen_keys) > 1:
+                seen_keys = [np.unique(np.concatenate(seen_keys), axis=0)]
+            unmerged_rows = 0
+            return len(seen_keys[0]) if seen_keys else 0
+
+        for window_start, packets, df, flow_keys in windows:
+            total_packets += packets
+            first_ts = window_start if first_ts is None else first_ts
+            last_ts = window_start + interval
+            if df.empty:
+                continue  # Persistent table: no flow closed in this window
+            with metrics.stage("sketch"):
+                flow_keys = sketches.annotate(df, flow_keys, window_start + interval)
+                seen_keys.append(np.stack([flow_keys.src.astype(np.uint64) << 32 | flow_keys.dst,
+                                           flow_keys.dst_port.astype(np.uint64) << 8 | flow_keys.proto], axis=1))
+                unmerged_rows += len(flow_keys)
+                if unmerged_rows >= max(REPLAY_FLUSH_ROWS, len(seen_keys[0])):
+                    distinct_keys()  # Amortized: the merged set at most doubles between merges
+                df, flow_keys = collapse_sources(df, flow_keys, *collapse_thresholds(clf.n_features))
+            with metrics.stage("predict"):
+                scores, labels = clf.score(df[columns])
+            metrics.INFERENCE_ROWS.observe(len(df))
+            df.insert(0, "Window_Start", datetime.fromtimestamp(window_start).strftime("%Y-%m-%d %H:%M:%S"))
+            keys = list(flow_keys)
+            df.insert(1, "Source_IP", [key[0] for key in keys])
+            df.insert(2, "Dest_IP", [key[1] for key in keys])
+            df["Anomaly_Score"] = scores
+            df["Prediction"] = labels
+
+            pending.append(df)
+            pending_rows += len(df)
+            if pending_rows >= REPLAY_FLUSH_ROWS:
+                with metrics.stage("output"):
+                    flush()
+
+            total_rows += len(df)
+            total_anomalies += int((labels == -1).sum())
+        with metrics.stage("output"):
+            flush()
+
+        elapsed = time.perf_counter() - started
+        stages = metrics.STAGE_SECONDS.totals("stage")
+        logger.info("Stage time: " + ", ".join(f"{name} {seconds:.2f}s" for name, seconds in stages.items())
+                    + f", read/parse/account {elapsed - sum(stages.values()):.2f}s")
+        total_flows = distinct_keys()
+        logger.info(f"Replayed {total_packets} packets / {total_flows} distinct flows in {elapsed:.2f}s "
+                    f"({total_packets / max(elapsed, 1e-9):,.0f} packets/sec)")
+        top = ", ".join(f"{ip} ({packets:,})" for ip, packets in sketches.heavy_hitters(5))
+        if top:
+            logger.info(f"Heaviest sources (packets, last {SKETCH_PERIOD}-{2 * SKETCH_PERIOD}s): {top}")
+        if first_ts is not None:
+            logger.info(f"Capture span {last_ts - first_ts:.0f}s -> "
+                        f"{(last_ts - first_ts) / max(elapsed, 1e-9):,.1f}x real time; "
+                        f"{total_rows} scored rows ({total_anomalies} anomalous) written to {out_path}")
+
+    def run(self):
+        """Starts continuous capture and blocks until interrupted."""
+        if self.metrics is not None:
+            self.metrics.start()
+        # Capture comes up first; pandas (needed from the first window) loads alongside it
+        threading.Thread(target=importlib.import_module, args=("pandas",), name="0xguard-preload",
+                         daemon=True).start()
+        self.events.start()
+        self.responder.start()
+        if self.models is not None:
+            self.models.start()
+        if self.exporter is not None:
+            self.exporter.start()
+        self.engine.start()
+        try:
+            self.engine.wait()
+        finally:
+            self.engine.stop()  # Scores the last window before the log closes
+            if self.exporter is not None:
+                self.exporter.close()  # Ships the last windows; blocks in their ACKs still apply
+            if self.models is not None:
+                self.models.stop()
+            self.responder.stop()
+            self.events.close()
+            if self.metrics is not None:
+                self.metrics.stop()
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="0xGuard real-time protection agent")
+    parser.add_argument("--backend", choices=["scapy", "raw"], default=CAPTURE_BACKEND,
+                        help="Packet capture backend")
+    parser.add_argument("--iface", default=None, help="Interface to monitor (default: all)")
+    parser.add_argument("--pcap", default=None, help="Re-score a pcap/pcapng file instead of live traffic")
+    parser.add_argument("--out", default=REPLAY_OUTPUT, help="Scored flows output for --pcap")
+    parser.add_argument("--workers", type=int, default=CAPTURE_WORKERS,
+                        help="Capture/replay worker processes (flows sharded by address hash)")
+    parser.add_argument("--metrics-port", type=int, default=METRICS_PORT,
+                        help="Port for the Prometheus /metrics endpoint (0 = off)")
+    parser.add_argument("--export", default=EXPORT_TO, metavar="ADDRESS",
+                        help="Send windows to a collector (host:port or unix:/path) instead of scoring locally")
+    parser.add_argument("--sensor", default=None, help="Sensor name reported to the collector (default: hostname)")
+    args = parser.parse_args()
+    if args.pcap and args.export:
+        parser.error("--pcap replays score locally; drop --export")
+
     logger.info("Initializing 0xGuard Autonomous Agent...")
-    guard = NIDS()
+    guard = NIDS(backend=args.backend, iface=args.iface, workers=args.workers, metrics_port=args.metrics_port,
+                 export=args.export, sensor=args.sensor)
+    if args.pcap:
+        guard.replay(args.pcap, args.out)
+        raise SystemExit(0)
+
+    if args.export:
+        logger.info(f"Export mode: windows are scored by the collector at {args.export}")
     logger.info("Monitoring Active. Press Ctrl+C to stop.")
     
     try:
-        while True:
-            guard.analyze_traffic()
+        guard.run()
     except KeyboardInterrupt:
         logger.info("Shutting down agent.")
\ No newline at end of file
@@ -0,0 +1,184 @@
+import logging
+import mmap
+import select
+import socket
+import struct
+import threading
+import time
+from src.feature_extractor import load_scapy_layers
+
+logger = logging.getLogger("0xGuard")
+
+# Capture backends feed a "sink": any object with process_packet(packet)
+# for dissected Scapy packets and process_frames(frames) for batches of
+# raw (frame, timestamp, length) tuples. FlowExtractor and CaptureEngine
+# are both sinks.
+
+# --- LINUX AF_PACKET CONSTANTS ---
+ETH_P_ALL = 0x0003
+SOL_PACKET = 263
+PACKET_RX_RING = 5
+PACKET_VERSION = 10
+TPACKET_V3 = 2
+TP_STATUS_KERNEL = 0
+TP_STATUS_USER = 1
+PACKET_FANOUT = 18
+PACKET_FANOUT_HASH = 0
+PACKET_FANOUT_FLAG_DEFRAG = 0x8000
+
+_TPACKET_REQ3 = struct.Struct("7I")
+# tpacket_block_desc: num_pkts, offset_to_first_pkt (inside bh1)
+_BLOCK_HDR = struct.Struct("12xII")
+# tpacket3_hdr: next_offset, sec, nsec, snaplen, len, status, mac
+_FRAME_HDR = struct.Struct("IIIIIIH")
+
+
+class ScapyCapture:
+    """Portable backend: Scapy's AsyncSniffer with full packet dissection."""
+
+    def __init__(self, iface=None):
+        self.iface = iface
+        self._sniffer = None
+
+    def start(self, sink):
+        # Only the sniffer and the IPv4 dissectors, not scapy.all (several times slower to import)
+        from scapy.sendrecv import AsyncSniffer
+        load_scapy_layers()
+        self._sniffer = AsyncSniffer(prn=sink.process_packet, store=False, iface=self.iface)
+        self._sniffer.start()
+
+    def stop(self):
+        if self._sniffer is not None and self._sniffer.running:
+            self._sniffer.stop()
+
+
+class RawSocketCapture:
+    """
+    Linux-only backend: reads raw frames from an AF_PACKET socket and hands
+    them to the sink in batches, without building Scapy objects.
+
+    Uses a TPACKET_V3 memory-mapped receive ring, so each wakeup delivers a
+    whole block of frames; falls back to recv() batching if the ring cannot
+    be set up.
+
+    With fanout_group set, the socket joins a PACKET_FANOUT group in hash
+    mode: the kernel spreads packets over every socket in the group by
+    flow hash, so several processes can each capture a share of the
+    traffic (see sharded_capture.py).
+    """
+
+    def __init__(self, iface=None, block_size=1 << 20, block_count=16,
+                 frame_size=1 << 11, block_timeout_ms=50, batch_size=256, fanout_group=None):
+        self.iface = iface
+        self.fanout_group = fanout_group
+        self.block_size = block_size
+        self.block_count = block_count
+        self.frame_size = frame_size
+        self.block_timeout_ms = block_timeout_ms
+        self.batch_size = batch_size
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self, sink):
+        sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, socket.htons(ETH_P_ALL))
+        if self.iface:
+            sock.bind((self.iface, ETH_P_ALL))
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(sock, sink),
+                                        name="0xguard-capture", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self, sock, sink):
+        try:
+            try:
+                ring = self._setup_ring(sock)
+            except OSError as e:
+                logger.warning(f"PACKET_RX_RING unavailable ({e}); using recv() batching")
+                self._join_fanout(sock)
+                self._recv_loop(sock, sink)
+            else:
+                self._join_fanout(sock)
+                try:
+                    self._ring_loop(sock, ring, sink)
+                finally:
+                    ring.close()
+        finally:
+            sock.close()
+
+    def _join_fanout(self, sock):
+        if self.fanout_group is not None:
+            mode = PACKET_FANOUT_HASH | PACKET_FANOUT_FLAG_DEFRAG
+            sock.setsockopt(SOL_PACKET, PACKET_FANOUT, struct.pack("I", (self.fanout_group & 0xFFFF) | (mode << 16)))
+
+    # --- TPACKET_V3 RING ---
+    def _setup_ring(self, sock):
+        sock.setsockopt(SOL_PACKET, PACKET_VERSION, TPACKET_V3)
+        frame_nr = (self.block_size // self.frame_size) * self.block_count
+        req = _TPACKET_REQ3.pack(self.block_size, self.block_count, self.frame_size,
+                                 frame_nr, self.block_timeout_ms, 0, 0)
+        sock.setsockopt(SOL_PACKET, PACKET_RX_RING, req)
+        return mmap.mmap(sock.fileno(), self.block_size * self.block_count,
+                         mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+
+    def _ring_loop(self, sock, ring, sink):
+        poller = select.poll()
+        poller.register(sock, select.POLLIN | select.POLLERR)
+        view = memoryview(ring)
+        block = 0
+        try:
+            while not self._stop.is_set():
+                base = block * self.block_size
+                status = struct.unpack_from("I", ring, base + 8)[0]
+                if not status & TP_STATUS_USER:
+                    poller.poll(100)
+                    continue
+
+                num_pkts, offset = _BLOCK_HDR.unpack_from(ring, base)
+                frames = []
+                for _ in range(num_pkts):
+                    pos = base + offset
+                    next_offset, sec, nsec, snaplen, _, _, mac = _FRAME_HDR.unpack_from(ring, pos)
+                    start = pos + mac
+                    frames.append((view[start:start + snaplen], sec + nsec * 1e-9, snaplen))
+                    offset += next_offset
+                sink.process_frames(frames)
+
+                # The frames are views into the ring: drop them before the
+                # block goes back to the kernel.
+                for frame, _, _ in frames:
+                    frame.release()
+                struct.pack_into("I", ring, base + 8, TP_STATUS_KERNEL)
+                block = (block + 1) % self.block_count
+        finally:
+            view.release()
+
+    # --- PLAIN recv() FALLBACK ---
+    def _recv_loop(self, sock, sink):
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.block_size * self.block_count)
+        sock.settimeout(0.1)
+        while not self._stop.is_set():
+            try:
+                frame = sock.recv(65535)
+            except socket.timeout:
+                continue
+            frames = [(frame, time.time(), len(frame))]
+            # Drain whatever else is already queued, up to one batch
+            while len(frames) < self.batch_size:
+                try:
+                    frame = sock.recv(65535, socket.MSG_DONTWAIT)
+                except (BlockingIOError, socket.timeout):
+                    break
+                frames.append((frame, time.time(), len(frame)))
+            sink.process_frames(frames)
+
+
+# Capture backends selectable by name
+CAPTURE_BACKENDS = {
+    "scapy": ScapyCapture,
+    "raw": RawSocketCapture,
+}
@@ -0,0 +1,189 @@
+import logging
+import queue
+import threading
+import time
+from collections import namedtuple
+from src import metrics
+from src.capture_backends import CAPTURE_BACKENDS
+from src.feature_extractor import FLOW_TABLES
+
+logger = logging.getLogger("0xGuard")
+
+WINDOW_PACKETS = metrics.histogram("oxguard_window_packets", "Packets per analysis window", buckets=metrics.SIZE_BUCKETS)
+WINDOW_FLOWS = metrics.histogram("oxguard_window_flows", "Flows handed to analysis per window", buckets=metrics.SIZE_BUCKETS)
+PACKETS = metrics.counter("oxguard_packets_total", "Packets accounted to flows")
+DROPPED = metrics.counter("oxguard_dropped_packets_total", "Packets discarded because analysis fell behind")
+
+# Per-window report handed to the analysis callback alongside the features
+WindowStats = namedtuple("WindowStats", [
+    "window_id", "started", "closed", "packets", "flows",
+    "queue_depth", "dropped_packets", "total_dropped"
+])
+
+
+class CaptureEngine:
+    """
+    Producer/consumer capture pipeline.
+
+    The capture thread never stops sniffing: packets go straight into the
+    active FlowExtractor. At every window boundary the active table is
+    swapped with a free one and the filled table is queued for the
+    analysis worker, so feature extraction, inference and response never
+    block capture. If the worker still holds every spare table when a
+    window closes, that window is discarded and its packets are counted
+    as dropped due to backpressure.
+
+    A persistent flow table ("timeout", "sliding") is never swapped: at
+    each boundary only the flows it emits (closed flows, or the sliding
+    window of the flows updated during the tick) are moved into a spare
+    batch for the worker, and everything else stays in the table.
+    """
+
+    def __init__(self, handler, window=5, buffers=2, iface=None, flow_table="dict", backend="scapy",
+                 flow_options=None):
+        # handler(df, flow_keys, stats) runs on the analysis worker thread
+        self.handler = handler
+        self.window = window
+        self.backend = CAPTURE_BACKENDS[backend](iface=iface)
+
+        extractor_cls = FLOW_TABLES[flow_table]
+        self._persistent = extractor_cls.persistent
+        self._lock = threading.Lock()
+        self._active = extractor_cls(**(flow_options or {}))
+        self._free = queue.Queue()
+        for _ in range(buffers - 1):
+            self._free.put(self._active.new_batch() if self._persistent else extractor_cls())
+        self._pending = queue.Queue()
+
+        self._active_packets = 0
+        self._window_id = 0
+        self._window_start = time.time()
+        self.total_dropped = 0
+        self._unreported_drops = 0
+
+        self._stop = threading.Event()
+        self._rotator = None
+        self._worker = None
+
+    # --- PRODUCER (capture backend sink) ---
+    def process_packet(self, packet):
+        with metrics.stage("capture"), self._lock:
+            self._active.process_packet(packet)
+            self._active_packets += 1
+
+    def process_frames(self, frames):
+        with metrics.stage("capture"), self._lock:
+            self._active.process_frames(frames)
+            self._active_packets += len(frames)
+
+    def _rotate(self, block=False):
+        """Closes the current window and hands its table to the worker."""
+        try:
+            standby = self._free.get(block=block)
+        except queue.Empty:
+            standby = None
+
+        with metrics.stage("rotate"), self._lock:
+            packets = self._active_packets
+            started = self._window_start
+            self._window_start = time.time()
+            self._active_packets = 0
+            self._window_id += 1
+            window_id = self._window_id
+            if self._persistent:
+                # Only the flows emitted at this boundary leave the table
+                closed = self._active.close_into(standby or self._active.new_batch(), self._window_start)
+                flows = len(closed)
+            else:
+                closed = self._active
+                flows = len(closed)
+                if standby is None:
+                    # Backpressure: the worker still owns every spare table.
+                    # Keep capturing into the same table but drop its contents.
+                    closed.reset()
+                else:
+                    self._active = standby
+
+        PACKETS.inc(packets)
+        if standby is None:
+            self._unreported_drops += packets
+            self.total_dropped += packets
+            DROPPED.inc(packets)
+            logger.warning(f"Analysis backlog: dropped window {window_id} "
+                           f"({packets} packets, {flows} flows)")
+            return
+
+        stats = WindowStats(
+            window_id=window_id,
+            started=started,
+            closed=self._window_start,
+            packets=packets,
+            flows=flows,
+            queue_depth=self._pending.qsize(),
+            dropped_packets=self._unreported_drops,
+            total_dropped=self.total_dropped
+        )
+        self._unreported_drops = 0
+        WINDOW_PACKETS.observe(packets)
+        WINDOW_FLOWS.observe(flows)
+        self._pending.put((closed, stats))
+
+    def _rotate_loop(self):
+        deadline = time.monotonic() + self.window
+        while not self._stop.wait(max(0.0, deadline - time.monotonic())):
+            self._rotate()
+            deadline += self.window
+
+    # --- CONSUMER ---
+    def _work_loop(self):
+        while True:
+            item = self._pending.get()
+            if item is None:
+                return
+            extractor, stats = item
+            try:
+                with metrics.stage("extract"):
+                    df, flow_keys = extractor.extract_features()
+                self.handler(df, flow_keys, stats)
+            except Exception as e:
+                logger.error(f"Analysis error in window {stats.window_id}: {e}")
+            finally:
+                extractor.reset()
+                self._free.put(extractor)
+
+    # --- REPORTING ---
+    def open_flows(self):
+        """Flows in the capture table right now."""
+        return len(self._active)
+
+    def queue_depth(self):
+        """Closed windows waiting for the analysis worker."""
+        return self._pending.qsize()
+
+    # --- LIFECYCLE ---
+    def start(self):
+        self._stop.clear()
+        self._window_start = time.time()
+        self._worker = threading.Thread(target=self._work_loop, name="0xguard-analysis", daemon=True)
+        self._worker.start()
+        self.backend.start(self)
+        self._rotator = threading.Thread(target=self._rotate_loop, name="0xguard-rotate", daemon=True)
+        self._rotator.start()
+
+    def stop(self):
+        """Stops capture, flushes the partial window and drains the worker."""
+        self._stop.set()
+        self.backend.stop()
+        if self._rotator is not None:
+            self._rotator.join()
+            with self._lock:
+                self._active.flush()
+            self._rotate(block=True)
+        self._pending.put(None)
+        if self._worker is not None:
+            self._worker.join()
+
+    def wait(self):
+        """Blocks the calling thread until stop() is called."""
+        while not self._stop.wait(1.0):
+            pass
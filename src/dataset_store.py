@@ -0,0 +1,127 @@
+import json
+import os
+import shutil
+import numpy as np
+import pandas as pd
+
+# Partitioned, typed training datasets.
+#
+# A dataset is a directory of partitions plus manifest.json (column types,
+# rows per partition, label counts). In the default "npy" format every
+# partition is a directory with one .npy file per column; columns are
+# memory-mapped on read, so a reader only pages in the partitions and
+# columns it touches. The "parquet" format writes one part-NNNNN.parquet
+# per partition instead (needs pyarrow).
+
+MANIFEST = "manifest.json"
+FORMATS = ("npy", "parquet")
+
+# Column -> little-endian NumPy type
+COLUMN_TYPES = {
+    "Dst_Port": "<i8",
+    "Protocol": "<i8",
+    "Flow_Packets": "<i8",
+    "Flow_Bytes": "<i8",
+    "Flow_Duration": "<f8",
+    "Packet_Rate": "<f8",
+    "Byte_Rate": "<f8",
+    "TCP_Flags_Sum": "<i8",
+    "Src_Distinct_Ports": "<i8",  # Per-source context (src/sketches.py)
+    "Src_Distinct_Hosts": "<i8",
+    "Src_Packets": "<i8",
+    "Label": "<i1"  # 1 = Normal, -1 = Attack
+}
+RECORD = np.dtype(list(COLUMN_TYPES.items()))
+
+
+class DatasetWriter:
+    """
+    Writes record arrays (RECORD dtype) as partitions, one per write().
+    Everything goes to `<path>.tmp` and replaces `path` on close(), so
+    readers never see a half-written dataset.
+    """
+
+    def __init__(self, path, fmt="npy", **info):
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown dataset format {fmt!r} (choose from {', '.join(FORMATS)})")
+        self.path = path
+        self.format = fmt
+        self.info = info  # Extra manifest fields (seed, inputs, ...)
+        self.partitions = []
+        self.labels = {}
+        self._tmp = f"{path}.tmp"
+        shutil.rmtree(self._tmp, ignore_errors=True)
+        os.makedirs(self._tmp)
+
+    def write(self, records):
+        name = f"part-{len(self.partitions):05d}"
+        if self.format == "npy":
+            os.makedirs(os.path.join(self._tmp, name))
+            for column in RECORD.names:
+                np.save(os.path.join(self._tmp, name, f"{column}.npy"), np.ascontiguousarray(records[column]))
+        else:
+            name += ".parquet"
+            pd.DataFrame({column: records[column] for column in RECORD.names}).to_parquet(
+                os.path.join(self._tmp, name), index=False)
+        self.partitions.append({"name": name, "rows": int(len(records))})
+        values, counts = np.unique(records["Label"], return_counts=True)
+        for value, count in zip(values.tolist(), counts.tolist()):
+            self.labels[str(value)] = self.labels.get(str(value), 0) + count
+
+    def close(self):
+        manifest = {
+            "format": self.format,
+            "columns": COLUMN_TYPES,
+            "rows": sum(part["rows"] for part in self.partitions),
+            "labels": self.labels,
+            "partitions": self.partitions,
+            **self.info
+        }
+        with open(os.path.join(self._tmp, MANIFEST), "w") as f:
+            json.dump(manifest, f, indent=1)
+        shutil.rmtree(self.path, ignore_errors=True)
+        os.replace(self._tmp, self.path)
+        return manifest
+
+
+class Dataset:
+    """Lazy reader for a dataset directory written by DatasetWriter."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, MANIFEST)) as f:
+            self.manifest = json.load(f)
+        self.format = self.manifest["format"]
+        self.columns = self.manifest["columns"]
+
+    def __len__(self):
+        return self.manifest["rows"]
+
+    def partitions(self, columns):
+        """Yields {column: array} per partition (memory-mapped for npy)."""
+        for part in self.manifest["partitions"]:
+            location = os.path.join(self.path, part["name"])
+            if self.format == "npy":
+                yield {column: np.load(os.path.join(location, f"{column}.npy"), mmap_mode="r")
+                       for column in columns}
+            else:
+                df = pd.read_parquet(location, columns=list(columns))
+                yield {column: df[column].to_numpy() for column in columns}
+
+    def read(self, columns, rows=None):
+        """
+        The first `rows` rows (all by default) of the given columns, one
+        array per column. Only the partitions needed are opened.
+        """
+        n = len(self) if rows is None else min(rows, len(self))
+        out = {column: np.empty(n, dtype=self.columns[column]) for column in columns}
+        filled = 0
+        for part in self.partitions(columns):
+            if filled == n:
+                break
+            size = len(part[columns[0]])
+            take = min(n - filled, size)
+            for column in columns:
+                out[column][filled:filled + take] = part[column][:take]
+            filled += take
+        return out
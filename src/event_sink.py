@@ -0,0 +1,254 @@
+import glob
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from contextlib import closing
+from datetime import datetime
+
+logger = logging.getLogger("0xGuard")
+
+EVENT_COLUMNS = ["Timestamp", "Source_IP", "Risk_Level", "Action", "Protocol", "Anomaly_Score"]
+CSV_HEADER = ",".join(EVENT_COLUMNS) + "\n"
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS events ("
+    "ts REAL NOT NULL, source_ip TEXT NOT NULL, risk TEXT, action TEXT, protocol INTEGER, score REAL)",
+    "CREATE INDEX IF NOT EXISTS idx_events_ts ON events (ts)",
+    "CREATE INDEX IF NOT EXISTS idx_events_src_ts ON events (source_ip, ts)"
+)
+_INSERT = "INSERT INTO events VALUES (?, ?, ?, ?, ?, ?)"
+
+
+def _rotated_path(path, started):
+    """logs/security_events.db -> logs/security_events-20240101-120000.db"""
+    base, ext = os.path.splitext(path)
+    stamp = datetime.fromtimestamp(started).strftime("%Y%m%d-%H%M%S")
+    target = f"{base}-{stamp}{ext}"
+    n = 1
+    while os.path.exists(target):
+        target = f"{base}-{stamp}.{n}{ext}"
+        n += 1
+    return target
+
+
+class EventSink:
+    """
+    Buffered security event log.
+
+    The detection thread only calls emit(), which puts a row on a bounded
+    queue (rows are counted as dropped when it is full). A writer thread
+    drains the queue every flush_interval seconds, or sooner once
+    flush_rows are waiting, and writes each batch in one SQLite
+    transaction, indexed by time and by source IP. The same batch can also
+    be appended to a CSV file in the dashboard's format.
+
+    Both files rotate to a timestamped name once they pass rotate_bytes or
+    rotate_seconds; query() searches the active and rotated databases.
+    """
+
+    def __init__(self, db_path, csv_path=None, queue_size=100000, flush_interval=1.0,
+                 flush_rows=5000, rotate_bytes=64 << 20, rotate_seconds=24 * 3600):
+        self.db_path = db_path
+        self.csv_path = csv_path
+        self.flush_interval = flush_interval
+        self.flush_rows = flush_rows
+        self.rotate_bytes = rotate_bytes
+        self.rotate_seconds = rotate_seconds
+
+        self.queue_size = queue_size
+        self._queue = deque()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._db = None
+        self._db_started = None
+        self._csv = None
+        self._csv_started = None
+
+        # Counters for reporting
+        self.written = 0
+        self.dropped = 0
+        self._reported_drops = 0
+
+    def __len__(self):
+        """Events queued and not yet written."""
+        return len(self._queue)
+
+    # --- HOT PATH ---
+    def emit(self, ip, risk, action, protocol, score, timestamp=None):
+        """Queues one event without blocking. Returns False if it was dropped."""
+        row = (time.time() if timestamp is None else timestamp, ip, risk, action, int(protocol), float(score))
+        if len(self._queue) >= self.queue_size:
+            self.dropped += 1
+            return False
+        self._queue.append(row)  # deque append/popleft are thread-safe
+        if len(self._queue) >= self.flush_rows:
+            self._wake.set()
+        return True
+
+    # --- LIFECYCLE ---
+    def start(self):
+        """Starts the writer thread."""
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="0xguard-events", daemon=True)
+        self._thread.start()
+
+    def close(self):
+        """Flushes everything still queued and closes the files."""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    # --- WRITER ---
+    def _run(self):
+        self._open_db()
+        self._open_csv()
+        try:
+            while True:
+                self._wake.wait(self.flush_interval)
+                self._wake.clear()
+                stopping = self._stop.is_set()
+                self._flush()
+                self._maybe_rotate()
+                if stopping:
+                    break
+        finally:
+            self._close_files()
+
+    def _flush(self):
+        while True:
+            batch = [self._queue.popleft() for _ in range(min(len(self._queue), self.flush_rows))]
+            if not batch:
+                break
+            try:
+                self._write(batch)
+            except Exception as e:
+                logger.error(f"Event log write failed ({len(batch)} events lost): {e}")
+
+        if self.dropped != self._reported_drops:
+            logger.warning(f"Event queue full: {self.dropped - self._reported_drops} events dropped")
+            self._reported_drops = self.dropped
+
+    def _write(self, batch):
+        with self._db:  # One transaction per batch
+            self._db.executemany(_INSERT, batch)
+        if self._csv is not None:
+            self._csv.write("".join(
+                f"{datetime.fromtimestamp(ts).strftime('%Y-%m-%d %H:%M:%S')},{ip},{risk},{action},{proto},{score:.4f}\n"
+                for ts, ip, risk, action, proto, score in batch
+            ))
+            self._csv.flush()
+        self.written += len(batch)
+
+    # --- FILES & ROTATION ---
+    def _open_db(self):
+        self._db = sqlite3.connect(self.db_path)
+        self._db.execute("PRAGMA journal_mode=WAL")  # Readers don't block the writer
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        for statement in _SCHEMA:
+            self._db.execute(statement)
+        first = self._db.execute("SELECT MIN(ts) FROM events").fetchone()[0]
+        self._db_started = first if first is not None else time.time()
+
+    def _open_csv(self):
+        if self.csv_path is None:
+            return
+        self._csv_started = time.time()
+        if os.path.exists(self.csv_path):
+            # Age of an existing log is taken from its first event
+            with open(self.csv_path) as f:
+                f.readline()
+                first = f.readline().split(",", 1)[0]
+            try:
+                self._csv_started = datetime.strptime(first, "%Y-%m-%d %H:%M:%S").timestamp()
+            except ValueError:
+                pass
+        self._csv = open(self.csv_path, "a")
+        if self._csv.tell() == 0:
+            self._csv.write(CSV_HEADER)
+            self._csv.flush()
+
+    def _due(self, path, started):
+        return (os.path.getsize(path) >= self.rotate_bytes
+                or time.time() - started >= self.rotate_seconds)
+
+    def _maybe_rotate(self):
+        if self._due(self.db_path, self._db_started):
+            first = self._db.execute("SELECT MIN(ts) FROM events").fetchone()[0]
+            if first is not None:
+                self._db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+                self._db.close()
+                target = _rotated_path(self.db_path, first)
+                os.replace(self.db_path, target)
+                logger.info(f"Event log rotated to {target}")
+                self._open_db()
+            else:
+                self._db_started = time.time()
+
+        if self._csv is not None and self._due(self.csv_path, self._csv_started):
+            if self._csv.tell() > len(CSV_HEADER):
+                self._csv.close()
+                os.replace(self.csv_path, _rotated_path(self.csv_path, self._csv_started))
+                self._open_csv()
+            else:
+                self._csv_started = time.time()
+
+    def _close_files(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+        if self._csv is not None:
+            self._csv.close()
+            self._csv = None
+
+    # --- QUERY ---
+    def databases(self):
+        """Active database plus rotated ones, oldest first."""
+        base, ext = os.path.splitext(self.db_path)
+        paths = sorted(glob.glob(f"{glob.escape(base)}-*{ext}"))
+        if os.path.exists(self.db_path):
+            paths.append(self.db_path)
+        return paths
+
+    def query(self, start=None, end=None, source_ip=None, limit=None):
+        """Events in [start, end) (unix seconds), optionally for one source IP, newest first."""
+        clauses, params = [], []
+        if start is not None:
+            clauses.append("ts >= ?")
+            params.append(start)
+        if end is not None:
+            clauses.append("ts < ?")
+            params.append(end)
+        if source_ip is not None:
+            clauses.append("source_ip = ?")
+            params.append(source_ip)
+        sql = "SELECT ts, source_ip, risk, action, protocol, score FROM events"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY ts DESC"
+        if limit is not None:
+            sql += f" LIMIT {int(limit)}"
+
+        import pandas as pd  # Queries only: the writer path never needs it
+        frames = []
+        for path in reversed(self.databases()):
+            with closing(sqlite3.connect(f"file:{path}?mode=ro", uri=True)) as db:
+                frames.append(pd.read_sql_query(sql, db, params=params))
+            if limit is not None and sum(len(f) for f in frames) >= limit:
+                break
+
+        df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(
+            columns=["ts", "source_ip", "risk", "action", "protocol", "score"])
+        df = df.sort_values("ts", ascending=False, kind="stable")
+        if limit is not None:
+            df = df.head(limit)
+        df.columns = EVENT_COLUMNS
+        # Local wall-clock time, as in the CSV log
+        local_tz = datetime.now().astimezone().tzinfo
+        df["Timestamp"] = pd.to_datetime(df["Timestamp"], unit="s", utc=True).dt.tz_convert(local_tz).dt.tz_localize(None)
+        return df.reset_index(drop=True)
@@ -1,55 +1,142 @@
-import pandas as pd
-from collections import defaultdict
-from scapy.all import IP, TCP, UDP
+import socket
+import struct
+import numpy as np
+from collections import OrderedDict, defaultdict
+from src.packet_parser import IPPROTO_TCP, OPENER_FLAG, TCP_ACK, TCP_SYN, parse_frame
+
+# Heavy imports are deferred so raw capture, replay, the API and the
+# collector start without them: pandas loads on the first extraction,
+# and only Scapy's IPv4 layers (not scapy.all) on the first dissected packet.
+IP = TCP = UDP = None
+
+
+def load_scapy_layers():
+    """Binds Scapy's IP/TCP/UDP layers; importing them registers their dissectors."""
+    global IP, TCP, UDP
+    from scapy.layers.inet import IP, TCP, UDP
+
+# Model input columns, in training order
+FEATURE_COLUMNS = ["Dst_Port", "Protocol", "Flow_Packets", "Flow_Bytes",
+                   "Flow_Duration", "Packet_Rate", "Byte_Rate", "TCP_Flags_Sum"]
+
+# Optional per-source columns (src/sketches.py), appended after FEATURE_COLUMNS
+SOURCE_FEATURE_COLUMNS = ["Src_Distinct_Ports", "Src_Distinct_Hosts", "Src_Packets"]
+
+
+TCP_FLAGS_MASK = 0x1FF  # The 9 TCP flag bits (NS included) of the accumulated flags; OPENER_FLAG is not one
+
+# Bookkeeping column next to the features: 1 if the flow's source initiated
+# it (sent a SYN without ACK); always 1 for non-TCP flows, which carry no
+# handshake to tell
+INITIATOR_COLUMN = "Initiator"
+
+
+def model_columns(n_features):
+    """Input columns of a model trained on n_features columns (8 = flow only, 11 = with source features)."""
+    return (FEATURE_COLUMNS + SOURCE_FEATURE_COLUMNS)[:n_features]
+
+_IPV4 = struct.Struct("!I")
+
+
+def pack_ip(ip):
+    """Dotted-quad IPv4 string -> unsigned 32-bit integer."""
+    return _IPV4.unpack(socket.inet_aton(ip))[0]
+
+
+def unpack_ip(value):
+    """Unsigned 32-bit integer -> dotted-quad IPv4 string."""
+    return socket.inet_ntoa(_IPV4.pack(int(value)))
+
 
 class FlowExtractor:
     def __init__(self):
         # Key: (Src_IP, Dst_IP, Dst_Port, Protocol)
         self.current_flows = defaultdict(lambda: {
-            "start_time": 0, "last_time": 0, "packet_count": 0, 
+            "start_time": 0, "last_time": 0, "packet_count": 0,
             "byte_count": 0, "tcp_flags": 0
         })
 
+    def __len__(self):
+        return len(self.current_flows)
+
     def process_packet(self, packet):
+        if IP is None:
+            load_scapy_layers()
         if IP in packet:
             src = packet[IP].src
             dst = packet[IP].dst
             proto = packet[IP].proto
             length = len(packet)
             timestamp = float(packet.time)
-            
+
             dst_port = 0
             flags = 0
             if TCP in packet:
                 dst_port = packet[TCP].dport
                 flags = int(packet[TCP].flags)
+                if flags & (TCP_SYN | TCP_ACK) == TCP_SYN:
+                    flags |= OPENER_FLAG
             elif UDP in packet:
                 dst_port = packet[UDP].dport
 
-            flow_key = (src, dst, dst_port, proto)
-            
-            # Update Flow Data
-            flow = self.current_flows[flow_key]
-            if flow["packet_count"] == 0:
-                flow["start_time"] = timestamp
-            
-            flow["last_time"] = timestamp
-            flow["packet_count"] += 1
-            flow["byte_count"] += length
-            flow["tcp_flags"] |= flags # Accumulate flags
+            self.add(src, dst, dst_port, proto, length, timestamp, flags)
+
+    def process_frame(self, frame, timestamp, length=None, parse=parse_frame):
+        """Raw Ethernet frame counterpart of process_packet (no Scapy objects)."""
+        parsed = parse(frame)
+        if parsed is not None:
+            src, dst, dst_port, proto, flags = parsed
+            if length is None:
+                length = len(frame)
+            self.add(self._decode_ip(src), self._decode_ip(dst), dst_port, proto,
+                     length, timestamp, flags)
+
+    def process_frames(self, frames, parse=parse_frame):
+        """Accounts a batch of (frame, timestamp, length) tuples."""
+        for frame, timestamp, length in frames:
+            self.process_frame(frame, timestamp, length, parse)
+
+    # Dict keys hold dotted-quad strings, as Scapy reports them
+    _decode_ip = staticmethod(unpack_ip)
+
+    def add(self, src, dst, dst_port, proto, length, timestamp, flags):
+        """Accounts one already-parsed IPv4 packet to its flow."""
+        flow_key = (src, dst, dst_port, proto)
+
+        # Update Flow Data
+        flow = self.current_flows[flow_key]
+        if flow["packet_count"] == 0:
+            flow["start_time"] = timestamp
+
+        flow["last_time"] = timestamp
+        flow["packet_count"] += 1
+        flow["byte_count"] += length
+        flow["tcp_flags"] |= flags # Accumulate flags
+
+    # Windowed tables emit every flow at each extraction; persistent ones
+    # (TimeoutFlowTable) keep flows open across windows
+    persistent = False
+
+    def reset(self):
+        """Discards all flows collected so far."""
+        self.current_flows.clear()
+
+    def flush(self):
+        """Closes every open flow before the last extraction (no-op for windowed tables)."""
 
     def extract_features(self):
         """Converts raw flow data into a DataFrame for the ML model."""
         dataset = []
         flow_keys = []
-        
+        initiators = []
+
         for key, data in self.current_flows.items():
             duration = data["last_time"] - data["start_time"]
             if duration == 0: duration = 0.001 # Avoid division by zero
-            
+
             pkt_rate = data["packet_count"] / duration
             byte_rate = data["byte_count"] / duration
-            
+
             # Features matched to training columns
             dataset.append([
                 key[2], # Dst_Port
@@ -59,14 +146,515 @@ class FlowExtractor:
                 duration,
                 pkt_rate,
                 byte_rate,
-                data["tcp_flags"]
+                data["tcp_flags"] & TCP_FLAGS_MASK
             ])
+            initiators.append(key[3] != IPPROTO_TCP or bool(data["tcp_flags"] & OPENER_FLAG))
             flow_keys.append(key) # Store keys to identify IP later
-            
-        columns = ["Dst_Port", "Protocol", "Flow_Packets", "Flow_Bytes", 
-                   "Flow_Duration", "Packet_Rate", "Byte_Rate", "TCP_Flags_Sum"]
-        
+
         # Reset flows after extraction (for next window)
-        self.current_flows.clear()
-        
-        return pd.DataFrame(dataset, columns=columns), flow_keys
\ No newline at end of file
+        self.reset()
+
+        import pandas as pd
+        df = pd.DataFrame(dataset, columns=FEATURE_COLUMNS)
+        df[INITIATOR_COLUMN] = np.array(initiators, dtype=bool)
+        return df, flow_keys
+
+
+class FlowKeys:
+    """
+    Column view of the flow keys returned by ArrayFlowExtractor.
+
+    Behaves like the list of (Src_IP, Dst_IP, Dst_Port, Protocol) tuples
+    returned by FlowExtractor, but keeps the packed integer columns so
+    callers can group or filter without decoding every key.
+    """
+
+    def __init__(self, src, dst, dst_port, proto):
+        self.src = src
+        self.dst = dst
+        self.dst_port = dst_port
+        self.proto = proto
+
+    def __len__(self):
+        return len(self.src)
+
+    def __getitem__(self, i):
+        return (unpack_ip(self.src[i]), unpack_ip(self.dst[i]),
+                int(self.dst_port[i]), int(self.proto[i]))
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+class ArrayFlowExtractor(FlowExtractor):
+    """
+    Struct-of-arrays flow table.
+
+    Counters live in preallocated NumPy columns indexed by slot; the only
+    per-flow Python object is the dict entry mapping the packed key
+    (src_int, dst_int, dst_port, proto as one integer) to its slot. Features are computed
+    as whole-column operations at extraction time. Columns double in size
+    when full and are reused across windows.
+    """
+
+    def __init__(self, capacity=65536):
+        self._index = {}
+        self._packed_ips = {}  # Scapy hands us strings; pack each once per window
+        self._size = 0
+        self._allocate(capacity)
+
+    def _allocate(self, capacity):
+        def grow(old, dtype):
+            new = np.zeros(capacity, dtype=dtype)
+            if old is not None:
+                new[:self._size] = old[:self._size]
+            return new
+
+        self.src = grow(getattr(self, "src", None), np.uint32)
+        self.dst = grow(getattr(self, "dst", None), np.uint32)
+        self.dst_port = grow(getattr(self, "dst_port", None), np.uint16)
+        self.proto = grow(getattr(self, "proto", None), np.uint8)
+        self.start_time = grow(getattr(self, "start_time", None), np.float64)
+        self.last_time = grow(getattr(self, "last_time", None), np.float64)
+        self.packet_count = grow(getattr(self, "packet_count", None), np.int64)
+        self.byte_count = grow(getattr(self, "byte_count", None), np.int64)
+        self.tcp_flags = grow(getattr(self, "tcp_flags", None), np.uint16)
+        self.capacity = capacity
+
+    def __len__(self):
+        return self._size
+
+    # Packed integers are the native key format here
+    @staticmethod
+    def _decode_ip(value):
+        return value
+
+    def add(self, src, dst, dst_port, proto, length, timestamp, flags):
+        if isinstance(src, str):
+            src = self._packed_ips.get(src) or self._pack(src)
+            dst = self._packed_ips.get(dst) or self._pack(dst)
+        # One Python int per key instead of a 4-tuple of objects
+        key = (src << 56) | (dst << 24) | (dst_port << 8) | proto
+
+        slot = self._index.get(key)
+        if slot is None:
+            slot = self._size
+            if slot == self.capacity:
+                self._allocate(self.capacity * 2)
+            self._index[key] = slot
+            self._size += 1
+            self.src[slot] = src
+            self.dst[slot] = dst
+            self.dst_port[slot] = dst_port
+            self.proto[slot] = proto
+            self.start_time[slot] = timestamp
+            self.last_time[slot] = timestamp
+            self.packet_count[slot] = 1
+            self.byte_count[slot] = length
+            self.tcp_flags[slot] = flags
+            return
+
+        self.last_time[slot] = timestamp
+        self.packet_count[slot] += 1
+        self.byte_count[slot] += length
+        self.tcp_flags[slot] |= flags
+
+    def _pack(self, ip):
+        value = self._packed_ips[ip] = pack_ip(ip)
+        return value
+
+    def reset(self):
+        self._index.clear()
+        self._packed_ips.clear()
+        self._size = 0
+
+    def extract_features(self):
+        n = self._size
+        df, flow_keys = flow_features(
+            self.src[:n].copy(), self.dst[:n].copy(), self.dst_port[:n].copy(), self.proto[:n].copy(),
+            self.start_time[:n], self.last_time[:n], self.packet_count[:n].copy(),
+            self.byte_count[:n].copy(), self.tcp_flags[:n]
+        )
+        self.reset()
+        return df, flow_keys
+
+
+class TimeoutFlowTable(FlowExtractor):
+    """
+    Persistent flow table with CICFlowMeter-style timeouts.
+
+    Flows stay open across extract_features() calls and are only emitted
+    once they close: idle for `idle_timeout` seconds, running for
+    `active_timeout` seconds (the next packet starts a new flow), or
+    evicted as least recently seen when `max_flows` are open. Flows are
+    kept in last-seen order, so expiry pops from the front and costs only
+    the flows that close. Time is packet time (the latest timestamp seen)
+    unless expire() is given a clock.
+    """
+
+    PACKED_IP_CACHE = 1 << 20  # Distinct IP strings remembered before the cache is reset
+    persistent = True
+
+    def __init__(self, idle_timeout=15.0, active_timeout=120.0, max_flows=1_000_000):
+        self.idle_timeout = idle_timeout
+        self.active_timeout = active_timeout
+        self.max_flows = max_flows
+        self.flows = OrderedDict()  # packed key -> [start, last, packets, bytes, flags], least recent first
+        self._packed_ips = {}
+        self._closed = []  # (key, flow) closed since the last extraction
+        self.clock = 0.0
+
+        # Counters for reporting
+        self.idle_closed = 0
+        self.active_closed = 0
+        self.evicted = 0
+
+    def __len__(self):
+        return len(self.flows)
+
+    @staticmethod
+    def _decode_ip(value):
+        return value
+
+    def add(self, src, dst, dst_port, proto, length, timestamp, flags):
+        if isinstance(src, str):
+            packed = self._packed_ips
+            if len(packed) > self.PACKED_IP_CACHE:
+                packed.clear()
+            src = packed.get(src) or packed.setdefault(src, pack_ip(src))
+            dst = packed.get(dst) or packed.setdefault(dst, pack_ip(dst))
+        key = (src << 56) | (dst << 24) | (dst_port << 8) | proto
+        if timestamp > self.clock:
+            self.clock = timestamp
+
+        flows = self.flows
+        flow = flows.get(key)
+        if flow is not None:
+            if timestamp - flow[0] < self.active_timeout and timestamp - flow[1] <= self.idle_timeout:
+                flow[1] = timestamp
+                flow[2] += 1
+                flow[3] += length
+                flow[4] |= flags
+                flows.move_to_end(key)
+                return
+            # Timed out before expire() got to it: close it and start over
+            del flows[key]
+            self._closed.append((key, flow))
+            if timestamp - flow[1] > self.idle_timeout:
+                self.idle_closed += 1
+            else:
+                self.active_closed += 1
+        elif len(flows) >= self.max_flows:
+            self._closed.append(flows.popitem(last=False))
+            self.evicted += 1
+        flows[key] = [timestamp, timestamp, 1, length, flags]
+
+    def expire(self, now=None):
+        """Closes flows idle for idle_timeout; returns how many closed."""
+        horizon = (self.clock if now is None else now) - self.idle_timeout
+        flows = self.flows
+        closed = 0
+        while flows:
+            key = next(iter(flows))
+            if flows[key][1] >= horizon:
+                break
+            self._closed.append((key, flows.pop(key)))
+            closed += 1
+        self.idle_closed += closed
+        return closed
+
+    def flush(self):
+        """Closes every open flow (end of capture)."""
+        self._closed.extend(self.flows.items())
+        self.flows.clear()
+
+    def reset(self):
+        self.flows.clear()
+        self._closed = []
+        self._packed_ips.clear()
+
+    def new_batch(self):
+        """Empty batch for close_into()."""
+        return ClosedFlows()
+
+    def close_into(self, batch, now=None):
+        """Expires idle flows and moves everything closed so far into a ClosedFlows batch."""
+        self.expire(now)
+        batch.closed, self._closed = self._closed, []
+        return batch
+
+    def extract_features(self, now=None):
+        """Features of the flows closed since the last call, after expiring idle ones."""
+        return self.close_into(ClosedFlows(), now).extract_features()
+
+    # --- CHECKPOINTS ---
+    def snapshot(self):
+        """Open flows as NumPy columns (for checkpoints)."""
+        keys = np.array([[key >> 64, key & 0xFFFFFFFFFFFFFFFF] for key in self.flows],
+                        dtype=np.uint64).reshape(-1, 2)
+        stats = np.array(list(self.flows.values()), dtype=np.float64).reshape(-1, 5)
+        return {"keys": keys, "stats": stats}
+
+    def restore(self, snapshot):
+        """Reopens the flows of a snapshot(), keeping their last-seen order."""
+        for (high, low), flow in zip(snapshot["keys"].tolist(), snapshot["stats"].tolist()):
+            start, last, packets, byte_count, flags = flow
+            self.flows[(high << 64) | low] = [start, last, int(packets), int(byte_count), int(flags)]
+            self.clock = max(self.clock, last)
+
+class ClosedFlows:
+    """
+    Flows closed by a TimeoutFlowTable, waiting for feature extraction.
+    Filled under the capture lock in O(1) by close_into(); the features
+    are computed later, off the capture path.
+    """
+
+    def __init__(self):
+        self.closed = []  # (packed key, [start, last, packets, bytes, flags])
+
+    def __len__(self):
+        return len(self.closed)
+
+    def reset(self):
+        self.closed = []
+
+    def extract_features(self):
+        keys = [key for key, _ in self.closed]
+        stats = np.array([flow for _, flow in self.closed], dtype=np.float64).reshape(-1, 5)
+        self.closed = []
+        return flow_features(
+            np.array([key >> 56 for key in keys], dtype=np.uint32),
+            np.array([(key >> 24) & 0xFFFFFFFF for key in keys], dtype=np.uint32),
+            np.array([(key >> 8) & 0xFFFF for key in keys], dtype=np.uint16),
+            np.array([key & 0xFF for key in keys], dtype=np.uint8),
+            stats[:, 0], stats[:, 1], stats[:, 2].astype(np.int64),
+            stats[:, 3].astype(np.int64), stats[:, 4].astype(np.uint16)
+        )
+
+class SlidingFlowTable(FlowExtractor):
+    """
+    Sliding-window flow table built from sub-window buckets.
+
+    Each flow's counters are kept in a ring of window / tick buckets of
+    `tick` seconds, next to running totals for the whole window. A packet
+    updates its flow's newest bucket and the totals; when a tick ends, the
+    oldest bucket is subtracted from the totals and reused, so nothing is
+    recomputed over the whole window. Every extraction emits features over
+    the last `window` seconds for the flows that saw packets since the
+    previous one: an attack is scored within a tick, and one that
+    straddles a window boundary is never split. Flows with nothing left
+    in the window give their slot back.
+    """
+
+    persistent = True
+
+    def __init__(self, window=5.0, tick=1.0, capacity=65536):
+        self.window = window
+        self.tick = tick
+        self.buckets = max(1, int(round(window / tick)))
+        self._index = {}  # packed key -> slot
+        self._packed_ips = {}
+        self._free_slots = []
+        self._size = 0  # Slots handed out so far (live or free)
+        self._epoch = None  # Current tick number: timestamp // tick
+        self.clock = 0.0
+        self._allocate(capacity)
+
+    def _allocate(self, capacity):
+        def grow(name, dtype, fill=0, rows=None):
+            new = np.full((capacity,) if rows is None else (rows, capacity), fill, dtype=dtype)
+            old = getattr(self, name, None)
+            if old is not None:
+                new[..., :old.shape[-1]] = old
+            setattr(self, name, new)
+
+        grow("src", np.uint32)
+        grow("dst", np.uint32)
+        grow("dst_port", np.uint16)
+        grow("proto", np.uint8)
+        grow("live", np.bool_)
+        grow("packet_count", np.int64)  # Window totals
+        grow("byte_count", np.int64)
+        grow("fresh", np.int64)  # Packets since the last extraction
+        grow("bucket_packets", np.int64, rows=self.buckets)
+        grow("bucket_bytes", np.int64, rows=self.buckets)
+        grow("bucket_flags", np.uint16, rows=self.buckets)
+        grow("bucket_first", np.float64, np.inf, self.buckets)
+        grow("bucket_last", np.float64, -np.inf, self.buckets)
+        self.capacity = capacity
+
+    def __len__(self):
+        return len(self._index)
+
+    @staticmethod
+    def _decode_ip(value):
+        return value
+
+    def add(self, src, dst, dst_port, proto, length, timestamp, flags):
+        if isinstance(src, str):
+            packed = self._packed_ips
+            if len(packed) > TimeoutFlowTable.PACKED_IP_CACHE:
+                packed.clear()
+            src = packed.get(src) or packed.setdefault(src, pack_ip(src))
+            dst = packed.get(dst) or packed.setdefault(dst, pack_ip(dst))
+        if timestamp > self.clock:
+            self.clock = timestamp
+            epoch = int(timestamp // self.tick)
+            if self._epoch is None:
+                self._epoch = epoch
+            elif epoch > self._epoch:
+                self.advance(epoch)
+
+        key = (src << 56) | (dst << 24) | (dst_port << 8) | proto
+        slot = self._index.get(key)
+        if slot is None:
+            if self._free_slots:
+                slot = self._free_slots.pop()
+            else:
+                slot = self._size
+                if slot == self.capacity:
+                    self._allocate(self.capacity * 2)
+                self._size += 1
+            self._index[key] = slot
+            self.src[slot] = src
+            self.dst[slot] = dst
+            self.dst_port[slot] = dst_port
+            self.proto[slot] = proto
+            self.live[slot] = True
+
+        bucket = self._epoch % self.buckets
+        if self.bucket_packets[bucket, slot] == 0:
+            self.bucket_first[bucket, slot] = timestamp
+            self.bucket_last[bucket, slot] = timestamp
+        elif timestamp > self.bucket_last[bucket, slot]:
+            self.bucket_last[bucket, slot] = timestamp
+        self.bucket_packets[bucket, slot] += 1
+        self.bucket_bytes[bucket, slot] += length
+        self.bucket_flags[bucket, slot] |= flags
+        self.packet_count[slot] += 1
+        self.byte_count[slot] += length
+        self.fresh[slot] += 1
+
+    def advance(self, epoch):
+        """Moves the ring to tick `epoch`: buckets that leave the window are subtracted and cleared."""
+        if self._epoch is None or epoch <= self._epoch:
+            return
+        n = self._size
+        for expired in range(self._epoch + 1, min(epoch, self._epoch + self.buckets) + 1):
+            bucket = expired % self.buckets
+            self.packet_count[:n] -= self.bucket_packets[bucket, :n]
+            self.byte_count[:n] -= self.bucket_bytes[bucket, :n]
+            self.bucket_packets[bucket, :n] = 0
+            self.bucket_bytes[bucket, :n] = 0
+            self.bucket_flags[bucket, :n] = 0
+            self.bucket_first[bucket, :n] = np.inf
+            self.bucket_last[bucket, :n] = -np.inf
+        self._epoch = epoch
+
+        # Flows with no packets left in the window free their slot
+        empty = np.flatnonzero(self.live[:n] & (self.packet_count[:n] == 0))
+        for slot in empty.tolist():
+            del self._index[(int(self.src[slot]) << 56) | (int(self.dst[slot]) << 24)
+                            | (int(self.dst_port[slot]) << 8) | int(self.proto[slot])]
+        self._free_slots.extend(empty.tolist())
+        self.live[empty] = False
+        self.fresh[empty] = 0
+
+    def reset(self):
+        self._index.clear()
+        self._packed_ips.clear()
+        self._free_slots = []
+        self._size = 0
+        self._epoch = None
+        self.live[:] = False
+        self.packet_count[:] = 0
+        self.byte_count[:] = 0
+        self.fresh[:] = 0
+        self.bucket_packets[:] = 0
+        self.bucket_bytes[:] = 0
+        self.bucket_flags[:] = 0
+        self.bucket_first[:] = np.inf
+        self.bucket_last[:] = -np.inf
+
+    def new_batch(self):
+        """Empty batch for close_into()."""
+        return WindowFlows()
+
+    def close_into(self, batch, now=None):
+        """
+        Copies the window features of the flows updated since the last call
+        into a WindowFlows batch. `now` (wall clock) first drops the ticks
+        that ended more than `window` ago.
+        """
+        if now is not None:
+            self.advance(int(now // self.tick) - 1)  # Keep the tick that just ended
+        n = self._size
+        slots = np.flatnonzero(self.fresh[:n] > 0)
+        batch.columns = (
+            self.src[slots], self.dst[slots], self.dst_port[slots], self.proto[slots],
+            self.bucket_first[:, slots].min(axis=0), self.bucket_last[:, slots].max(axis=0),
+            self.packet_count[slots], self.byte_count[slots],
+            np.bitwise_or.reduce(self.bucket_flags[:, slots], axis=0), self.fresh[slots]
+        )
+        self.fresh[slots] = 0
+        return batch
+
+    def extract_features(self, now=None):
+        return self.close_into(WindowFlows(), now).extract_features()
+
+
+class WindowFlows:
+    """
+    Feature columns copied out of a SlidingFlowTable at a tick, waiting for
+    feature extraction off the capture path.
+    """
+
+    def __init__(self):
+        self.columns = None
+
+    def __len__(self):
+        return 0 if self.columns is None else len(self.columns[0])
+
+    def reset(self):
+        self.columns = None
+
+    def extract_features(self):
+        if self.columns is None:
+            SlidingFlowTable(capacity=1).close_into(self)  # Never filled: empty columns
+        *columns, fresh = self.columns
+        self.columns = None
+        df, flow_keys = flow_features(*columns)
+        # Flows are re-emitted while they stay in the window; per-source
+        # counters (src/sketches.py) should only add the new packets
+        df["Tick_Packets"] = fresh
+        return df, flow_keys
+
+
+def flow_features(src, dst, dst_port, proto, start_time, last_time, packets, byte_count, tcp_flags):
+    """Per-flow counter columns -> (feature DataFrame, FlowKeys), vectorized."""
+    duration = last_time - start_time
+    duration[duration == 0] = 0.001 # Avoid division by zero
+
+    import pandas as pd
+    df = pd.DataFrame({
+        "Dst_Port": dst_port.astype(np.int64),
+        "Protocol": proto.astype(np.int64),
+        "Flow_Packets": packets,
+        "Flow_Bytes": byte_count,
+        "Flow_Duration": duration,
+        "Packet_Rate": packets / duration,
+        "Byte_Rate": byte_count / duration,
+        "TCP_Flags_Sum": (tcp_flags & TCP_FLAGS_MASK).astype(np.int64)
+    }, columns=FEATURE_COLUMNS)
+    df[INITIATOR_COLUMN] = (proto != IPPROTO_TCP) | ((tcp_flags & OPENER_FLAG) != 0)
+    return df, FlowKeys(src, dst, dst_port, proto)
+
+
+# Flow table implementations selectable by name
+FLOW_TABLES = {
+    "dict": FlowExtractor,
+    "array": ArrayFlowExtractor,
+    "timeout": TimeoutFlowTable,  # Persistent: emits flows on idle/active timeout
+    "sliding": SlidingFlowTable,  # Persistent: overlapping window, emitted every tick
+}
@@ -0,0 +1,154 @@
+import heapq
+import logging
+import os
+import subprocess
+import time
+from collections import deque
+
+logger = logging.getLogger("0xGuard")
+
+# Set-based blocking: offenders are elements of one nftables set matched by
+# a single drop rule, so the ruleset stays constant-size however many IPs
+# are blocked. Each ResponseManager pass becomes one `nft -f` transaction
+# (applied atomically by the kernel) instead of one command per IP.
+
+NFT_TABLE = "oxguard"
+
+
+class NftablesFirewall:
+    """
+    Blocklist kept as nftables sets (IPv4 + IPv6) with a TTL per IP.
+
+    block() adds IPs or restarts their TTL; expire() unblocks IPs whose TTL
+    has passed and returns them. Both apply their changes as one batched
+    transaction. If a transaction fails (e.g. the table was flushed from
+    outside) the whole ruleset is rebuilt from the in-memory blocklist.
+    """
+
+    def __init__(self, ttl=3600, table=NFT_TABLE, hook_priority=-10):
+        self.ttl = ttl
+        self.table = table
+        self.hook_priority = hook_priority
+        self.blocklist = {}  # ip -> expires at
+        self._expiry = []  # heap of (expires at, ip); stale entries skipped
+        self._installed = False
+
+        # Per-batch apply latency (ms), most recent last
+        self.apply_ms = deque(maxlen=1000)
+        self.batches = 0
+
+    # --- BACKEND INTERFACE ---
+    def block(self, ips, now=None):
+        now = time.time() if now is None else now
+        expires = now + self.ttl
+        added = []
+        for ip in ips:
+            if ip not in self.blocklist:
+                added.append(ip)
+            self.blocklist[ip] = expires
+            heapq.heappush(self._expiry, (expires, ip))
+        self._apply(added, [])
+        return added
+
+    def expire(self, now=None):
+        now = time.time() if now is None else now
+        removed = []
+        while self._expiry and self._expiry[0][0] <= now:
+            expires, ip = heapq.heappop(self._expiry)
+            if self.blocklist.get(ip) == expires:  # Not refreshed since
+                del self.blocklist[ip]
+                removed.append(ip)
+        self._apply([], removed)
+        return removed
+
+    # --- RULESET ---
+    @staticmethod
+    def _split(ips):
+        v4 = [ip for ip in ips if ":" not in ip]
+        v6 = [ip for ip in ips if ":" in ip]
+        return v4, v6
+
+    def _elements(self, verb, ips):
+        v4, v6 = self._split(ips)
+        lines = []
+        if v4:
+            lines.append(f"{verb} element inet {self.table} blocklist4 {{ {', '.join(v4)} }}")
+        if v6:
+            lines.append(f"{verb} element inet {self.table} blocklist6 {{ {', '.join(v6)} }}")
+        return lines
+
+    def ruleset(self):
+        """Full ruleset: recreates the table with the current blocklist."""
+        lines = [
+            f"add table inet {self.table}",
+            f"delete table inet {self.table}",
+            f"table inet {self.table} {{",
+            "    set blocklist4 { type ipv4_addr; }",
+            "    set blocklist6 { type ipv6_addr; }",
+            "    chain input {",
+            f"        type filter hook input priority {self.hook_priority}; policy accept;",
+            "        ip saddr @blocklist4 drop",
+            "        ip6 saddr @blocklist6 drop",
+            "    }",
+            "}"
+        ]
+        lines += self._elements("add", list(self.blocklist))
+        return "\n".join(lines) + "\n"
+
+    def transaction(self, added, removed):
+        """Incremental script for one batch."""
+        return "\n".join(self._elements("add", added) + self._elements("delete", removed)) + "\n"
+
+    def _apply(self, added, removed):
+        if not added and not removed and self._installed:
+            return
+        started = time.perf_counter()
+        if not self._installed:
+            self._install(self.ruleset())
+        else:
+            try:
+                self._run(self.transaction(added, removed))
+            except (OSError, subprocess.SubprocessError) as e:
+                logger.error(f"Firewall transaction failed, rebuilding ruleset: {e}")
+                self._installed = False  # If the rebuild fails too, the next batch retries it
+                self._install(self.ruleset())
+        elapsed = (time.perf_counter() - started) * 1000
+        self.apply_ms.append(elapsed)
+        self.batches += 1
+        logger.info(f"Firewall batch: +{len(added)} / -{len(removed)} IPs in {elapsed:.1f}ms "
+                    f"({len(self.blocklist)} blocked)")
+
+    def _install(self, script):
+        self._run(script)
+        self._installed = True
+
+    def _run(self, script):
+        subprocess.run(["nft", "-f", "-"], input=script, text=True, check=True,
+                       capture_output=True, timeout=10)
+
+
+class DryRunFirewall(NftablesFirewall):
+    """
+    Generates the same transactions without root: after every batch the
+    full ruleset is written to `path` (atomically), and the last batch
+    script is kept in `last_transaction`.
+    """
+
+    def __init__(self, path="logs/firewall.nft", ttl=3600, table=NFT_TABLE, hook_priority=-10):
+        super().__init__(ttl=ttl, table=table, hook_priority=hook_priority)
+        self.path = path
+        self.last_transaction = None
+
+    def _install(self, script):
+        self._installed = True
+        self._write_ruleset()
+
+    def _run(self, script):
+        self.last_transaction = script
+        self._write_ruleset()
+
+    def _write_ruleset(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(self.ruleset())
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,40 @@
+import struct
+import numpy as np
+
+# Compact columnar binary encoding for batches of flow feature rows.
+#
+#   header : magic "0XGF" | version u8 | n_cols u8 | reserved u16 | n_rows u32
+#   body   : n_cols columns, each n_rows little-endian float32 values
+#
+# float32 loses nothing the model would keep: the Isolation Forest trees
+# compare features in float32 internally.
+
+MAGIC = b"0XGF"
+VERSION = 1
+CONTENT_TYPE = "application/x-0xguard-flows"
+
+_HEADER = struct.Struct("<4sBBHI")
+HEADER_SIZE = _HEADER.size
+
+
+def encode_columns(matrix):
+    """(n_rows, n_cols) array-like -> bytes."""
+    matrix = np.asarray(matrix, dtype="<f4")
+    n_rows, n_cols = matrix.shape
+    return _HEADER.pack(MAGIC, VERSION, n_cols, 0, n_rows) + matrix.T.tobytes()
+
+
+def decode_columns(payload, n_cols=None):
+    """bytes -> (n_rows, n_cols) float32 array. Raises ValueError on bad input."""
+    if len(payload) < HEADER_SIZE:
+        raise ValueError("Payload shorter than header")
+    magic, version, cols, _, n_rows = _HEADER.unpack_from(payload)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("Not a 0xGuard flow batch (bad magic or version)")
+    if n_cols is not None and cols != n_cols:
+        raise ValueError(f"Expected {n_cols} columns, got {cols}")
+    expected = HEADER_SIZE + 4 * cols * n_rows
+    if len(payload) != expected:
+        raise ValueError(f"Expected {expected} bytes for {n_rows} rows, got {len(payload)}")
+    body = np.frombuffer(payload, dtype="<f4", offset=HEADER_SIZE)
+    return body.reshape(cols, n_rows).T
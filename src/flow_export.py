@@ -0,0 +1,409 @@
+import json
+import logging
+import os
+import socket
+import struct
+import threading
+import time
+import zlib
+from collections import deque, namedtuple
+import numpy as np
+from src.feature_extractor import FEATURE_COLUMNS, SOURCE_FEATURE_COLUMNS, FlowKeys, unpack_ip
+from src.flow_codec import HEADER_SIZE as COLUMNS_HEADER_SIZE, decode_columns, encode_columns
+from src.sketches import SOURCE_COUNT_COLUMNS
+
+logger = logging.getLogger("0xGuard")
+
+# Sensor -> collector flow export protocol, over one persistent TCP or Unix
+# stream socket per sensor.
+#
+#   frame  : magic "0XGE" | version u8 | type u8 | flags u8 | reserved u8 | length u32 | payload
+#   HELLO  : JSON {"sensor", "session", "columns"} (first frame on every connection)
+#   BATCH  : seq u64 | n_windows u32 | n_rows u32
+#            n_windows x (window_end f64, rows u32)
+#            feature matrix (flow_codec columns: float32, one column after another;
+#            EXPORT_COLUMNS, i.e. the model features then Source_Flows / Source_Ports)
+#            src u32[n] | dst u32[n] | dst_port u16[n] | proto u8[n]
+#   ACK    : seq u64 | rows u32 | n_block u32 | n_block x source IP u32
+#
+# A BATCH carries one or more whole windows. Payloads above COMPRESS_MIN
+# bytes are zlib-compressed (FLAG_ZLIB); feature and key columns are laid
+# out column by column, which is what makes them compress well. The
+# collector acknowledges a batch once it is scored and logged; the sensor
+# keeps it until then and resends it after a reconnect, and the collector
+# does not rescore resends (by session, seq): it repeats the original ACK,
+# block list included.
+
+MAGIC = b"0XGE"
+VERSION = 1
+HELLO, BATCH, ACK = 1, 2, 3
+FLAG_ZLIB = 0x01
+COMPRESS_MIN = 512  # Bytes; smaller payloads are sent as is
+MAX_FRAME = 256 << 20  # Bytes; larger frames are a protocol error
+
+_FRAME = struct.Struct("<4sBBBBI")
+_BATCH = struct.Struct("<QII")
+_WINDOW = struct.Struct("<dI")
+_ACK = struct.Struct("<QII")
+FRAME_HEADER_SIZE = _FRAME.size
+
+EXPORT_FEATURES = FEATURE_COLUMNS + SOURCE_FEATURE_COLUMNS  # Model inputs a sensor sends per row
+# What a sensor sends per row: the features, then how many flows and ports
+# the row stands for (collapse_sources), so the collector's verdicts count
+# them like the local agent's
+EXPORT_COLUMNS = EXPORT_FEATURES + SOURCE_COUNT_COLUMNS
+
+# Decoded BATCH: per-window (end time, rows), one feature matrix and FlowKeys for all rows
+Batch = namedtuple("Batch", ["seq", "windows", "matrix", "flow_keys"])
+
+
+class ProtocolError(ValueError):
+    """Malformed frame or payload: the connection is dropped."""
+
+
+# --- FRAMING ---
+def encode_frame(frame_type, payload, compress_level=1):
+    """Frame bytes for one message; compresses large payloads when that pays off."""
+    flags = 0
+    if compress_level and len(payload) >= COMPRESS_MIN:
+        packed = zlib.compress(payload, compress_level)
+        if len(packed) < len(payload):
+            payload, flags = packed, FLAG_ZLIB
+    return _FRAME.pack(MAGIC, VERSION, frame_type, flags, 0, len(payload)) + payload
+
+
+def parse_frame_header(header):
+    """Frame header bytes -> (type, flags, payload length). Raises ProtocolError."""
+    magic, version, frame_type, flags, _, length = _FRAME.unpack(header)
+    if magic != MAGIC or version != VERSION:
+        raise ProtocolError("Not a 0xGuard export frame (bad magic or version)")
+    if length > MAX_FRAME:
+        raise ProtocolError(f"Frame of {length} bytes exceeds the {MAX_FRAME} byte limit")
+    return frame_type, flags, length
+
+
+def frame_payload(flags, payload):
+    """Undoes the frame's compression. Raises ProtocolError."""
+    if flags & FLAG_ZLIB:
+        try:
+            return zlib.decompress(payload)
+        except zlib.error as e:
+            raise ProtocolError(f"Bad compressed payload: {e}") from None
+    return payload
+
+
+def read_frame(sock):
+    """Blocking read of one frame from a socket: (type, payload), or None at EOF."""
+    header = _recv_exactly(sock, FRAME_HEADER_SIZE)
+    if header is None:
+        return None
+    frame_type, flags, length = parse_frame_header(header)
+    payload = _recv_exactly(sock, length) if length else b""
+    if payload is None:
+        return None
+    return frame_type, frame_payload(flags, payload)
+
+
+def _recv_exactly(sock, n):
+    data = bytearray()
+    while len(data) < n:
+        chunk = sock.recv(n - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return bytes(data)
+
+
+# --- MESSAGES ---
+def encode_hello(sensor, session, columns=EXPORT_COLUMNS):
+    return json.dumps({"sensor": sensor, "session": session, "columns": list(columns)}).encode()
+
+
+def decode_hello(payload):
+    try:
+        hello = json.loads(payload)
+        return str(hello["sensor"]), str(hello["session"]), list(hello["columns"])
+    except (ValueError, KeyError, TypeError) as e:
+        raise ProtocolError(f"Bad HELLO: {e}") from None
+
+
+def encode_batch(seq, windows):
+    """BATCH payload for [(window_end, matrix, flow_keys), ...]."""
+    rows = [len(matrix) for _, matrix, _ in windows]
+    parts = [_BATCH.pack(seq, len(windows), sum(rows))]
+    parts += [_WINDOW.pack(window_end, n) for (window_end, _, _), n in zip(windows, rows)]
+    parts.append(encode_columns(np.concatenate([matrix for _, matrix, _ in windows])))
+    for name, dtype in (("src", "<u4"), ("dst", "<u4"), ("dst_port", "<u2"), ("proto", "u1")):
+        parts.append(np.concatenate([np.asarray(getattr(keys, name), dtype=dtype)
+                                     for _, _, keys in windows]).tobytes())
+    return b"".join(parts)
+
+
+def decode_batch(payload, n_cols=None):
+    """BATCH payload -> Batch. Raises ProtocolError."""
+    try:
+        seq, n_windows, n_rows = _BATCH.unpack_from(payload)
+        offset = _BATCH.size
+        windows = [_WINDOW.unpack_from(payload, offset + i * _WINDOW.size) for i in range(n_windows)]
+        offset += n_windows * _WINDOW.size
+        if sum(rows for _, rows in windows) != n_rows:
+            raise ProtocolError("Window row counts do not add up to the batch")
+
+        cols = payload[offset + 5] if len(payload) > offset + 5 else 0  # n_cols byte of the columns header
+        size = COLUMNS_HEADER_SIZE + 4 * cols * n_rows
+        matrix = decode_columns(payload[offset:offset + size], n_cols)
+        if len(matrix) != n_rows:
+            raise ProtocolError(f"Expected {n_rows} feature rows, got {len(matrix)}")
+        offset += size
+
+        keys = {}
+        for name, dtype in (("src", "<u4"), ("dst", "<u4"), ("dst_port", "<u2"), ("proto", "u1")):
+            keys[name] = np.frombuffer(payload, dtype=dtype, count=n_rows, offset=offset)
+            offset += keys[name].nbytes
+        if offset != len(payload):
+            raise ProtocolError(f"{len(payload) - offset} trailing bytes after the flow keys")
+    except (struct.error, ValueError) as e:
+        if isinstance(e, ProtocolError):
+            raise
+        raise ProtocolError(f"Bad BATCH: {e}") from None
+    return Batch(seq, windows, matrix, FlowKeys(**keys))
+
+
+def encode_ack(seq, rows, block_ips=()):
+    block = np.asarray(block_ips, dtype="<u4")
+    return _ACK.pack(seq, rows, len(block)) + block.tobytes()
+
+
+def decode_ack(payload):
+    """ACK payload -> (seq, rows, packed source IPs to block)."""
+    try:
+        seq, rows, n_block = _ACK.unpack_from(payload)
+        block = np.frombuffer(payload, dtype="<u4", count=n_block, offset=_ACK.size)
+    except (struct.error, ValueError) as e:
+        raise ProtocolError(f"Bad ACK: {e}") from None
+    return seq, rows, block
+
+
+def parse_address(address):
+    """'unix:/path' -> (AF_UNIX, path); 'host:port' -> (AF_INET, (host, port))."""
+    if address.startswith("unix:"):
+        return socket.AF_UNIX, address[5:]
+    host, _, port = address.rpartition(":")
+    if not host or not port.isdigit():
+        raise ValueError(f"Bad export address {address!r} (expected host:port or unix:/path)")
+    return socket.AF_INET, (host.strip("[]"), int(port))
+
+
+# --- SENSOR SIDE ---
+class FlowExporter:
+    """
+    Ships per-window feature matrices and flow keys to a collector.
+
+    The analysis thread only calls export(), which appends the window to a
+    bounded buffer. A sender thread keeps one connection open (reconnecting
+    with exponential backoff), packs the windows waiting in the buffer into
+    batches of up to max_batch_rows rows (waiting up to flush_interval for a
+    small batch to fill) and keeps at most max_inflight batches unacknowledged.
+    Unacknowledged batches are resent after a reconnect. The buffer holds at
+    most max_buffer_rows rows, sent or not; beyond that the oldest unsent
+    windows are dropped and counted.
+
+    ACKs name the sources the collector wants blocked; they are passed to
+    on_block(ip) on the receiver thread.
+    """
+
+    def __init__(self, address, sensor=None, max_batch_rows=65536, flush_interval=0.5,
+                 max_buffer_rows=1_000_000, max_inflight=4, compress_level=1, on_block=None,
+                 connect_timeout=5.0, max_backoff=30.0):
+        self.address = address
+        self.family, self.target = parse_address(address)
+        self.sensor = sensor or socket.gethostname()
+        self.session = os.urandom(8).hex()  # Lets the collector tell our resends from a restart
+        self.max_batch_rows = max_batch_rows
+        self.flush_interval = flush_interval
+        self.max_buffer_rows = max_buffer_rows
+        self.max_inflight = max_inflight
+        self.compress_level = compress_level
+        self.on_block = on_block
+        self.connect_timeout = connect_timeout
+        self.max_backoff = max_backoff
+
+        self._lock = threading.Condition()
+        self._pending = deque()  # (window_end, matrix, flow_keys, queued_at)
+        self._pending_rows = 0
+        self._unacked = {}  # seq -> (frame, rows), in send order
+        self._unacked_rows = 0
+        self._seq = 0
+        self._sock = None
+        self._stop = threading.Event()
+        self._thread = None
+
+        # Counters for reporting
+        self.exported_rows = 0
+        self.sent_batches = 0
+        self.sent_rows = 0
+        self.acked_rows = 0
+        self.dropped_rows = 0
+        self.raw_bytes = 0  # Uncompressed BATCH payloads
+        self.sent_bytes = 0  # Frames on the wire (resends included)
+        self.reconnects = 0
+        self.blocks = 0
+
+    def __len__(self):
+        """Rows buffered: waiting to be sent or to be acknowledged."""
+        return self._pending_rows + self._unacked_rows
+
+    @property
+    def connected(self):
+        return self._sock is not None
+
+    # --- HOT PATH (analysis thread) ---
+    def export(self, window_end, matrix, flow_keys):
+        """Buffers one window's features ((n, columns) array) and FlowKeys. Never blocks on the network."""
+        if len(matrix) == 0:
+            return
+        with self._lock:
+            self._pending.append((window_end, matrix, flow_keys, time.monotonic()))
+            self._pending_rows += len(matrix)
+            self.exported_rows += len(matrix)
+            while len(self) > self.max_buffer_rows and self._pending:
+                _, dropped, _, _ = self._pending.popleft()
+                self._pending_rows -= len(dropped)
+                self.dropped_rows += len(dropped)
+            self._lock.notify()
+
+    # --- LIFECYCLE ---
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="0xguard-export", daemon=True)
+        self._thread.start()
+
+    def close(self, timeout=5.0):
+        """Sends what is buffered (for up to `timeout` seconds while connected), then disconnects."""
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            while len(self) and self._sock is not None and time.monotonic() < deadline:
+                self._lock.wait(0.05)
+            self._stop.set()
+            self._lock.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if len(self):
+            logger.warning(f"Flow export closed with {len(self)} rows not acknowledged by {self.address}")
+
+    # --- SENDER ---
+    def _run(self):
+        backoff = 0.5
+        while not self._stop.is_set():
+            if self._sock is None:
+                try:
+                    self._connect()
+                    backoff = 0.5
+                except OSError as e:
+                    logger.warning(f"Flow export: cannot reach {self.address} ({e}); retrying in {backoff:.1f}s")
+                    self._stop.wait(backoff)
+                    backoff = min(backoff * 2, self.max_backoff)
+                    continue
+
+            with self._lock:
+                frame = self._next_batch()
+                sock = self._sock
+            if frame is None or sock is None:
+                continue
+            try:
+                sock.sendall(frame)
+                self.sent_bytes += len(frame)
+            except OSError as e:
+                self._disconnect(sock, f"send failed: {e}")
+        if self._sock is not None:
+            self._disconnect(self._sock, "closed")
+
+    def _connect(self):
+        sock = socket.socket(self.family, socket.SOCK_STREAM)
+        try:
+            sock.settimeout(self.connect_timeout)
+            sock.connect(self.target)
+            sock.settimeout(None)
+            if self.family == socket.AF_INET:
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            # Resend what the previous connection left unacknowledged, oldest first
+            with self._lock:
+                resend = [frame for frame, _ in self._unacked.values()]
+            data = encode_frame(HELLO, encode_hello(self.sensor, self.session)) + b"".join(resend)
+            sock.sendall(data)
+            self.sent_bytes += len(data)
+        except OSError:
+            sock.close()
+            raise
+        if self.sent_batches:
+            self.reconnects += 1
+        logger.info(f"Flow export connected to {self.address}"
+                    + (f" ({len(resend)} batches resent)" if resend else ""))
+        with self._lock:
+            self._sock = sock
+        threading.Thread(target=self._receive, args=(sock,), name="0xguard-export-acks", daemon=True).start()
+
+    def _next_batch(self):
+        """Called with the lock held: the next BATCH frame, or None after waiting."""
+        if len(self._unacked) >= self.max_inflight or not self._pending:
+            self._lock.wait(self.flush_interval)
+            return None
+        waited = time.monotonic() - self._pending[0][3]
+        if self._pending_rows < self.max_batch_rows and waited < self.flush_interval and not self._stop.is_set():
+            self._lock.wait(self.flush_interval - waited)
+            return None
+
+        windows, rows = [], 0
+        while self._pending and (not windows or rows + len(self._pending[0][1]) <= self.max_batch_rows):
+            window_end, matrix, flow_keys, _ = self._pending.popleft()
+            windows.append((window_end, matrix, flow_keys))
+            rows += len(matrix)
+        self._pending_rows -= rows
+
+        self._seq += 1
+        payload = encode_batch(self._seq, windows)
+        frame = encode_frame(BATCH, payload, self.compress_level)
+        self._unacked[self._seq] = (frame, rows)
+        self._unacked_rows += rows
+        self.sent_batches += 1
+        self.sent_rows += rows
+        self.raw_bytes += len(payload)
+        return frame
+
+    def _receive(self, sock):
+        try:
+            while True:
+                message = read_frame(sock)
+                if message is None:
+                    raise OSError("collector closed the connection")
+                frame_type, payload = message
+                if frame_type != ACK:
+                    raise ProtocolError(f"Unexpected frame type {frame_type}")
+                seq, rows, block = decode_ack(payload)
+                with self._lock:
+                    entry = self._unacked.pop(seq, None)
+                    if entry is not None:
+                        self._unacked_rows -= entry[1]
+                        self.acked_rows += entry[1]
+                    self._lock.notify_all()
+                for ip in block:
+                    self.blocks += 1
+                    if self.on_block is not None:
+                        self.on_block(unpack_ip(ip))
+        except (OSError, ProtocolError) as e:
+            self._disconnect(sock, str(e))
+
+    def _disconnect(self, sock, reason):
+        with self._lock:
+            if self._sock is not sock:
+                return  # Already handled by the other thread
+            self._sock = None
+            self._lock.notify_all()
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        sock.close()
+        if not self._stop.is_set():
+            logger.warning(f"Flow export to {self.address} lost: {reason}")
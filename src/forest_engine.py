@@ -0,0 +1,250 @@
+import hashlib
+import json
+import mmap
+import os
+import struct
+import numpy as np
+
+# Flat-array scoring engine for a fitted sklearn IsolationForest.
+#
+# Every tree is flattened into shared contiguous arrays (feature,
+# threshold, child pairs, leaf path length) and all trees are walked
+# together, level by level, with NumPy gathers. One pass yields both the
+# anomaly score (decision_function) and the label (predict), instead of
+# sklearn walking every tree once per method.
+#
+# Compiled forests can be saved as a flat artifact (ARTIFACT_MAGIC, a JSON
+# header, then 64-byte aligned raw arrays). open() memory-maps it read-only,
+# so every process scoring with the same file shares one copy in the page
+# cache. The header records the digest of the pickle it was compiled from
+# (`source`), which tells a stale artifact from a fresh one regardless of
+# file mtimes.
+
+ARTIFACT_MAGIC = b"0XGMODL1"
+ARTIFACT_ALIGN = 64
+_ARRAYS = ("feature", "threshold", "children", "leaf_depth", "roots")
+_HEADER_LEN = struct.Struct("<I")
+
+
+def file_digest(path):
+    """SHA-1 of a file's contents (hex), e.g. the pickle an artifact was compiled from."""
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def read_header(path):
+    """The JSON header of a flat artifact, without mapping its arrays."""
+    with open(path, "rb") as f:
+        prefix = f.read(len(ARTIFACT_MAGIC) + _HEADER_LEN.size)
+        if prefix[:len(ARTIFACT_MAGIC)] != ARTIFACT_MAGIC:
+            raise ValueError(f"{path}: not a 0xGuard model artifact")
+        return json.loads(f.read(_HEADER_LEN.unpack_from(prefix, len(ARTIFACT_MAGIC))[0]))
+
+
+def average_path_length(n):
+    """c(n): average path length of an unsuccessful BST search (iForest paper)."""
+    n = np.asarray(n, dtype=np.float64)
+    out = np.zeros_like(n)
+    out[n == 2] = 1.0
+    big = n > 2
+    out[big] = 2.0 * (np.log(n[big] - 1.0) + np.euler_gamma) - 2.0 * (n[big] - 1.0) / n[big]
+    return out
+
+
+class FlatForest:
+    """Isolation Forest compiled to flat arrays. Build with from_model()."""
+
+    CHUNK_ROWS = 256  # Keeps the (rows x trees) working set cache-sized
+
+    def __init__(self, feature, threshold, children, leaf_depth, roots,
+                 max_depth, denominator, offset, n_features, feature_names=None, version=None, source=None):
+        self.feature = feature
+        self.threshold = threshold
+        self.children = children  # [2*node] = left child, [2*node + 1] = right
+        self.leaf_depth = leaf_depth
+        self.roots = roots
+        self.max_depth = max_depth
+        self.denominator = denominator
+        self.offset = offset
+        self.n_features = n_features
+        self.feature_names = feature_names
+        self.version = version or self._fingerprint()
+        self.source = source  # file_digest() of the pickle compiled from, if known
+
+    @classmethod
+    def from_model(cls, model):
+        features, thresholds, children, depths, roots = [], [], [], [], []
+        base = 0
+        max_depth = 0
+        for tree, subset in zip(model.estimators_, model.estimators_features_):
+            t = tree.tree_
+            n = t.node_count
+            is_leaf = t.children_left == -1
+            ids = np.arange(n)
+
+            # Leaves point at themselves and never compare greater, so every
+            # row can take max_depth steps without branching on leafness.
+            feat = np.where(is_leaf, 0, np.asarray(subset)[np.maximum(t.feature, 0)])
+            thr = np.where(is_leaf, np.inf, t.threshold)
+            left = np.where(is_leaf, ids, t.children_left) + base
+            right = np.where(is_leaf, ids, t.children_right) + base
+
+            node_depth = np.zeros(n, dtype=np.float64)
+            for node in range(n):  # Children always follow their parent
+                if not is_leaf[node]:
+                    node_depth[t.children_left[node]] = node_depth[node] + 1
+                    node_depth[t.children_right[node]] = node_depth[node] + 1
+            # Path length = edges to the leaf + c(samples left in the leaf)
+            leaf_depth = np.where(is_leaf, node_depth + average_path_length(t.n_node_samples), 0.0)
+
+            features.append(feat)
+            thresholds.append(thr)
+            children.append(np.stack([left, right], axis=1).ravel())
+            depths.append(leaf_depth)
+            roots.append(base)
+            max_depth = max(max_depth, t.max_depth)
+            base += n
+
+        max_samples = getattr(model, "_max_samples", model.max_samples_)
+        denominator = len(model.estimators_) * float(average_path_length([max_samples])[0])
+        return cls(
+            feature=np.concatenate(features).astype(np.intp),
+            threshold=np.concatenate(thresholds).astype(np.float64),
+            children=np.concatenate(children).astype(np.intp),
+            leaf_depth=np.concatenate(depths),
+            roots=np.asarray(roots, dtype=np.intp),
+            max_depth=max_depth,
+            denominator=denominator,
+            offset=float(model.offset_),
+            n_features=int(model.n_features_in_),
+            feature_names=list(getattr(model, "feature_names_in_", [])) or None
+        )
+
+    @classmethod
+    def load(cls, path):
+        """Loads a pickled IsolationForest and compiles it."""
+        import joblib  # Pickle fallback only; the flat artifact needs neither joblib nor sklearn
+        flat = cls.from_model(joblib.load(path))
+        flat.source = file_digest(path)
+        return flat
+
+    # --- SHARED ARTIFACT ---
+    def _fingerprint(self):
+        digest = hashlib.sha1()
+        for name in _ARRAYS:
+            digest.update(np.ascontiguousarray(getattr(self, name)).tobytes())
+        digest.update(repr((self.max_depth, self.denominator, self.offset)).encode())
+        return digest.hexdigest()[:12]
+
+    def save(self, path):
+        """Writes the flat artifact atomically (readers never see a partial file)."""
+        arrays = {}
+        offset = 0
+        for name in _ARRAYS:
+            data = np.ascontiguousarray(getattr(self, name))
+            arrays[name] = {"dtype": data.dtype.str, "shape": list(data.shape), "offset": offset}
+            offset += -(-data.nbytes // ARTIFACT_ALIGN) * ARTIFACT_ALIGN
+        header = json.dumps({
+            "version": self.version,
+            "max_depth": int(self.max_depth),
+            "denominator": self.denominator,
+            "offset": self.offset,
+            "n_features": self.n_features,
+            "feature_names": self.feature_names,
+            "source": self.source,
+            "arrays": arrays
+        }).encode()
+        prefix = len(ARTIFACT_MAGIC) + _HEADER_LEN.size + len(header)
+        data_start = -(-prefix // ARTIFACT_ALIGN) * ARTIFACT_ALIGN
+
+        tmp_path = f"{path}.tmp{os.getpid()}"
+        with open(tmp_path, "wb") as f:
+            f.write(ARTIFACT_MAGIC + _HEADER_LEN.pack(len(header)) + header)
+            for name in _ARRAYS:
+                f.seek(data_start + arrays[name]["offset"])
+                f.write(np.ascontiguousarray(getattr(self, name)).tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def open(cls, path):
+        """Memory-maps a flat artifact read-only; arrays are views of the mapping."""
+        with open(path, "rb") as f:
+            mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if mapping[:len(ARTIFACT_MAGIC)] != ARTIFACT_MAGIC:
+            mapping.close()
+            raise ValueError(f"{path}: not a 0xGuard model artifact")
+        pos = len(ARTIFACT_MAGIC)
+        header_len = _HEADER_LEN.unpack_from(mapping, pos)[0]
+        pos += _HEADER_LEN.size
+        header = json.loads(mapping[pos:pos + header_len])
+        data_start = -(-(pos + header_len) // ARTIFACT_ALIGN) * ARTIFACT_ALIGN
+
+        arrays = {}
+        for name, spec in header["arrays"].items():
+            dtype = np.dtype(spec["dtype"])
+            count = int(np.prod(spec["shape"]))
+            arrays[name] = np.frombuffer(mapping, dtype=dtype, count=count,
+                                         offset=data_start + spec["offset"]).reshape(spec["shape"])
+        return cls(
+            max_depth=header["max_depth"],
+            denominator=header["denominator"],
+            offset=header["offset"],
+            n_features=header["n_features"],
+            feature_names=header["feature_names"],
+            version=header["version"],
+            source=header.get("source"),  # Absent in artifacts exported before it was recorded
+            **arrays
+        )
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    # --- SCORING ---
+    def _as_matrix(self, X):
+        if self.feature_names is not None and hasattr(X, "columns"):
+            X = X[self.feature_names]
+        # sklearn's trees compare float32 inputs against float64 thresholds
+        return np.asarray(X, dtype=np.float32).reshape(-1, self.n_features)
+
+    def _path_lengths(self, X):
+        if len(X) == 1:
+            # Small-batch fast path: walk all trees as one 1-D vector
+            row = X[0]
+            node = self.roots
+            for _ in range(self.max_depth):
+                node = self.children[2 * node + (row[self.feature[node]] > self.threshold[node])]
+            return np.array([self.leaf_depth[node].sum()])
+
+        flat = X.ravel()
+        row_base = (np.arange(len(X)) * self.n_features)[:, None]
+        node = np.broadcast_to(self.roots, (len(X), self.n_trees))
+        for _ in range(self.max_depth):
+            values = flat[row_base + self.feature[node]]
+            node = self.children[2 * node + (values > self.threshold[node])]
+        return self.leaf_depth[node].sum(axis=1)
+
+    def score(self, X):
+        """Returns (decision_function scores, predict labels) in one pass."""
+        X = self._as_matrix(X)
+        depths = np.empty(len(X))
+        for start in range(0, len(X), self.CHUNK_ROWS):
+            depths[start:start + self.CHUNK_ROWS] = self._path_lengths(X[start:start + self.CHUNK_ROWS])
+
+        if self.denominator > 0:
+            scores = -(2.0 ** (-depths / self.denominator)) - self.offset
+        else:
+            scores = np.full(len(X), -1.0 - self.offset)
+        labels = np.where(scores < 0, -1, 1)
+        return scores, labels
+
+    def decision_function(self, X):
+        return self.score(X)[0]
+
+    def predict(self, X):
+        return self.score(X)[1]
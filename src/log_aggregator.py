@@ -0,0 +1,149 @@
+import calendar
+import os
+import threading
+import time
+from collections import deque
+import numpy as np
+import pandas as pd
+
+LOG_COLUMNS = ["Timestamp", "Source_IP", "Risk_Level", "Action", "Protocol", "Anomaly_Score"]
+READ_CHUNK = 8 << 20  # Bytes parsed per read when catching up on a large log
+
+
+class LogAggregator:
+    """
+    Incrementally tails the security CSV log and keeps the dashboard's
+    aggregates up to date.
+
+    refresh() reads only the bytes appended since the last call (from a
+    remembered offset) and folds the new rows into running counters, a
+    fixed ring of per-minute buckets and the latest rows, so its cost
+    follows the number of new events, not the size of the log. The open
+    file is tracked by inode: once the path names a new file, the old
+    handle is read to its end before switching, so lines written just
+    before a rotation are kept; a truncated log is re-read from the start.
+    Thread-safe, so one instance can serve every dashboard session.
+    """
+
+    def __init__(self, path, minutes=120, recent_rows=15):
+        self.path = path
+        self.minutes = minutes
+        self.lock = threading.Lock()
+
+        self._file = None
+        self._inode = None
+        self._partial = b""
+        self._minute_cache = {}
+
+        # Aggregates
+        self.total = 0
+        self.blocked = 0
+        self.critical = 0
+        self.last_event = None
+        self.latest_minute = None
+        self.bucket_minute = np.full(minutes, -1, dtype=np.int64)  # Minute held by each slot
+        self.bucket_count = np.zeros(minutes, dtype=np.int64)
+        self.recent = deque(maxlen=recent_rows)
+
+    # --- TAILING ---
+    def refresh(self):
+        """Folds newly appended log lines into the aggregates. Returns rows added."""
+        with self.lock:
+            added = 0
+            try:
+                st = os.stat(self.path)
+            except FileNotFoundError:
+                st = None  # Mid-rotation: keep reading the old handle
+
+            if self._file is not None:
+                if st is not None and st.st_ino != self._inode:
+                    # Rotated: the path names a new file, so the writer is done
+                    # with the old one. Read our handle of it to its end first.
+                    added += self._drain()
+                    self._file.close()
+                    self._file = None
+                elif st is not None and st.st_size < self._file.tell():
+                    # Truncated in place: start over
+                    self._file.seek(0)
+                    self._partial = b""
+            if self._file is None:
+                if st is None:
+                    return added
+                self._open()
+            added += self._drain()
+            return added
+
+    def _open(self):
+        self._file = open(self.path, "rb")
+        self._inode = os.fstat(self._file.fileno()).st_ino
+        self._partial = b""
+
+    def _drain(self):
+        added = 0
+        while True:
+            chunk = self._file.read(READ_CHUNK)
+            if not chunk:
+                return added
+            data = self._partial + chunk
+            end = data.rfind(b"\n") + 1
+            self._partial = data[end:]  # Incomplete last line waits for the writer
+            if end:
+                added += self._ingest(data[:end].decode("utf-8", "replace").splitlines())
+
+    def _minute(self, stamp):
+        """'YYYY-mm-dd HH:MM:SS' -> minutes since the epoch (wall clock, cached per minute)."""
+        key = stamp[:16]
+        minute = self._minute_cache.get(key)
+        if minute is None:
+            if len(self._minute_cache) > 4 * self.minutes:
+                self._minute_cache.clear()
+            minute = calendar.timegm(time.strptime(key, "%Y-%m-%d %H:%M")) // 60
+            self._minute_cache[key] = minute
+        return minute
+
+    def _ingest(self, lines):
+        added = 0
+        for line in lines:
+            fields = line.split(",")
+            if len(fields) != len(LOG_COLUMNS) or fields[0] == "Timestamp":
+                continue  # Header or malformed line
+            try:
+                minute = self._minute(fields[0])
+            except ValueError:
+                continue
+
+            self.total += 1
+            self.blocked += fields[3] == "BLOCKED"
+            self.critical += fields[2] == "CRITICAL"
+            self.last_event = fields[0]
+            self.recent.append(fields)
+
+            if self.latest_minute is None or minute > self.latest_minute:
+                self.latest_minute = minute
+            if minute > self.latest_minute - self.minutes:  # Older than the ring: counters only
+                slot = minute % self.minutes
+                if self.bucket_minute[slot] != minute:
+                    self.bucket_minute[slot] = minute
+                    self.bucket_count[slot] = 0
+                self.bucket_count[slot] += 1
+            added += 1
+        return added
+
+    # --- VIEWS ---
+    def per_minute(self):
+        """Events per minute for the last `minutes` minutes up to the latest event."""
+        with self.lock:
+            if self.latest_minute is None:
+                return pd.Series(dtype=np.int64, name="Events")
+            minutes = np.arange(self.latest_minute - self.minutes + 1, self.latest_minute + 1)
+            slots = minutes % self.minutes
+            counts = np.where(self.bucket_minute[slots] == minutes, self.bucket_count[slots], 0)
+        first = np.argmax(counts > 0)  # Start the chart at the first event in range
+        index = pd.to_datetime(minutes[first:], unit="m")
+        return pd.Series(counts[first:], index=index, name="Events")
+
+    def latest(self):
+        """The most recent rows, newest first."""
+        with self.lock:
+            rows = list(self.recent)[::-1]
+        return pd.DataFrame(rows, columns=LOG_COLUMNS)
@@ -0,0 +1,405 @@
+import cProfile
+import io
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter as Tally
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+logger = logging.getLogger("0xGuard")
+
+# In-process metrics in the Prometheus text exposition format (no client
+# library needed). Metrics are registered once per process by name;
+# observe()/inc() take a short lock, and callback metrics (set_function)
+# read the components' own "counters for reporting" only at scrape time,
+# so nothing is added to the hot paths beyond the stage timers.
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+                   0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (1, 4, 16, 64, 256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(pairs):
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """Base class: one named metric with optional label dimensions."""
+
+    kind = "untyped"
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labels)
+        self._lock = threading.Lock()
+        self._values = {}  # label values -> value
+        self._functions = {}  # label values -> callable read at scrape time
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def set_function(self, fn, **labels):
+        """Reports fn() at every scrape (for state owned by another component)."""
+        with self._lock:
+            self._functions[self._key(labels)] = fn
+
+    def samples(self):
+        """(suffix, label pairs, value) per exported series."""
+        with self._lock:
+            values = dict(self._values)
+            functions = list(self._functions.items())
+        for key, fn in functions:
+            try:
+                values[key] = fn()
+            except Exception as e:  # A failing callback must not break the scrape
+                logger.debug(f"Metric {self.name} callback failed: {e}")
+        for key, value in sorted(values.items()):
+            yield "", list(zip(self.labelnames, key)), value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, pairs, value in self.samples():
+            lines.append(f"{self.name}{suffix}{_format_labels(pairs)} {_format_value(value)}")
+        return lines
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, value=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(Metric):
+    """Cumulative-bucket histogram (le = upper bound, seconds or counts)."""
+
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def totals(self, label):
+        """Sum of observations per value of one label, e.g. seconds per stage."""
+        out = {}
+        with self._lock:
+            for key, (_, total) in self._values.items():
+                name = key[self.labelnames.index(label)]
+                out[name] = out.get(name, 0.0) + total
+        return out
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self):
+        with self._lock:
+            values = [(key, list(counts), total) for key, (counts, total) in sorted(self._values.items())]
+        for key, counts, total in values:
+            pairs = list(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                yield "_bucket", pairs + [("le", _format_value(float(bound)))], cumulative
+            yield "_sum", pairs, total
+            yield "_count", pairs, cumulative
+
+
+class Registry:
+    """Metrics of one process, rendered together for a /metrics scrape."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, help_text, labels, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help_text, labels, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} already registered as a {metric.kind}")
+            return metric
+
+    def counter(self, name, help_text, labels=()):
+        return self._get(Counter, name, help_text, labels)
+
+    def gauge(self, name, help_text, labels=()):
+        return self._get(Gauge, name, help_text, labels)
+
+    def histogram(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        return self._get(Histogram, name, help_text, labels, buckets=buckets)
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+counter = REGISTRY.counter
+gauge = REGISTRY.gauge
+histogram = REGISTRY.histogram
+
+# Shared by the agent and the API
+STAGE_SECONDS = histogram("oxguard_stage_seconds", "Latency of one pipeline stage call", ["stage"])
+INFERENCE_ROWS = histogram("oxguard_inference_batch_rows", "Rows per model scoring call", buckets=SIZE_BUCKETS)
+
+
+# --- PROFILING ---
+class Profiler:
+    """
+    Profiler that can be switched on and off while the process runs.
+
+    "sample": a background thread records every thread's stack each
+    `interval` seconds; the report is collapsed stacks with their counts
+    (flamegraph.pl / speedscope input), cheap enough for production.
+    "cprofile": deterministic cProfile of the instrumented stages (see
+    stage()), one profile per thread, merged into one report on stop.
+    From Python 3.12 a single cProfile covers every thread instead.
+    """
+
+    MODES = ("sample", "cprofile")
+    SHARED_CPROFILE = sys.version_info >= (3, 12)  # cProfile is process-wide on sys.monitoring
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.mode = None
+        self.started = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._profiles = []
+        self._stacks = Tally()
+        self._samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self, mode="sample"):
+        """Starts profiling; returns False if a profile is already running."""
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown profiler mode {mode!r} (choose from {', '.join(self.MODES)})")
+        with self._lock:
+            if self.mode is not None:
+                return False
+            self._profiles = []
+            self._stacks = Tally()
+            self._samples = 0
+            self._local = threading.local()
+            self.started = time.time()
+            if mode == "sample":
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._sample_loop, name="0xguard-profiler", daemon=True)
+                self._thread.start()
+            elif self.SHARED_CPROFILE:
+                profile = cProfile.Profile()
+                profile.enable()
+                self._profiles.append(profile)
+            self.mode = mode
+        logger.info(f"Profiler started ({mode})")
+        return True
+
+    def stop(self, limit=40):
+        """Stops profiling and returns the report text (None if nothing was running)."""
+        with self._lock:
+            mode, self.mode = self.mode, None
+            if mode is None:
+                return None
+            if mode == "sample":
+                self._stop.set()
+                thread, self._thread = self._thread, None
+            profiles = self._profiles
+        elapsed = time.time() - self.started
+        if mode == "sample":
+            thread.join()
+            lines = [f"# {self._samples} samples over {elapsed:.1f}s (every {self.interval * 1000:g} ms)"]
+            lines += [f"{stack} {count}" for stack, count in self._stacks.most_common()]
+            report = "\n".join(lines) + "\n"
+        else:
+            out = io.StringIO()
+            if profiles:
+                if self.SHARED_CPROFILE:
+                    profiles[0].disable()  # Per-thread profiles are only enabled inside stage()
+                stats = pstats.Stats(*profiles, stream=out)
+                stats.sort_stats("cumulative").print_stats(limit)
+            else:
+                out.write("No instrumented stage ran while profiling.\n")
+            report = f"# cProfile over {elapsed:.1f}s\n" + out.getvalue()
+        logger.info(f"Profiler stopped ({mode}, {elapsed:.1f}s)")
+        return report
+
+    def thread_profile(self):
+        """This thread's cProfile while a per-thread cProfile session runs, else None."""
+        if self.mode != "cprofile" or self.SHARED_CPROFILE:
+            return None
+        profile = getattr(self._local, "profile", None)
+        if profile is None:
+            profile = self._local.profile = cProfile.Profile()
+            with self._lock:
+                self._profiles.append(profile)
+        return profile
+
+    def _sample_loop(self):
+        me = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                if ident not in names:
+                    names = {thread.ident: thread.name for thread in threading.enumerate()}
+                stack.append(names.get(ident, str(ident)))
+                self._stacks[";".join(reversed(stack))] += 1
+            self._samples += 1
+
+
+PROFILER = Profiler()
+
+
+@contextmanager
+def stage(name):
+    """Times one pipeline stage into STAGE_SECONDS (and profiles it in cprofile mode)."""
+    profile = PROFILER.thread_profile()
+    if profile is not None:
+        profile.enable()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - started, stage=name)
+        if profile is not None:
+            profile.disable()
+
+
+def profile_request(action, query):
+    """
+    Shared handler for the profiling endpoints:
+    /debug/profile/start?mode=sample|cprofile and /debug/profile/stop.
+    Returns (HTTP status, text).
+    """
+    if action == "start":
+        mode = query.get("mode", "sample")
+        try:
+            started = PROFILER.start(mode)
+        except ValueError as e:
+            return 400, f"{e}\n"
+        return (200, f"Profiling ({mode}). Stop with /debug/profile/stop\n") if started \
+            else (409, f"A {PROFILER.mode} profile is already running\n")
+    if action == "stop":
+        report = PROFILER.stop()
+        return (200, report) if report is not None else (409, "No profile running\n")
+    return 404, "Unknown profiling action\n"
+
+
+# --- EMBEDDED ENDPOINT ---
+class MetricsServer:
+    """
+    Small HTTP server for processes without a web framework (main.py):
+    GET /metrics, plus the profiling endpoints when `profiling` is on.
+    Serves from a daemon thread; bind to localhost unless a scraper on
+    another host needs it.
+    """
+
+    def __init__(self, port=9108, host="127.0.0.1", registry=REGISTRY, profiling=True):
+        self.host = host
+        self.port = port
+        self.registry = registry
+        self.profiling = profiling
+        self._server = None
+        self._thread = None
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _reply(self, status, body, content_type="text/plain; charset=utf-8"):
+                data = body.encode()
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                if url.path == "/metrics":
+                    self._reply(200, server.registry.render(), CONTENT_TYPE)
+                elif server.profiling and url.path.startswith("/debug/profile/"):
+                    query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+                    self._reply(*profile_request(url.path.rsplit("/", 1)[-1], query))
+                else:
+                    self._reply(404, "Not found\n")
+
+            do_POST = do_GET
+
+            def log_message(self, format, *args):
+                logger.debug(f"metrics endpoint: {format % args}")
+
+        return Handler
+
+    def start(self):
+        self._server = ThreadingHTTPServer((self.host, self.port), self._handler())
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]  # Resolved when started on port 0
+        self._thread = threading.Thread(target=self._server.serve_forever, name="0xguard-metrics", daemon=True)
+        self._thread.start()
+        logger.info(f"Metrics on http://{self.host}:{self.port}/metrics")
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+            self._thread.join()
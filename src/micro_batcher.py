@@ -0,0 +1,88 @@
+import asyncio
+from collections import deque
+import numpy as np
+from starlette.concurrency import run_in_threadpool
+
+
+class MicroBatcher:
+    """
+    Coalesces concurrent single-flow scoring requests into matrix calls.
+
+    Callers await submit(row). A single worker task scores whatever is
+    queued, up to max_batch rows, in one call on the threadpool; rows that
+    arrive while a batch is being scored form the next one, so batch size
+    follows load. Under light load a lone request is scored immediately;
+    once the previous batch held more than one row, the worker waits up
+    to max_wait_ms for more rows before scoring.
+    """
+
+    def __init__(self, score_fn, max_wait_ms=2.0, max_batch=256):
+        self.score_fn = score_fn
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_batch = max_batch
+        self._pending = deque()
+        self._wake = None
+        self._full = None
+        self._task = None
+        self._loop = None
+        self._last_batch = 0
+
+        # Counters for reporting
+        self.batches = 0
+        self.rows = 0
+
+    async def submit(self, row):
+        """Queues one feature row and returns its score."""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # First call, or the app now runs on a new event loop
+            self._start(loop)
+        future = loop.create_future()
+        self._pending.append((row, future))
+        if len(self._pending) >= self.max_batch:
+            self._full.set()
+        self._wake.set()
+        return await future
+
+    def _start(self, loop):
+        self._pending.clear()
+        self._wake = asyncio.Event()
+        self._full = asyncio.Event()
+        self._loop = loop
+        self._task = loop.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await self._wake.wait()
+            self._wake.clear()
+            if not self._pending:
+                continue
+
+            if self._last_batch > 1 and len(self._pending) < self.max_batch and self.max_wait > 0:
+                try:
+                    await asyncio.wait_for(self._full.wait(), self.max_wait)
+                except asyncio.TimeoutError:
+                    pass
+            self._full.clear()
+
+            batch = [self._pending.popleft() for _ in range(min(len(self._pending), self.max_batch))]
+            if self._pending:
+                self._wake.set()
+            self._last_batch = len(batch)
+            await self._score(batch)
+
+    async def _score(self, batch):
+        try:
+            matrix = np.array([row for row, _ in batch], dtype=np.float64)
+            scores = await run_in_threadpool(self.score_fn, matrix)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        self.batches += 1
+        self.rows += len(batch)
+        for (_, future), score in zip(batch, scores):
+            if not future.done():  # Caller may have gone away
+                future.set_result(float(score))
@@ -0,0 +1,129 @@
+import logging
+import os
+import threading
+import time
+from src.forest_engine import FlatForest, file_digest, read_header
+
+logger = logging.getLogger("0xGuard")
+
+
+class ModelRegistry:
+    """
+    Holds the active scoring model and hot-swaps it when the file changes.
+
+    Prefers the memory-mapped flat artifact (shared across processes) and
+    falls back to compiling the pickled IsolationForest. Both files are
+    watched: a pickle whose digest differs from the one recorded in the
+    artifact (retrained, not re-exported) is loaded instead, with a
+    warning. Mtimes are not trusted, since a clone or an image copy resets
+    them. Callers read
+    `current` once per batch and keep that reference, so a swap never
+    changes the model under an in-flight request; the old mapping is
+    released when its last user drops it.
+    """
+
+    def __init__(self, artifact_path, pickle_path=None, poll_interval=5.0):
+        self.artifact_path = artifact_path
+        self.pickle_path = pickle_path
+        self.poll_interval = poll_interval
+
+        self.current = None
+        self.source = None
+        self.loaded_at = None
+        self.load_seconds = None
+        self._stamp = None
+        self._digests = {}  # path -> (file stamp, digest): pickle contents / artifact's recorded source
+        self._warned = None  # Pickle digest already reported as missing from the artifact
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _digest(self, path, read):
+        """read(path), recomputed only when the file changes."""
+        stamp = self._file_stamp(path)
+        cached = self._digests.get(path)
+        if cached is None or cached[0] != stamp:
+            cached = self._digests[path] = (stamp, read(path))
+        return cached[1]
+
+    def _pick_source(self):
+        artifact = os.path.exists(self.artifact_path)
+        pickle = self.pickle_path is not None and os.path.exists(self.pickle_path)
+        if artifact and pickle:
+            exported = self._digest(self.artifact_path, lambda path: read_header(path).get("source"))
+            if exported is None:
+                return self.artifact_path  # Exported before sources were recorded: trust it
+            current = self._digest(self.pickle_path, file_digest)
+            if current == exported:
+                return self.artifact_path
+            if self._warned != current:
+                self._warned = current
+                logger.warning(f"{self.artifact_path} was not exported from the current {self.pickle_path}; "
+                               f"loading the pickle. Run tools/export_model.py to share it memory-mapped again.")
+            return self.pickle_path
+        if artifact:
+            return self.artifact_path
+        if pickle:
+            return self.pickle_path
+        return None
+
+    @staticmethod
+    def _file_stamp(path):
+        st = os.stat(path)
+        return (path, st.st_ino, st.st_size, st.st_mtime_ns)
+
+    def load(self):
+        """Loads (or reloads) the model. Returns True if a new model went live."""
+        path = self._pick_source()
+        if path is None:
+            raise FileNotFoundError(f"No model at {self.artifact_path} or {self.pickle_path}")
+        stamp = self._file_stamp(path)
+        if stamp == self._stamp:
+            return False
+
+        started = time.perf_counter()
+        if path == self.artifact_path:
+            model = FlatForest.open(path)
+        else:
+            model = FlatForest.load(path)
+        elapsed = time.perf_counter() - started
+
+        previous = self.current
+        self.current = model  # Single reference swap: atomic for readers
+        self.source = path
+        self.loaded_at = time.time()
+        self.load_seconds = elapsed
+        self._stamp = stamp
+        if previous is None:
+            logger.info(f"Model {model.version} loaded from {path} in {elapsed * 1000:.1f}ms")
+        else:
+            logger.info(f"Model hot-swapped {previous.version} -> {model.version} "
+                        f"from {path} in {elapsed * 1000:.1f}ms")
+        return True
+
+    def info(self):
+        return {
+            "version": self.current.version if self.current else None,
+            "source": self.source,
+            "loaded_at": self.loaded_at,
+            "load_ms": round(self.load_seconds * 1000, 3) if self.load_seconds is not None else None
+        }
+
+    # --- WATCHER ---
+    def _watch(self):
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self.load()
+            except Exception as e:
+                # Keep serving the current model; try again next poll
+                logger.error(f"Model reload failed: {e}")
+
+    def start(self):
+        """Starts the background watcher thread."""
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._watch, name="0xguard-model-watch", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
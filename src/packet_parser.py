@@ -0,0 +1,112 @@
+import struct
+
+# Raw header parser used by the fast capture and replay paths.
+# Mirrors what FlowExtractor.process_packet reads from a dissected Scapy
+# packet, using fixed offsets instead of building layer objects.
+
+ETH_HEADER_LEN = 14
+SLL_HEADER_LEN = 16
+ETH_P_IP = 0x0800
+VLAN_TYPES = (0x8100, 0x88A8)  # 802.1Q, 802.1ad
+
+IPPROTO_IPIP = 4
+IPPROTO_TCP = 6
+IPPROTO_UDP = 17
+
+_ETHERTYPE = struct.Struct("!H")
+# ver/ihl, flags/frag, proto, src, dst
+_IPV4 = struct.Struct("!B5xHxB2xII")
+_PORTS = struct.Struct("!2xH")
+_TCP_FLAGS = struct.Struct("!12xBB")
+
+TCP_SYN = 0x02
+TCP_ACK = 0x10
+# Not a TCP flag: marks a SYN without ACK, i.e. a packet from the side
+# opening the connection. Flow tables OR it in with the real flags, so a
+# flow carries it when its source initiated; emission strips it again.
+OPENER_FLAG = 0x8000
+
+
+def parse_frame(frame):
+    """
+    Parses an Ethernet frame (bytes or memoryview).
+
+    Returns (src_ip, dst_ip, dst_port, protocol, tcp_flags) with the IPs as
+    unsigned 32-bit integers, or None if the frame does not carry IPv4.
+    tcp_flags includes OPENER_FLAG on a SYN without ACK.
+    """
+    size = len(frame)
+    offset = ETH_HEADER_LEN
+    if size < offset + 20:
+        return None
+
+    ethertype = _ETHERTYPE.unpack_from(frame, 12)[0]
+    while ethertype in VLAN_TYPES:
+        if size < offset + 24:
+            return None
+        ethertype = _ETHERTYPE.unpack_from(frame, offset + 2)[0]
+        offset += 4
+    if ethertype != ETH_P_IP:
+        return None
+
+    return parse_ipv4(frame, offset)
+
+
+def parse_sll(frame):
+    """Same as parse_frame, for Linux cooked captures ("any" interface)."""
+    if len(frame) < SLL_HEADER_LEN + 20:
+        return None
+    if _ETHERTYPE.unpack_from(frame, 14)[0] != ETH_P_IP:
+        return None
+    return parse_ipv4(frame, SLL_HEADER_LEN)
+
+
+def parse_raw_ip(frame):
+    """Same as parse_frame, for captures that start at the IP header."""
+    if len(frame) < 20 or frame[0] >> 4 != 4:
+        return None
+    return parse_ipv4(frame, 0)
+
+
+def parse_ipv4(frame, offset):
+    ver_ihl, frag, proto, src, dst = _IPV4.unpack_from(frame, offset)
+    dst_port, flags = _parse_l4(frame, offset, ver_ihl, frag, proto, len(frame))
+    return src, dst, dst_port, proto, flags
+
+
+def _parse_l4(frame, offset, ver_ihl, frag, proto, size):
+    # Scapy only dissects a transport header in the first fragment
+    if frag & 0x1FFF:
+        return 0, 0
+    ihl = (ver_ihl & 0x0F) * 4
+    if ihl < 20:
+        return 0, 0
+    l4 = offset + ihl
+
+    if proto == IPPROTO_TCP:
+        if size < l4 + 14:
+            return 0, 0
+        dst_port = _PORTS.unpack_from(frame, l4)[0]
+        reserved, flags = _TCP_FLAGS.unpack_from(frame, l4)
+        # Scapy's 9-bit flags field includes the NS bit
+        if flags & (TCP_SYN | TCP_ACK) == TCP_SYN:
+            flags |= OPENER_FLAG
+        return dst_port, ((reserved & 0x01) << 8) | flags
+    if proto == IPPROTO_UDP:
+        if size < l4 + 4:
+            return 0, 0
+        return _PORTS.unpack_from(frame, l4)[0], 0
+    if proto == IPPROTO_IPIP and size >= l4 + 20:
+        # IP-in-IP: the outer header keys the flow, the inner one the port
+        ver_ihl, frag, proto, _, _ = _IPV4.unpack_from(frame, l4)
+        return _parse_l4(frame, l4, ver_ihl, frag, proto, size)
+    return 0, 0
+
+
+# pcap/pcapng link-layer header types -> frame parser
+LINKTYPE_PARSERS = {
+    1: parse_frame,     # LINKTYPE_ETHERNET
+    101: parse_raw_ip,  # LINKTYPE_RAW
+    113: parse_sll,     # LINKTYPE_LINUX_SLL
+    228: parse_raw_ip,  # LINKTYPE_IPV4
+}
@@ -0,0 +1,208 @@
+import mmap
+import struct
+import numpy as np
+from src import metrics
+from src.packet_parser import LINKTYPE_PARSERS
+
+# Memory-mapped pcap / pcapng reader for offline replay.
+# Frames are yielded as memoryview slices of the mapping, so a multi-GB
+# capture is paged in by the OS instead of being read into Python objects.
+
+PCAP_MAGIC = {
+    b"\xd4\xc3\xb2\xa1": ("<", 1e-6),
+    b"\xa1\xb2\xc3\xd4": (">", 1e-6),
+    b"\x4d\x3c\xb2\xa1": ("<", 1e-9),
+    b"\xa1\xb2\x3c\x4d": (">", 1e-9),
+}
+PCAPNG_SHB = b"\x0a\x0d\x0d\x0a"
+
+# pcapng block types
+SHB = 0x0A0D0D0A
+IDB = 0x00000001
+OPB = 0x00000002
+SPB = 0x00000003
+EPB = 0x00000006
+OPT_IF_TSRESOL = 9
+
+
+class PcapReader:
+    """
+    Iterates (frame, timestamp, captured_length, linktype) over a pcap or
+    pcapng file. Use as a context manager; frames are only valid until
+    the reader is closed.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._map)
+        self.size = len(self._map)
+
+        head = self._map[:4]
+        if head in PCAP_MAGIC:
+            self.format = "pcap"
+        elif head == PCAPNG_SHB:
+            self.format = "pcapng"
+        else:
+            self.close()
+            raise ValueError(f"{path}: not a pcap or pcapng file")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._view.release()
+        try:
+            self._map.close()
+        except BufferError:
+            pass  # a caller still holds a frame; the mapping goes with it
+        self._file.close()
+
+    def __iter__(self):
+        if self.format == "pcap":
+            return self._iter_pcap(self._view)
+        return self._iter_pcapng(self._view)
+
+    def records(self):
+        """Iterates (frame_offset, timestamp, captured_length, linktype) without slicing frames."""
+        if self.format == "pcap":
+            return self._iter_pcap(None)
+        return self._iter_pcapng(None)
+
+    def batches(self, size=65536):
+        """records() as NumPy column batches: (offsets, timestamps, caplens, linktypes)."""
+        rows = []
+        for record in self.records():
+            rows.append(record)
+            if len(rows) == size:
+                yield self._columns(rows)
+                rows = []
+        if rows:
+            yield self._columns(rows)
+
+    @staticmethod
+    def _columns(rows):
+        offsets, stamps, caplens, linktypes = zip(*rows)
+        return (np.array(offsets, dtype=np.int64), np.array(stamps, dtype=np.float64),
+                np.array(caplens, dtype=np.int64), np.array(linktypes, dtype=np.int64))
+
+    # Both walkers yield frame views, or frame offsets when view is None
+
+    # --- CLASSIC PCAP ---
+    def _iter_pcap(self, view):
+        buf = self._map
+        endian, resolution = PCAP_MAGIC[buf[:4]]
+        linktype = struct.unpack_from(endian + "I", buf, 20)[0] & 0x0FFFFFFF
+        record = struct.Struct(endian + "IIII")
+        offset, end = 24, self.size
+        while offset + 16 <= end:
+            sec, frac, caplen, _ = record.unpack_from(buf, offset)
+            offset += 16
+            if offset + caplen > end:
+                break  # truncated last record
+            yield (offset if view is None else view[offset:offset + caplen]), \
+                sec + frac * resolution, caplen, linktype
+            offset += caplen
+
+    # --- PCAPNG ---
+    def _iter_pcapng(self, view):
+        buf = self._map
+        offset, end = 0, self.size
+        endian = "<"
+        interfaces = []  # (linktype, ts_resolution, snaplen) per section
+        last_ts = 0.0
+
+        while offset + 12 <= end:
+            block_type = struct.unpack_from(endian + "I", buf, offset)[0]
+            if block_type == SHB:
+                magic = buf[offset + 8:offset + 12]
+                endian = "<" if magic == b"\x4d\x3c\x2b\x1a" else ">"
+                interfaces = []
+            block_len = struct.unpack_from(endian + "I", buf, offset + 4)[0]
+            if block_len < 12 or offset + block_len > end:
+                break  # truncated or corrupt tail
+
+            if block_type == IDB:
+                linktype, _, snaplen = struct.unpack_from(endian + "HHI", buf, offset + 8)
+                resolution = self._tsresol(buf, endian, offset + 16, offset + block_len - 4)
+                interfaces.append((linktype, resolution, snaplen))
+
+            elif block_type in (EPB, OPB):
+                if block_type == EPB:
+                    iface, ts_high, ts_low, caplen, _ = struct.unpack_from(endian + "5I", buf, offset + 8)
+                else:
+                    iface, _, ts_high, ts_low, caplen, _ = struct.unpack_from(endian + "HH4I", buf, offset + 8)
+                linktype, resolution, _ = interfaces[iface]
+                last_ts = ((ts_high << 32) | ts_low) * resolution
+                data = offset + 28
+                yield (data if view is None else view[data:data + caplen]), last_ts, caplen, linktype
+
+            elif block_type == SPB and interfaces:
+                linktype, _, snaplen = interfaces[0]
+                orig_len = struct.unpack_from(endian + "I", buf, offset + 8)[0]
+                caplen = min(orig_len, block_len - 16, snaplen or orig_len)
+                data = offset + 12
+                # Simple packet blocks carry no timestamp
+                yield (data if view is None else view[data:data + caplen]), last_ts, caplen, linktype
+
+            offset += block_len
+
+    @staticmethod
+    def _tsresol(buf, endian, offset, end):
+        """Reads the if_tsresol option of an interface description block."""
+        option = struct.Struct(endian + "HH")
+        while offset + 4 <= end:
+            code, length = option.unpack_from(buf, offset)
+            if code == 0:
+                break
+            if code == OPT_IF_TSRESOL and length >= 1:
+                value = buf[offset + 4]
+                if value & 0x80:
+                    return 2.0 ** -(value & 0x7F)
+                return 10.0 ** -value
+            offset += 4 + ((length + 3) & ~3)
+        return 1e-6
+
+
+def replay_windows(path, extractor, window):
+    """
+    Streams a capture through the extractor, closing a window every
+    `window` seconds of packet time (not wall-clock time).
+
+    Yields (window_start, packets, df, flow_keys) per non-empty window.
+    """
+    window_start = None
+    window_end = None
+    packets = 0
+    with PcapReader(path) as reader:
+        for frame, timestamp, caplen, linktype in reader:
+            parse = LINKTYPE_PARSERS.get(linktype)
+            if parse is None:
+                continue
+            if window_start is None:
+                window_start = timestamp
+                window_end = timestamp + window
+            elif timestamp >= window_end:
+                if packets:
+                    with metrics.stage("extract"):
+                        df, flow_keys = extractor.extract_features()
+                    yield window_start, packets, df, flow_keys
+                    packets = 0
+                # Skip idle gaps without emitting empty windows
+                skipped = int((timestamp - window_start) // window)
+                window_start += skipped * window
+                window_end = window_start + window
+
+            extractor.process_frame(frame, timestamp, caplen, parse)
+            packets += 1
+        frame = None  # release the last view before the mapping closes
+
+        if packets:
+            extractor.flush()  # Persistent tables: emit the flows still open
+            with metrics.stage("extract"):
+                df, flow_keys = extractor.extract_features()
+            yield window_start, packets, df, flow_keys
@@ -1,44 +1,304 @@
-import os
+import logging
 import subprocess
+import sys
+import threading
 import time
+from collections import deque
+from src.firewall import DryRunFirewall, NftablesFirewall
 
-class ResponseManager:
-    def __init__(self):
-        self.threat_db = {} # {ip: {'strikes': 0, 'last_seen': time}}
-        self.BLOCK_THRESHOLD = 2
+logger = logging.getLogger("0xGuard")
+
+
+# --- BACKENDS ---
+class MacNotifier:
+    """Native macOS Notification"""
 
     def notify(self, title, message):
-        """Native macOS Notification"""
         cmd = f'display notification "{message}" with title "{title}" sound name "Ping"'
-        subprocess.run(["osascript", "-e", cmd])
+        subprocess.run(["osascript", "-e", cmd], timeout=5)
 
-    def block_ip(self, ip):
-        """Simulates Blocking an IP"""
-        print(f"⛔ [FIREWALL] BLOCKING IP: {ip}")
-        self.notify("🛡️ THREAT BLOCKED", f"IP {ip} has been banned.")
+
+class LogNotifier:
+    """Notifications as log lines (headless / non-macOS hosts)."""
+
+    def notify(self, title, message):
+        logger.warning(f"{title}: {message}")
+
+
+class SimulatedFirewall:
+    """Simulates Blocking an IP"""
+
+    def block(self, ips, now=None):
+        for ip in ips:
+            print(f"⛔ [FIREWALL] BLOCKING IP: {ip}")
         # Actual command (commented out for safety):
         # os.system(f"sudo echo 'block drop from {ip} to any' | pfctl -f -")
 
+    def expire(self, now=None):
+        return []  # Simulated blocks never lapse
+
+
+class RecordingBackend:
+    """No-op notifier + firewall that records every call (tests, dry runs)."""
+
+    def __init__(self):
+        self.notifications = []  # (title, message)
+        self.blocks = []  # One list of IPs per firewall call
+
+    def notify(self, title, message):
+        self.notifications.append((title, message))
+
+    def block(self, ips, now=None):
+        self.blocks.append(list(ips))
+
+    def expire(self, now=None):
+        return []
+
+
+NOTIFIERS = {
+    "macos": MacNotifier,
+    "log": LogNotifier,
+    "record": RecordingBackend
+}
+
+FIREWALLS = {
+    "simulate": SimulatedFirewall,
+    "record": RecordingBackend,
+    "nftables": NftablesFirewall,  # Set-based, batched, TTL unblock (needs root)
+    "dry-run": DryRunFirewall  # Same, but writes the ruleset to a file
+}
+
+DEFAULT_NOTIFIER = "macos" if sys.platform == "darwin" else "log"
+
+
+# --- STRIKE TRACKING ---
+class StrikeTracker:
+    """
+    Per-IP strike counts that expire after `window` seconds of quiet.
+
+    IPs are filed into time buckets of `bucket_seconds`; expiry pops whole
+    buckets off the front, so it costs only the entries that expire. At
+    most `max_ips` IPs are tracked: past that the oldest buckets are
+    expired early.
+    """
+
+    def __init__(self, window=60, bucket_seconds=5, max_ips=100000):
+        self.window = window
+        self.bucket_seconds = bucket_seconds
+        self.max_ips = max_ips
+        self.entries = {}  # ip -> [strikes, last bucket, blocked]
+        self._buckets = deque()  # (bucket, [ips touched in it])
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, ip):
+        return self.entries.get(ip)
+
+    def add(self, ip, strikes, now):
+        """Adds strikes to an IP and returns its entry."""
+        bucket = int(now // self.bucket_seconds)
+        if not self._buckets or self._buckets[-1][0] != bucket:
+            self._buckets.append((bucket, []))
+        entry = self.entries.get(ip)
+        if entry is None:
+            entry = self.entries[ip] = [0, bucket, False]
+        if entry[1] != bucket or not entry[0]:
+            self._buckets[-1][1].append(ip)
+        entry[0] += strikes
+        entry[1] = bucket
+        return entry
+
+    def expire(self, now):
+        """Drops IPs quiet for longer than the window (and the oldest, over max_ips)."""
+        horizon = int((now - self.window) // self.bucket_seconds)
+        expired = 0
+        while self._buckets and (self._buckets[0][0] < horizon or len(self.entries) > self.max_ips):
+            bucket, ips = self._buckets.popleft()
+            for ip in ips:
+                entry = self.entries.get(ip)
+                if entry is not None and entry[1] <= bucket:  # Not seen since
+                    del self.entries[ip]
+                    expired += 1
+        return expired
+
+
+# --- RESPONSE PIPELINE ---
+class ResponseManager:
+    """
+    Escalating response to threats, off the detection thread.
+
+    handle_threat() and block_ip() only record the event in a pending map
+    keyed by IP, so repeats of the same IP between two worker passes
+    coalesce into one entry with a count. The worker thread turns each
+    pass into strikes (warning, critical, then block past
+    BLOCK_THRESHOLD), sends one firewall call for all IPs to block and at
+    most one notification per `notify_interval` seconds, summarising
+    anything it held back.
+    """
+
+    def __init__(self, notifier=None, firewall=None, block_threshold=2, strike_window=60,
+                 max_ips=100000, max_pending=65536, notify_interval=5.0, poll_interval=0.2,
+                 retry_interval=5.0):
+        self.notifier = notifier if notifier is not None else NOTIFIERS[DEFAULT_NOTIFIER]()
+        self.firewall = firewall if firewall is not None else SimulatedFirewall()
+        self.BLOCK_THRESHOLD = block_threshold
+        self.threat_db = StrikeTracker(window=strike_window, max_ips=max_ips)
+        self.max_pending = max_pending
+        self.notify_interval = notify_interval
+        self.poll_interval = poll_interval
+        self.retry_interval = retry_interval
+
+        self._pending = {}  # ip -> [threat events, block requested]
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._held = None  # Most severe notification waiting for the rate limit
+        self._held_count = 0
+        self._last_notify = 0.0
+        self._failed = set()  # IPs whose firewall block failed, retried after retry_interval
+        self._retry_at = 0.0
+
+        # Counters for reporting
+        self.events = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.blocked = 0
+        self.block_failures = 0
+        self.notifications_suppressed = 0
+
+    # --- HOT PATH (detection thread) ---
+    def _submit(self, ip, block):
+        with self._lock:
+            self.events += 1
+            entry = self._pending.get(ip)
+            if entry is not None:
+                entry[0] += 1
+                entry[1] = entry[1] or block
+                self.coalesced += 1
+                return True
+            if len(self._pending) >= self.max_pending:
+                self.dropped += 1
+                return False
+            self._pending[ip] = [1, block]
+        self._wake.set()
+        return True
+
     def handle_threat(self, ip):
-        now = time.time()
-        #if ip.startswith("192.168.") or ip == "127.0.0.1":
-            #return # Ignore local IPs
-        if ip not in self.threat_db:
-            self.threat_db[ip] = {'strikes': 0, 'last_seen': now}
-        
-        # Reset strikes if quiet for 60s
-        if now - self.threat_db[ip]['last_seen'] > 60:
-            self.threat_db[ip]['strikes'] = 0
-            
-        self.threat_db[ip]['last_seen'] = now
-        self.threat_db[ip]['strikes'] += 1
-        strikes = self.threat_db[ip]['strikes']
-
-        if strikes == 1:
-            print(f"⚠️ Warning: Suspicious activity from {ip}")
-            self.notify("Security Warning", f"Unusual traffic from {ip}")
-        elif strikes == 2:
-            print(f"🚨 CRITICAL: Persistence from {ip}")
-            self.notify("CRITICAL ALERT", f"Next detection will trigger BLOCK: {ip}")
-        elif strikes > self.BLOCK_THRESHOLD:
-            self.block_ip(ip)
\ No newline at end of file
+        """Counts a strike against the IP; escalates to a block on repeat offences."""
+        return self._submit(ip, False)
+
+    def block_ip(self, ip):
+        """Blocks the IP immediately (applied by the worker)."""
+        return self._submit(ip, True)
+
+    # --- LIFECYCLE ---
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="0xguard-response", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Applies everything still pending, then stops the worker."""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    # --- WORKER ---
+    def _run(self):
+        while True:
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+            stopping = self._stop.is_set()
+            try:
+                self.process_pending()
+            except Exception as e:
+                logger.error(f"Response pipeline error: {e}")
+            if stopping:
+                break
+
+    def process_pending(self, now=None):
+        """One worker pass: strikes, blocks and notifications for the queued events."""
+        now = time.time() if now is None else now
+        with self._lock:
+            pending, self._pending = self._pending, {}
+
+        to_block = {}  # ip -> strike entry, flagged blocked once the firewall applied it
+        for ip, (count, block) in pending.items():
+            entry = self.threat_db.add(ip, count, now)
+            strikes = entry[0]
+            if entry[2]:
+                continue  # Already blocked within the strike window
+            if block or strikes > self.BLOCK_THRESHOLD:
+                to_block[ip] = entry
+            elif strikes - count < self.BLOCK_THRESHOLD <= strikes:
+                print(f"🚨 CRITICAL: Persistence from {ip}")
+                self._hold(1, "CRITICAL ALERT", f"Next detection will trigger BLOCK: {ip}")
+            elif strikes == count:  # First sighting in the strike window
+                print(f"⚠️ Warning: Suspicious activity from {ip}")
+                self._hold(2, "Security Warning", f"Unusual traffic from {ip}")
+
+        if self._failed and now >= self._retry_at:
+            for ip in self._failed:
+                entry = self.threat_db.add(ip, 0, now)
+                if not entry[2]:
+                    to_block.setdefault(ip, entry)
+            self._failed = set()
+
+        if to_block:
+            ips = list(to_block)
+            started = time.perf_counter()
+            try:
+                self.firewall.block(ips, now)
+            except Exception as e:
+                # Not flagged as blocked: retried on a later pass
+                self.block_failures += len(ips)
+                self._failed.update(ips)
+                self._retry_at = now + self.retry_interval
+                logger.error(f"Firewall block of {len(ips)} IPs failed, retrying in {self.retry_interval:.0f}s: {e}")
+            else:
+                for entry in to_block.values():
+                    entry[2] = True
+                self._failed.difference_update(ips)
+                self.blocked += len(ips)
+                logger.debug(f"Firewall batch of {len(ips)} IPs in {(time.perf_counter() - started) * 1000:.1f}ms")
+                shown = ", ".join(ips[:3]) + (f" (+{len(ips) - 3} more)" if len(ips) > 3 else "")
+                self._hold(0, "🛡️ THREAT BLOCKED", f"IP {shown} has been banned.")
+
+        # Lapsed blocks: the IP starts over at zero strikes if it comes back
+        try:
+            expired = self.firewall.expire(now)
+        except Exception as e:
+            expired = []
+            logger.error(f"Firewall expiry failed: {e}")
+        for ip in expired:
+            entry = self.threat_db.get(ip)
+            if entry is not None:
+                entry[0] = 0
+                entry[2] = False
+
+        self._notify(now)
+        self.threat_db.expire(now)
+
+    def _hold(self, severity, title, message):
+        """Keeps the most severe pending notification (0 = block) and counts the rest."""
+        if self._held is None or severity < self._held[0]:
+            self._held = (severity, title, message)
+        self._held_count += 1
+
+    def _notify(self, now):
+        if self._held is None or now - self._last_notify < self.notify_interval:
+            return
+        _, title, message = self._held
+        if self._held_count > 1:
+            message += f" (+{self._held_count - 1} more alerts)"
+            self.notifications_suppressed += self._held_count - 1
+        self._held, self._held_count = None, 0
+        self._last_notify = now
+        try:
+            self.notifier.notify(title, message)
+        except (OSError, subprocess.SubprocessError) as e:
+            logger.error(f"Notification failed: {e}")
@@ -0,0 +1,496 @@
+import logging
+import multiprocessing as mp
+import queue
+import threading
+import time
+import traceback
+from multiprocessing import shared_memory
+import numpy as np
+from src import metrics
+from src.capture_backends import RawSocketCapture
+from src.capture_engine import PACKETS, WINDOW_FLOWS, WINDOW_PACKETS, WindowStats
+from src.feature_extractor import ArrayFlowExtractor, flow_features
+from src.packet_parser import LINKTYPE_PARSERS
+from src.pcap_reader import PcapReader
+
+logger = logging.getLogger("0xGuard")
+
+# Multi-process sharded capture.
+#
+# N worker processes each own an ArrayFlowExtractor for their share of the
+# traffic: live, the kernel spreads packets across the workers' AF_PACKET
+# sockets by flow hash (PACKET_FANOUT); in replay, a coordinator thread
+# walks the capture's record headers once and hands each worker the
+# offsets of the packets whose IPv4 source/destination hash to it, so only
+# the cheap header walk is serial. At each window close a worker copies its
+# raw flow counters into a shared-memory segment and sends the coordinator
+# a small message; the coordinator merges every shard's rows for the
+# window and hands one feature matrix to the handler, so scoring stays a
+# single batch. Counters merge exactly (sum / min / max / OR), so a flow
+# split across shards (e.g. by the kernel's port-aware hash) is still
+# reported once.
+
+# Raw per-flow counters as shipped through shared memory
+FLOW_RECORD = np.dtype([
+    ("src", np.uint32), ("dst", np.uint32), ("dst_port", np.uint16), ("proto", np.uint8),
+    ("tcp_flags", np.uint16), ("start_time", np.float64), ("last_time", np.float64),
+    ("packets", np.int64), ("bytes", np.int64)
+])
+SEGMENT_ROWS = 65536  # Rows per segment; bigger windows are sent in several chunks
+SEGMENTS_PER_WORKER = 2  # Double-buffered: a worker fills one while the other is read
+REPLAY_QUEUE_BATCHES = 8  # Record batches queued per replay worker (bounds the index held in memory)
+
+ETHERTYPE_IPV4 = 0x0800
+VLAN_TYPES = (0x8100, 0x88A8)
+
+
+def packet_shards(data, offsets, caplens, linktypes, shards):
+    """
+    Owner shard of each captured frame, vectorized over a batch.
+
+    Frames whose IPv4 header sits at a known offset (Ethernet, one VLAN
+    tag, Linux cooked, raw IP) hash on source XOR destination; anything
+    else (non-IPv4, stacked VLANs, truncated) goes to shard 0, which parses
+    it like any other frame.
+    """
+    ip = np.full(len(offsets), -1, dtype=np.int64)
+
+    def be16(pos):
+        return (data[pos].astype(np.int64) << 8) | data[pos + 1]
+
+    eth = np.flatnonzero((linktypes == 1) & (caplens >= 34))
+    ethertype = be16(offsets[eth] + 12)
+    ip[eth[ethertype == ETHERTYPE_IPV4]] = offsets[eth[ethertype == ETHERTYPE_IPV4]] + 14
+    tagged = eth[np.isin(ethertype, VLAN_TYPES) & (caplens[eth] >= 38)]
+    inner = be16(offsets[tagged] + 16)
+    ip[tagged[inner == ETHERTYPE_IPV4]] = offsets[tagged[inner == ETHERTYPE_IPV4]] + 18
+
+    sll = np.flatnonzero((linktypes == 113) & (caplens >= 36))
+    sll = sll[be16(offsets[sll] + 14) == ETHERTYPE_IPV4]
+    ip[sll] = offsets[sll] + 16
+
+    raw = np.flatnonzero(np.isin(linktypes, (101, 228)) & (caplens >= 20))
+    raw = raw[(data[offsets[raw]] >> 4) == 4]
+    ip[raw] = offsets[raw]
+
+    owners = np.zeros(len(offsets), dtype=np.int64)
+    has_ip = np.flatnonzero(ip >= 0)
+    pos = ip[has_ip]
+    src_dst = np.zeros(len(pos), dtype=np.uint64)
+    for byte in range(4):  # XOR of the big-endian source and destination words
+        src_dst = (src_dst << np.uint64(8)) | (data[pos + 12 + byte] ^ data[pos + 16 + byte]).astype(np.uint64)
+    mixed = ((src_dst * np.uint64(0x9E3779B1)) & np.uint64(0xFFFFFFFF)) >> np.uint64(16)
+    owners[has_ip] = (mixed % np.uint64(shards)).astype(np.int64)
+    return owners
+
+
+def merge_flows(parts):
+    """Merges shard rows into one row per flow key -> (df, FlowKeys)."""
+    records = np.concatenate(parts) if parts else np.empty(0, dtype=FLOW_RECORD)
+    if len(records) > 1:
+        records = records[np.lexsort((records["proto"], records["dst_port"], records["dst"], records["src"]))]
+        same = ((records["src"][1:] == records["src"][:-1]) & (records["dst"][1:] == records["dst"][:-1])
+                & (records["dst_port"][1:] == records["dst_port"][:-1])
+                & (records["proto"][1:] == records["proto"][:-1]))
+        if same.any():
+            starts = np.r_[0, np.flatnonzero(~same) + 1]
+            merged = records[starts]
+            merged["packets"] = np.add.reduceat(records["packets"], starts)
+            merged["bytes"] = np.add.reduceat(records["bytes"], starts)
+            merged["start_time"] = np.minimum.reduceat(records["start_time"], starts)
+            merged["last_time"] = np.maximum.reduceat(records["last_time"], starts)
+            merged["tcp_flags"] = np.bitwise_or.reduceat(records["tcp_flags"], starts)
+            records = merged
+
+    def column(name):
+        return np.ascontiguousarray(records[name])
+
+    return flow_features(column("src"), column("dst"), column("dst_port"), column("proto"),
+                         column("start_time"), column("last_time"), column("packets"),
+                         column("bytes"), column("tcp_flags"))
+
+
+# --- WORKER SIDE ---
+class _ShardExporter:
+    """Copies a closed flow table into the worker's shared-memory segments."""
+
+    def __init__(self, shard, segment_names, free, results):
+        self.shard = shard
+        self._segments = [shared_memory.SharedMemory(name=name) for name in segment_names]
+        self._rows = [np.ndarray((seg.size // FLOW_RECORD.itemsize,), dtype=FLOW_RECORD, buffer=seg.buf)
+                      for seg in self._segments]
+        self._free = free
+        self._results = results
+
+    def export(self, window_id, window_start, packets, table):
+        n = len(table)
+        sent = 0
+        while True:
+            seg = self._free.get()  # Blocks while the coordinator still reads both segments
+            rows = self._rows[seg]
+            count = min(n - sent, len(rows))
+            if count:
+                part, taken = rows[:count], slice(sent, sent + count)
+                part["src"] = table.src[taken]
+                part["dst"] = table.dst[taken]
+                part["dst_port"] = table.dst_port[taken]
+                part["proto"] = table.proto[taken]
+                part["tcp_flags"] = table.tcp_flags[taken]
+                part["start_time"] = table.start_time[taken]
+                part["last_time"] = table.last_time[taken]
+                part["packets"] = table.packet_count[taken]
+                part["bytes"] = table.byte_count[taken]
+            sent += count
+            last = sent >= n
+            self._results.put(("window", self.shard, window_id, window_start, packets, seg, count, last))
+            if last:
+                break
+        table.reset()
+
+    def close(self):
+        self._rows = []
+        for seg in self._segments:
+            seg.close()
+
+
+def _replay_worker(path, shard, window, link, work):
+    exporter = _ShardExporter(shard, *link)
+    table = ArrayFlowExtractor()
+    try:
+        with PcapReader(path) as reader:
+            view = reader._view
+            current = None
+            packets = 0
+            while (batch := work.get()) is not None:
+                t0, windows, ids, offsets, stamps, caplens, linktypes = batch
+                # Every window of the batch is visited, so all shards report the same window ids
+                starts = np.searchsorted(ids, windows, side="left").tolist()
+                ends = np.searchsorted(ids, windows, side="right").tolist()
+                for window_id, a, b in zip(windows.tolist(), starts, ends):
+                    if current is not None and window_id != current:
+                        exporter.export(current, t0 + current * window, packets, table)
+                        packets = 0
+                    current = window_id
+                    packets += b - a
+                    for offset, timestamp, caplen, linktype in zip(
+                            offsets[a:b].tolist(), stamps[a:b].tolist(),
+                            caplens[a:b].tolist(), linktypes[a:b].tolist()):
+                        parsed = LINKTYPE_PARSERS[linktype](view[offset:offset + caplen])
+                        if parsed is not None:
+                            src, dst, dst_port, proto, flags = parsed
+                            table.add(src, dst, dst_port, proto, caplen, timestamp, flags)
+
+            if current is not None:
+                exporter.export(current, t0 + current * window, packets, table)
+        link[2].put(("done", shard))
+    except Exception:
+        link[2].put(("error", shard, traceback.format_exc()))
+    finally:
+        exporter.close()
+
+
+def _dispatch_replay(path, window, work, results):
+    """
+    Coordinator thread: walks the capture's record headers once, assigns
+    packet-time window ids and owner shards per batch, and queues each
+    replay worker its packets.
+    """
+    shards = len(work)
+    try:
+        with PcapReader(path) as reader:
+            data = np.frombuffer(reader._map, dtype=np.uint8)
+            t0 = current = None
+            for offsets, stamps, caplens, linktypes in reader.batches():
+                known = np.isin(linktypes, list(LINKTYPE_PARSERS))
+                if not known.all():
+                    offsets, stamps, caplens, linktypes = (
+                        offsets[known], stamps[known], caplens[known], linktypes[known])
+                if len(offsets) == 0:
+                    continue
+                if t0 is None:
+                    t0 = stamps[0]
+
+                # Packet-time windows, as in replay_windows: late packets stay in the open window
+                ids = np.maximum.accumulate(np.floor((stamps - t0) / window).astype(np.int64))
+                if current is not None:
+                    ids = np.maximum(ids, current)
+                current = int(ids[-1])
+                windows = np.unique(ids)
+                owners = packet_shards(data, offsets, caplens, linktypes, shards)
+                for shard, inbox in enumerate(work):
+                    mine = owners == shard
+                    inbox.put((t0, windows, ids[mine], offsets[mine], stamps[mine], caplens[mine], linktypes[mine]))
+            del data
+    except Exception:
+        results.put(("error", "reader", traceback.format_exc()))
+    finally:
+        for inbox in work:
+            inbox.put(None)
+
+
+class _ShardSink:
+    """Capture sink inside a live worker: double-buffered flow tables."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._active = ArrayFlowExtractor()
+        self._spare = ArrayFlowExtractor()
+        self._packets = 0
+
+    def process_packet(self, packet):
+        with self._lock:
+            self._active.process_packet(packet)
+            self._packets += 1
+
+    def process_frames(self, frames):
+        with self._lock:
+            self._active.process_frames(frames)
+            self._packets += len(frames)
+
+    def swap(self):
+        """Returns the filled table and its packet count; capture continues in the spare."""
+        with self._lock:
+            closed, self._active = self._active, self._spare
+            packets, self._packets = self._packets, 0
+        self._spare = closed  # Reset by the exporter before the next swap
+        return closed, packets
+
+
+def _live_worker(shard, window, iface, fanout_group, link, stop):
+    exporter = _ShardExporter(shard, *link)
+    sink = _ShardSink()
+    backend = RawSocketCapture(iface=iface, fanout_group=fanout_group)
+    try:
+        backend.start(sink)
+        # Wall-clock aligned windows, so every worker closes the same window ids
+        boundary = (time.time() // window + 1) * window
+        while not stop.wait(max(0.0, boundary - time.time())):
+            table, packets = sink.swap()
+            exporter.export(int(round(boundary / window)) - 1, boundary - window, packets, table)
+            boundary += window
+        backend.stop()
+        table, packets = sink.swap()
+        exporter.export(int(round(boundary / window)) - 1, boundary - window, packets, table)
+        link[2].put(("done", shard))
+    except Exception:
+        link[2].put(("error", shard, traceback.format_exc()))
+    finally:
+        exporter.close()
+
+
+# --- COORDINATOR SIDE ---
+class _Coordinator:
+    """Owns the shared-memory segments and reassembles windows from shard messages."""
+
+    def __init__(self, workers, ctx, segment_rows=SEGMENT_ROWS):
+        self.workers = workers
+        self.results = ctx.Queue()
+        self.free = [ctx.Queue() for _ in range(workers)]
+        self.segments = [[shared_memory.SharedMemory(create=True, size=segment_rows * FLOW_RECORD.itemsize)
+                          for _ in range(SEGMENTS_PER_WORKER)] for _ in range(workers)]
+        self.rows = [[np.ndarray((segment_rows,), dtype=FLOW_RECORD, buffer=seg.buf) for seg in shard]
+                     for shard in self.segments]
+        for shard in range(workers):
+            for seg in range(SEGMENTS_PER_WORKER):
+                self.free[shard].put(seg)
+        self.windows = {}  # window_id -> partially assembled window
+        self.closed_through = None  # Highest window id emitted or expired; later parts for it are dropped
+        self.finished = 0
+
+        # Counters for reporting
+        self.late_parts = 0
+
+    def link(self, shard):
+        """Arguments a worker needs to reach its segments and the coordinator."""
+        return [seg.name for seg in self.segments[shard]], self.free[shard], self.results
+
+    def receive(self, timeout=None):
+        """Handles one worker message. Returns (window_id, window) once every shard reported it."""
+        message = self.results.get(timeout=timeout)
+        if message[0] == "error":
+            raise RuntimeError(f"Capture shard {message[1]} failed:\n{message[2]}")
+        if message[0] == "done":
+            self.finished += 1
+            return None
+
+        _, shard, window_id, window_start, packets, seg, count, last = message
+        if self.closed_through is not None and window_id <= self.closed_through:
+            # The window was already scored without this shard: do not score it twice
+            self.free[shard].put(seg)
+            self.late_parts += 1
+            if last:
+                logger.warning(f"Window {window_id}: shard {shard} reported after the window was scored; dropped")
+            return None
+        window = self.windows.setdefault(window_id, {
+            "start": window_start, "packets": 0, "parts": [], "shards": 0, "opened": time.time()
+        })
+        if count:
+            window["parts"].append(self.rows[shard][seg][:count].copy())
+        self.free[shard].put(seg)
+        if last:
+            window["packets"] += packets
+            window["shards"] += 1
+            if window["shards"] == self.workers:
+                return window_id, self.pop(window_id)
+        return None
+
+    def pop(self, window_id):
+        """Removes a window for scoring; parts that arrive for it later are dropped."""
+        if self.closed_through is None or window_id > self.closed_through:
+            self.closed_through = window_id
+        return self.windows.pop(window_id)
+
+    def close(self):
+        self.rows = []
+        for shard in self.segments:
+            for seg in shard:
+                seg.close()
+                seg.unlink()
+
+
+def sharded_replay_windows(path, window, workers=2):
+    """
+    Multi-process counterpart of replay_windows(): yields
+    (window_start, packets, df, flow_keys) per non-empty packet-time window,
+    with every shard's flows for the window merged into one matrix.
+    """
+    ctx = mp.get_context("spawn")
+    coordinator = _Coordinator(workers, ctx)
+    work = [ctx.Queue(REPLAY_QUEUE_BATCHES) for _ in range(workers)]
+    processes = [ctx.Process(target=_replay_worker, args=(path, shard, window, coordinator.link(shard), work[shard]),
+                             name=f"0xguard-shard-{shard}", daemon=True)
+                 for shard in range(workers)]
+    for process in processes:
+        process.start()
+    # Fed from a thread, so this generator keeps draining results while a full work queue blocks the walk
+    threading.Thread(target=_dispatch_replay, args=(path, window, work, coordinator.results),
+                     name="0xguard-replay-dispatch", daemon=True).start()
+    try:
+        while coordinator.finished < workers:
+            completed = coordinator.receive()
+            if completed is not None:
+                _, assembled = completed
+                df, flow_keys = merge_flows(assembled["parts"])
+                yield assembled["start"], assembled["packets"], df, flow_keys
+    finally:
+        for process in processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        coordinator.close()
+
+
+class ShardedCaptureEngine:
+    """
+    Live capture across `workers` processes joined to one PACKET_FANOUT
+    group (Linux, raw sockets). Same handler contract and lifecycle as
+    CaptureEngine: handler(df, flow_keys, stats) runs on the coordinator
+    thread, once per window, with every shard's flows merged.
+    """
+
+    def __init__(self, handler, workers=2, window=5, iface=None):
+        self.handler = handler
+        self.workers = workers
+        self.window = window
+        self.iface = iface
+        self._ctx = mp.get_context("spawn")
+        self._stop = self._ctx.Event()
+        self._coordinator = None
+        self._processes = []
+        self._thread = None
+        self._done = threading.Event()
+
+    def start(self):
+        self._stop.clear()
+        self._done.clear()
+        self._coordinator = _Coordinator(self.workers, self._ctx)
+        fanout_group = (id(self) ^ time.monotonic_ns()) & 0xFFFF
+        self._processes = [
+            self._ctx.Process(target=_live_worker,
+                              args=(shard, self.window, self.iface, fanout_group,
+                                    self._coordinator.link(shard), self._stop),
+                              name=f"0xguard-shard-{shard}", daemon=True)
+            for shard in range(self.workers)
+        ]
+        for process in self._processes:
+            process.start()
+        self._thread = threading.Thread(target=self._coordinate, name="0xguard-coordinator", daemon=True)
+        self._thread.start()
+
+    def _coordinate(self):
+        coordinator = self._coordinator
+        window_ids = 0
+        try:
+            while coordinator.finished < self.workers:
+                try:
+                    completed = coordinator.receive(timeout=0.5)
+                except queue.Empty:
+                    completed = None
+                    if not all(p.is_alive() for p in self._processes):
+                        logger.error("A capture shard exited unexpectedly; stopping capture")
+                        self._stop.set()
+                        break
+                for window_id, window in self._ready(completed):
+                    window_ids += 1
+                    self._analyze(window_id, window)
+        except Exception as e:
+            logger.error(f"Sharded capture failed: {e}")
+            self._stop.set()
+        finally:
+            # Shards that stopped mid-window: score whatever arrived
+            for window_id in sorted(coordinator.windows):
+                self._analyze(window_id, coordinator.pop(window_id))
+            self._done.set()
+
+    def _ready(self, completed):
+        ready = [completed] if completed is not None else []
+        # A window still missing shards after two periods is scored without them
+        stale = [wid for wid, w in self._coordinator.windows.items() if time.time() - w["opened"] > 2 * self.window]
+        for window_id in sorted(stale):
+            window = self._coordinator.pop(window_id)
+            logger.warning(f"Window {window_id}: {self.workers - window['shards']} shard(s) late; scoring partial window")
+            ready.append((window_id, window))
+        return sorted(ready, key=lambda item: item[0])
+
+    def _analyze(self, window_id, window):
+        try:
+            with metrics.stage("extract"):
+                df, flow_keys = merge_flows(window["parts"])
+            PACKETS.inc(window["packets"])
+            WINDOW_PACKETS.observe(window["packets"])
+            WINDOW_FLOWS.observe(len(df))
+            stats = WindowStats(
+                window_id=window_id,
+                started=window["start"],
+                closed=window["start"] + self.window,
+                packets=window["packets"],
+                flows=len(df),
+                queue_depth=len(self._coordinator.windows),
+                dropped_packets=0,
+                total_dropped=0
+            )
+            self.handler(df, flow_keys, stats)
+        except Exception as e:
+            logger.error(f"Analysis error in window {window_id}: {e}")
+
+    def queue_depth(self):
+        """Windows waiting for shards that have not reported yet."""
+        return len(self._coordinator.windows) if self._coordinator is not None else 0
+
+    def stop(self):
+        """Stops every shard, scores the last windows and releases shared memory."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        for process in self._processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        if self._coordinator is not None:
+            self._coordinator.close()
+            self._coordinator = None
+
+    def wait(self):
+        """Blocks the calling thread until capture stops."""
+        while not self._done.wait(1.0):
+            pass
@@ -0,0 +1,321 @@
+import numpy as np
+from src.feature_extractor import INITIATOR_COLUMN, FlowKeys, SOURCE_FEATURE_COLUMNS, pack_ip, unpack_ip
+
+# Fixed-memory per-source summaries for scan and fan-out features.
+#
+# CountMinSketch counts per key (packets per source): colliding keys can
+# only inflate a count, and the minimum over `depth` independent rows
+# bounds that. DistinctSketch applies the same idea to distinct counts:
+# every cell is a small HyperLogLog, so "distinct destination ports of
+# this source" costs width x depth x 2^precision bytes whatever the number
+# of sources. TopK keeps the heaviest sources by their count-min estimate.
+# Updates and queries are vectorized over NumPy key arrays.
+
+
+def mix64(values, seed=0):
+    """splitmix64 finalizer: well-mixed 64-bit hashes of an integer array."""
+    with np.errstate(over="ignore"):
+        z = np.asarray(values).astype(np.uint64) + np.uint64((0x9E3779B97F4A7C15 * (seed + 1)) & 0xFFFFFFFFFFFFFFFF)
+        z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        return z ^ (z >> np.uint64(31))
+
+
+class CountMinSketch:
+    """Approximate per-key totals in depth x width counters."""
+
+    def __init__(self, width=4096, depth=4):
+        self.width = width
+        self.depth = depth
+        self.table = np.zeros((depth, width), dtype=np.int64)
+
+    def _cells(self, keys, row):
+        return (mix64(keys, row) % np.uint64(self.width)).astype(np.int64)
+
+    def add(self, keys, counts):
+        counts = np.asarray(counts, dtype=np.float64)
+        for row in range(self.depth):
+            self.table[row] += np.bincount(self._cells(keys, row), weights=counts,
+                                           minlength=self.width).astype(np.int64)
+
+    def query(self, keys):
+        return np.min([self.table[row][self._cells(keys, row)] for row in range(self.depth)], axis=0)
+
+    def clear(self):
+        self.table[:] = 0
+
+
+class DistinctSketch:
+    """Approximate distinct items per key: a count-min grid of HyperLogLogs."""
+
+    ITEM_SEED = 97  # Item hashes must be independent of the key hashes
+
+    def __init__(self, width=4096, depth=3, precision=6):
+        self.width = width
+        self.depth = depth
+        self.precision = precision
+        self.m = 1 << precision
+        self.registers = np.zeros((depth, width * self.m), dtype=np.uint8)
+        self.alpha = 0.7213 / (1 + 1.079 / self.m)
+
+    def _cells(self, keys, row):
+        return (mix64(keys, row) % np.uint64(self.width)).astype(np.int64) * self.m
+
+    def add(self, keys, items):
+        h = mix64(items, self.ITEM_SEED)
+        register = (h >> np.uint64(64 - self.precision)).astype(np.int64)
+        # Rank = leading zeros + 1 of the next 32 bits (frexp's exponent is exact)
+        rest = ((h << np.uint64(self.precision)) >> np.uint64(32)).astype(np.float64)
+        rank = np.where(rest > 0, 33 - np.frexp(rest)[1], 33).astype(np.uint8)
+        for row in range(self.depth):
+            np.maximum.at(self.registers[row], self._cells(keys, row) + register, rank)
+
+    def query(self, keys, other=None):
+        """Distinct-count estimates; `other` (same shape) is merged in, as after a union."""
+        estimates = []
+        span = np.arange(self.m)
+        for row in range(self.depth):
+            index = self._cells(keys, row)[:, None] + span
+            regs = self.registers[row][index]
+            if other is not None:
+                regs = np.maximum(regs, other.registers[row][index])
+            raw = self.alpha * self.m * self.m / np.sum(np.ldexp(1.0, -regs.astype(np.int64)), axis=1)
+            zeros = np.count_nonzero(regs == 0, axis=1)
+            small = (raw <= 2.5 * self.m) & (zeros > 0)  # Linear counting for small sets
+            raw[small] = self.m * np.log(self.m / zeros[small])
+            estimates.append(raw)
+        return np.min(estimates, axis=0)
+
+    def clear(self):
+        self.registers[:] = 0
+
+
+class TopK:
+    """
+    The k keys with the largest counts offered so far (heavy hitters).
+
+    Candidates are held as two k-sized arrays; offer() merges a batch of
+    (key, count estimate) pairs, keeping each key's largest estimate, and
+    cuts back to the k largest.
+    """
+
+    def __init__(self, k=32):
+        self.k = k
+        self.keys = np.empty(0, dtype=np.uint64)
+        self.counts = np.empty(0, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def offer(self, keys, counts):
+        keys = np.concatenate([self.keys, np.asarray(keys, dtype=np.uint64)])
+        counts = np.concatenate([self.counts, np.asarray(counts, dtype=np.int64)])
+        order = np.lexsort((counts, keys))
+        keys, counts = keys[order], counts[order]
+        last = np.r_[keys[1:] != keys[:-1], True]  # Largest count of each key
+        keys, counts = keys[last], counts[last]
+        if len(keys) > self.k:
+            top = np.argpartition(counts, -self.k)[-self.k:]
+            keys, counts = keys[top], counts[top]
+        self.keys, self.counts = keys, counts
+
+    def set_counts(self, counts):
+        """Replaces the candidates' counts (e.g. after the underlying sketch aged)."""
+        self.counts = np.asarray(counts, dtype=np.int64)
+
+    def items(self):
+        """(key, count) pairs, largest first."""
+        order = np.argsort(-self.counts, kind="stable")
+        return list(zip(self.keys[order].tolist(), self.counts[order].tolist()))
+
+
+class SourceSketches:
+    """
+    Scan / fan-out summaries per source IP over the last one to two
+    `period`s: distinct destination ports, distinct destination hosts and
+    packets, plus the `top_k` sources with the most packets. Two
+    generations are kept; when a period ends the older one is cleared and
+    reused, and queries combine both.
+    """
+
+    def __init__(self, period=60.0, width=4096, depth=3, precision=6, top_k=32):
+        self.period = period
+        self._generations = [self._new(width, depth, precision) for _ in range(2)]
+        self._epoch = None
+        self.top_sources = TopK(top_k)
+
+    @staticmethod
+    def _new(width, depth, precision):
+        return {
+            "ports": DistinctSketch(width, depth, precision),
+            "hosts": DistinctSketch(width, depth, precision),
+            "packets": CountMinSketch(width, depth + 1)
+        }
+
+    def _roll(self, now):
+        epoch = int(now // self.period)
+        if self._epoch is None:
+            self._epoch = epoch
+        elif epoch > self._epoch:
+            older = self._generations.pop()
+            if epoch - self._epoch > 1:
+                for sketch in self._generations[0].values():
+                    sketch.clear()  # Quiet for a whole period: nothing current is left
+            for sketch in older.values():
+                sketch.clear()
+            self._generations.insert(0, older)
+            self._epoch = epoch
+            self.top_sources.set_counts(self._packets(self.top_sources.keys))
+
+    def observe(self, src, dst, dst_port, packets, now):
+        """Adds a batch of flows (packed IPs) to the current generation."""
+        self._roll(now)
+        current = self._generations[0]
+        current["ports"].add(src, dst_port)
+        current["hosts"].add(src, dst)
+        current["packets"].add(src, packets)
+
+    def _packets(self, sources):
+        current, previous = self._generations
+        return current["packets"].query(sources) + previous["packets"].query(sources)
+
+    def heavy_hitters(self, n=None):
+        """[(source IP, packets)] of the heaviest sources over the last one to two periods, largest first."""
+        return [(unpack_ip(key), count) for key, count in self.top_sources.items()[:n] if count > 0]
+
+    QUERY_CHUNK = 4096  # Sources per query: bounds the (sources x registers) gather
+
+    def features(self, src):
+        """SOURCE_FEATURE_COLUMNS for each source, as arrays."""
+        current, previous = self._generations
+        sources, index = np.unique(src, return_inverse=True)
+        ports = np.empty(len(sources))
+        hosts = np.empty(len(sources))
+        for start in range(0, len(sources), self.QUERY_CHUNK):
+            chunk = sources[start:start + self.QUERY_CHUNK]
+            ports[start:start + len(chunk)] = current["ports"].query(chunk, previous["ports"])
+            hosts[start:start + len(chunk)] = current["hosts"].query(chunk, previous["hosts"])
+        packets = self._packets(sources)
+        self.top_sources.offer(sources, packets)
+        index = index.ravel()
+        return {
+            "Src_Distinct_Ports": np.rint(ports).astype(np.int64)[index],
+            "Src_Distinct_Hosts": np.rint(hosts).astype(np.int64)[index],
+            "Src_Packets": packets[index]
+        }
+
+    def annotate(self, df, flow_keys, now):
+        """
+        Observes a batch of flows, then adds the SOURCE_FEATURE_COLUMNS to
+        its feature frame (in place). Returns the flow keys as FlowKeys.
+        """
+        if not isinstance(flow_keys, FlowKeys):
+            keys = list(flow_keys)
+            flow_keys = FlowKeys(
+                np.array([pack_ip(key[0]) for key in keys], dtype=np.uint32),
+                np.array([pack_ip(key[1]) for key in keys], dtype=np.uint32),
+                np.array([key[2] for key in keys], dtype=np.uint16),
+                np.array([key[3] for key in keys], dtype=np.uint8)
+            )
+        if len(df):
+            # Sliding tables re-emit flows each tick: count only their new packets
+            packets = df["Tick_Packets" if "Tick_Packets" in df else "Flow_Packets"].to_numpy()
+            self.observe(flow_keys.src, flow_keys.dst, flow_keys.dst_port, packets, now)
+            for column, values in self.features(flow_keys.src).items():
+                df[column] = values
+        else:
+            for column in SOURCE_FEATURE_COLUMNS:
+                df[column] = np.empty(0, dtype=np.int64)
+        return flow_keys
+
+
+# --- SOURCE ROWS ---
+COLLAPSE_PORTS = 100  # Distinct destination ports a source opens flows to in a window before it becomes one row
+COLLAPSE_HOSTS = 100  # Same for distinct destination hosts
+SOURCE_COUNT_COLUMNS = ["Source_Flows", "Source_Ports"]  # Bookkeeping added by collapse_sources
+
+
+def collapse_sources(df, flow_keys, min_ports=COLLAPSE_PORTS, min_hosts=COLLAPSE_HOSTS):
+    """
+    Replaces a window's flows from each scanning source with one row.
+
+    Only initiator-side flows count (the Initiator column: the source sent
+    the SYN, or the flow is not TCP), so a server answering many client
+    ports is never summed. Sources whose initiator-side flows in this
+    window reach min_ports distinct destination ports or min_hosts
+    distinct hosts have those flows summed into a single row: packets,
+    bytes and the new Tick_Packets add up, TCP flags are OR-ed, the
+    duration is the longest flow's, and the destination port, host and
+    protocol are kept when every flow shares them (0 otherwise). A 10k-port
+    scan is then scored, judged and logged once. Thresholds of None leave
+    every flow its own row: only models trained with the source features
+    have seen summed rows. Returns (df, flow_keys) with bookkeeping columns
+    Source_Flows and Source_Ports (flows and distinct ports each row stands
+    for).
+    """
+    wide = np.zeros(len(df), dtype=bool)
+    if len(df) and min_ports is not None:
+        opened = np.flatnonzero(df[INITIATOR_COLUMN].to_numpy())
+        src = flow_keys.src[opened]
+        sources, group = np.unique(src, return_inverse=True)
+        group = group.ravel()
+        ports = np.bincount(np.unique(group * 65536 + flow_keys.dst_port[opened]) // 65536,
+                            minlength=len(sources))
+        pairs = np.unique(np.stack([group, flow_keys.dst[opened]], axis=1), axis=0)
+        hosts = np.bincount(pairs[:, 0], minlength=len(sources))
+        wide[opened] = ((ports >= min_ports) | (hosts >= min_hosts))[group]
+    if not wide.any():
+        df["Source_Flows"] = np.ones(len(df), dtype=np.int64)
+        df["Source_Ports"] = np.ones(len(df), dtype=np.int64)
+        return df, flow_keys
+
+    import pandas as pd
+    rows = np.flatnonzero(wide)
+    sources, group = np.unique(flow_keys.src[rows], return_inverse=True)
+    order = rows[np.argsort(group.ravel(), kind="stable")]
+    group = np.sort(group.ravel(), kind="stable")
+    starts = np.r_[0, np.flatnonzero(np.diff(group)) + 1]
+
+    def shared(values):
+        """Each group's value where all its rows agree, else 0."""
+        values = np.asarray(values)[order]
+        low, high = np.minimum.reduceat(values, starts), np.maximum.reduceat(values, starts)
+        return np.where(low == high, low, 0)
+
+    def summed(column):
+        return np.add.reduceat(df[column].to_numpy()[order], starts)
+
+    packets, byte_count = summed("Flow_Packets"), summed("Flow_Bytes")
+    duration = np.maximum.reduceat(df["Flow_Duration"].to_numpy()[order], starts)
+    ports = flow_keys.dst_port[order].astype(np.int64)
+    source_rows = pd.DataFrame({
+        "Dst_Port": shared(df["Dst_Port"].to_numpy()),
+        "Protocol": shared(df["Protocol"].to_numpy()),
+        "Flow_Packets": packets,
+        "Flow_Bytes": byte_count,
+        "Flow_Duration": duration,
+        "Packet_Rate": packets / duration,
+        "Byte_Rate": byte_count / duration,
+        "TCP_Flags_Sum": np.bitwise_or.reduceat(df["TCP_Flags_Sum"].to_numpy()[order], starts)
+    })
+    for column in df.columns:
+        if column in SOURCE_FEATURE_COLUMNS:
+            source_rows[column] = df[column].to_numpy()[order][starts]  # Per source already
+        elif column == "Tick_Packets":
+            source_rows[column] = summed(column)
+        elif column == INITIATOR_COLUMN:
+            source_rows[column] = True
+    source_rows["Source_Flows"] = np.diff(np.r_[starts, len(order)])
+    source_rows["Source_Ports"] = np.bincount(np.unique(group * 65536 + ports) // 65536, minlength=len(sources))
+
+    narrow = np.flatnonzero(~wide)
+    kept = df.iloc[narrow]
+    kept = kept.assign(Source_Flows=np.ones(len(kept), dtype=np.int64), Source_Ports=np.ones(len(kept), dtype=np.int64))
+    df = pd.concat([kept, source_rows[kept.columns]], ignore_index=True)
+    flow_keys = FlowKeys(
+        np.concatenate([flow_keys.src[narrow], sources.astype(flow_keys.src.dtype)]),
+        np.concatenate([flow_keys.dst[narrow], shared(flow_keys.dst).astype(flow_keys.dst.dtype)]),
+        np.concatenate([flow_keys.dst_port[narrow], shared(flow_keys.dst_port).astype(flow_keys.dst_port.dtype)]),
+        np.concatenate([flow_keys.proto[narrow], shared(flow_keys.proto).astype(flow_keys.proto.dtype)])
+    )
+    return df, flow_keys
@@ -0,0 +1,139 @@
+import struct
+from collections import namedtuple
+import numpy as np
+from src.feature_extractor import pack_ip
+
+# Deterministic synthetic traffic for benchmarks and tests without a live
+# interface. Profiles draw whole packet columns with NumPy from a seeded
+# generator, so the same seed, mix and rates always give the same stream;
+# the stream can then be rendered as Ethernet frames, Scapy packets or a
+# pcap file that replays through the normal code paths.
+
+SYN, ACK, PSH_ACK, FIN_ACK, SYN_ACK = 0x02, 0x10, 0x18, 0x11, 0x12
+
+# Packet columns, one array each, sorted by timestamp
+Packets = namedtuple("Packets", ["timestamp", "src", "dst", "src_port", "dst_port", "proto", "flags", "length"])
+
+DEFAULT_RATES = {"normal": 2000, "syn_scan": 500, "udp_flood": 5000}  # Packets per second
+
+
+def normal(rng, n, times):
+    """Client/server mix: ~20-packet sessions from 200 hosts to 50 services, mostly TLS/HTTP/DNS."""
+    flows = max(1, n // 20)
+    clients = pack_ip("10.0.0.0") + rng.integers(1, 201, flows)
+    servers = pack_ip("172.16.0.0") + rng.integers(1, 51, flows)
+    services = rng.choice([443, 80, 53, 22, 123, 8080], flows, p=[0.5, 0.2, 0.15, 0.05, 0.05, 0.05])
+    ports = rng.integers(32768, 61000, flows)
+    # Heavy-tailed session sizes: a few flows carry most packets
+    flow = np.minimum(rng.zipf(1.3, n) - 1, flows - 1)
+    dst_port = services[flow]
+    udp = (dst_port == 53) | (dst_port == 123)
+    flags = np.where(udp, 0, rng.choice([ACK, PSH_ACK, SYN, FIN_ACK, SYN_ACK], n, p=[0.55, 0.3, 0.06, 0.05, 0.04]))
+    length = np.where(udp, rng.integers(60, 513, n),
+                      np.where(rng.random(n) < 0.5, 60, rng.integers(200, 1515, n)))
+    return Packets(times, clients[flow], servers[flow], ports[flow], dst_port,
+                   np.where(udp, 17, 6), flags, length)
+
+
+def syn_scan(rng, n, times):
+    """One host sweeping a target's ports with single SYNs."""
+    return Packets(times, np.full(n, pack_ip("192.168.66.6")), np.full(n, pack_ip("172.16.0.10")),
+                   rng.integers(40000, 60000, n), rng.permutation(np.arange(n) % 65535 + 1),
+                   np.full(n, 6), np.full(n, SYN), np.full(n, 60))
+
+
+def udp_flood(rng, n, times):
+    """A handful of sources blasting large datagrams at one DNS server and random ports."""
+    ports = np.where(rng.random(n) < 0.5, 53, rng.integers(1024, 65536, n))
+    return Packets(times, pack_ip("203.0.113.0") + rng.integers(1, 9, n), np.full(n, pack_ip("172.16.0.53")),
+                   rng.integers(1024, 65536, n), ports, np.full(n, 17), np.zeros(n, dtype=np.int64),
+                   rng.integers(512, 1401, n))
+
+
+PROFILES = {
+    "normal": normal,
+    "syn_scan": syn_scan,
+    "udp_flood": udp_flood
+}
+
+
+def parse_rates(text):
+    """'normal=2000,syn_scan=500' -> {profile: packets per second}."""
+    rates = {}
+    for item in text.split(","):
+        name, _, rate = item.partition("=")
+        if name not in PROFILES:
+            raise ValueError(f"unknown traffic profile {name!r} (choose from {', '.join(PROFILES)})")
+        rates[name] = float(rate)
+    return rates
+
+
+def packet_stream(packets, rates=None, seed=42, start=1_700_000_000.0):
+    """
+    `packets` packets of the profile mix, each profile at its rate
+    (packets/sec) over the same span, as timestamp-sorted Packets columns.
+    """
+    rates = rates or DEFAULT_RATES
+    rng = np.random.default_rng(seed)
+    total_rate = sum(rates.values())
+    duration = packets / total_rate
+    counts = np.floor(np.array([rates[name] for name in rates]) * duration).astype(np.int64)
+    counts[0] += packets - counts.sum()
+
+    parts = []
+    for name, count in zip(rates, counts):
+        if count:
+            # Poisson arrivals at the profile's rate
+            times = start + np.cumsum(rng.exponential(1.0 / rates[name], count))
+            parts.append(PROFILES[name](rng, int(count), times))
+    columns = [np.concatenate(column) for column in zip(*parts)]
+    order = np.argsort(columns[0], kind="stable")
+    return Packets(*(column[order] for column in columns))
+
+
+# --- RENDERING ---
+_ETH = struct.Struct("!6s6sH")
+_IPV4 = struct.Struct("!BBHHHBBHII")
+_TCP = struct.Struct("!HHIIBBHHH")
+_UDP = struct.Struct("!HHHH")
+_MACS = b"\x02\x00\x00\x00\x00\x01", b"\x02\x00\x00\x00\x00\x02"
+
+
+def frames(stream):
+    """Ethernet/IPv4/TCP|UDP frames (bytes), zero-padded to each packet's length."""
+    out = []
+    eth = _ETH.pack(*_MACS, 0x0800)
+    for src, dst, sport, dport, proto, flags, length in zip(
+            stream.src.tolist(), stream.dst.tolist(), stream.src_port.tolist(), stream.dst_port.tolist(),
+            stream.proto.tolist(), stream.flags.tolist(), stream.length.tolist()):
+        if proto == 6:
+            l4 = _TCP.pack(sport, dport, 0, 0, 5 << 4, flags, 65535, 0, 0)
+        else:
+            l4 = _UDP.pack(sport, dport, max(8, length - 34), 0)
+        ip_len = max(20 + len(l4), length - 14)
+        ip = _IPV4.pack(0x45, 0, ip_len, 0, 0, 64, proto, 0, src, dst)
+        out.append(eth + ip + l4 + bytes(ip_len - 20 - len(l4)))
+    return out
+
+
+def scapy_packets(stream):
+    """The same stream as dissected Scapy packets (slow to build; use modest counts)."""
+    from scapy.layers.l2 import Ether
+    out = []
+    for frame, timestamp in zip(frames(stream), stream.timestamp.tolist()):
+        packet = Ether(frame)
+        packet.time = timestamp
+        out.append(packet)
+    return out
+
+
+def write_pcap(path, stream):
+    """Writes the stream as a classic little-endian pcap (Ethernet, microsecond timestamps)."""
+    with open(path, "wb") as f:
+        f.write(struct.pack("<IHHiIII", 0xA1B2C3D4, 2, 4, 0, 0, 65535, 1))
+        record = struct.Struct("<IIII")
+        for frame, timestamp in zip(frames(stream), stream.timestamp.tolist()):
+            sec = int(timestamp)
+            f.write(record.pack(sec, int(round((timestamp - sec) * 1e6)) % 1_000_000, len(frame), len(frame)))
+            f.write(frame)
+    return path
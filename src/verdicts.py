@@ -0,0 +1,98 @@
+from collections import OrderedDict, namedtuple
+import numpy as np
+from src.feature_extractor import FlowKeys, unpack_ip
+
+# One verdict per offending source IP per capture window
+SourceVerdict = namedtuple("SourceVerdict", ["source_ip", "worst_score", "flows", "ports", "protocol"])
+
+
+def source_verdicts(flow_keys, scores, labels, row_flows=None, row_ports=None):
+    """
+    Groups a window's anomalous flows by source IP in one vectorized pass.
+
+    Returns SourceVerdicts sorted worst first: the lowest anomaly score of
+    the source's flows (and that flow's protocol), how many of its flows
+    were anomalous and how many distinct destination ports they hit.
+    Accepts FlowKeys columns or the (src, dst, port, proto) tuples of the
+    dict flow table. `row_flows` / `row_ports` give per-row counts for rows that
+    stand for several flows (Source_Flows / Source_Ports of
+    sketches.collapse_sources).
+    """
+    anomalous = np.flatnonzero(np.asarray(labels) == -1)
+    if len(anomalous) == 0:
+        return []
+    scores = np.asarray(scores)[anomalous]
+
+    if isinstance(flow_keys, FlowKeys):
+        src = flow_keys.src[anomalous]
+        ports = flow_keys.dst_port[anomalous].astype(np.int64)
+        protos = flow_keys.proto[anomalous]
+        decode = unpack_ip
+    else:
+        keys = [flow_keys[i] for i in anomalous]
+        src = np.array([key[0] for key in keys])
+        ports = np.array([key[2] for key in keys], dtype=np.int64)
+        protos = np.array([key[3] for key in keys])
+        decode = str
+
+    sources, group = np.unique(src, return_inverse=True)
+    group = group.ravel()
+    distinct_ports = np.bincount(np.unique(group * 65536 + ports) // 65536, minlength=len(sources))
+    if row_ports is not None:
+        np.maximum.at(distinct_ports, group, np.asarray(row_ports, dtype=np.int64)[anomalous])
+    if row_flows is None:
+        flows = np.bincount(group, minlength=len(sources))
+    else:
+        flows = np.bincount(group, weights=np.asarray(row_flows)[anomalous], minlength=len(sources)).astype(np.int64)
+
+    # Worst flow per source: sort by (source, score) and take each group's first row
+    order = np.lexsort((scores, group))
+    first = order[np.r_[0, np.flatnonzero(np.diff(group[order])) + 1]]
+
+    verdicts = [
+        SourceVerdict(decode(sources[g]), float(scores[i]), int(flows[g]), int(distinct_ports[g]), int(protos[i]))
+        for g, i in enumerate(first)
+    ]
+    verdicts.sort(key=lambda v: v.worst_score)
+    return verdicts
+
+
+# Verdict actions, mildest first
+ACTION_RANK = {"LOGGED": 0, "ALERT": 1, "BLOCKED": 2}
+
+
+class VerdictFilter:
+    """
+    Drops repeats of a source's verdict within `hold` seconds.
+
+    A sliding flow table re-emits a flow every tick while it keeps sending,
+    so one attack would otherwise be logged and blocked once per tick. A
+    verdict is acted on when its source is new, when it escalates (LOGGED
+    -> ALERT -> BLOCKED) or once `hold` seconds have passed since the last
+    one acted on. At most `max_sources` sources are remembered, least
+    recently acted on dropped first.
+    """
+
+    def __init__(self, hold=5.0, max_sources=100_000):
+        self.hold = hold
+        self.max_sources = max_sources
+        self._last = OrderedDict()  # source -> (action rank, time acted on)
+
+        # Counters for reporting
+        self.suppressed = 0
+
+    def __len__(self):
+        return len(self._last)
+
+    def admit(self, source, action, now):
+        """True if this verdict should be acted on (and remembers it)."""
+        rank = ACTION_RANK[action]
+        last = self._last.get(source)
+        if last is not None and rank <= last[0] and now - last[1] < self.hold:
+            self.suppressed += 1
+            return False
+        self._last[source] = (rank, now)
+        self._last.move_to_end(source)
+        if len(self._last) > self.max_sources:
+            self._last.popitem(last=False)
+        return True
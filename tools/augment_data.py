@@ -1,47 +1,212 @@
-import pandas as pd
-import random
+import argparse
+import os
+import time
 import numpy as np
+import pandas as pd
 
 # CONFIGURATION
-OUTPUT_FILE = "data/attack_traffic.csv"
+OUTPUT_FILE = "data/attack_traffic.csv"  # .csv or .parquet (needs pyarrow)
 NUM_ROWS = 1000  # We want 1000 attack examples
+CHUNK_ROWS = 1_000_000  # Rows generated and written per chunk (bounds memory)
+SEED = 42
+
+COLUMNS = ["Dst_Port", "Protocol", "Flow_Packets", "Flow_Bytes",
+           "Flow_Duration", "Packet_Rate", "Byte_Rate", "TCP_Flags_Sum",
+           "Src_Distinct_Ports", "Src_Distinct_Hosts", "Src_Packets"]
+
+# TCP flag sums as the sensor accumulates them
+SYN, RST, ACK, SYN_ACK, NULL, XMAS = 2, 4, 16, 18, 0, 41
+
+
+# --- ATTACK FAMILIES ---
+# Each family draws n flows at once: (dst_port, protocol, packets, bytes per packet, duration, tcp_flags)
+# followed by the attacker's source context, as the sensor's sketches see it
+# over the same period: (distinct dst ports, distinct dst hosts, packets)
+
+def source_context(rng, n, packets, ports, hosts, flows_per_target=(1, 2)):
+    """Per-source totals for flows of `packets` packets from sources hitting ports x hosts targets."""
+    targets = ports * hosts
+    src_packets = targets * rng.integers(*flows_per_target, n, endpoint=True) * np.maximum(packets, 1)
+    return ports, hosts, np.maximum(src_packets, packets)
+
+
+def syn_scan(rng, n):
+    """Fast port sweep: 1-3 SYNs per port, answered by RST or nothing. A third sweep hosts, not ports."""
+    packets = rng.integers(1, 4, n)
+    horizontal = rng.random(n) < 0.3
+    ports = np.where(horizontal, rng.integers(1, 4, n), rng.integers(100, 5001, n))
+    hosts = np.where(horizontal, rng.integers(50, 1025, n), rng.integers(1, 4, n))
+    return (rng.integers(1, 65536, n), np.full(n, 6), packets, rng.integers(40, 61, n),
+            rng.uniform(0.0005, 0.05, n), rng.choice([SYN, SYN | RST], n),
+            *source_context(rng, n, packets, ports, hosts))
+
+
+def slow_scan(rng, n):
+    """Low-and-slow sweep: single probes spread out in time (few targets per sketch period)."""
+    packets = rng.integers(1, 3, n)
+    return (rng.integers(1, 65536, n), np.full(n, 6), packets, rng.integers(40, 61, n),
+            rng.uniform(0.5, 5.0, n), np.full(n, SYN),
+            *source_context(rng, n, packets, rng.integers(10, 301, n), rng.integers(1, 6, n)))
+
+
+def stealth_scan(rng, n):
+    """NULL / Xmas probes that dodge naive SYN detection."""
+    packets = rng.integers(1, 3, n)
+    return (rng.integers(1, 65536, n), np.full(n, 6), packets, rng.integers(40, 61, n),
+            rng.uniform(0.0005, 0.05, n), rng.choice([NULL, XMAS], n),
+            *source_context(rng, n, packets, rng.integers(100, 5001, n), rng.integers(1, 4, n)))
+
+
+def syn_flood(rng, n):
+    """SYN flood against a web port: few targets, many flows each."""
+    packets = rng.integers(500, 5001, n)
+    return (rng.choice([80, 443], n), np.full(n, 6), packets, rng.integers(40, 61, n),
+            rng.uniform(0.01, 2.0, n), np.full(n, SYN),
+            *source_context(rng, n, packets, rng.integers(1, 3, n), np.ones(n, dtype=np.int64), (1, 50)))
+
+
+def udp_flood(rng, n):
+    """Volumetric UDP, partly aimed at amplification-prone services."""
+    ports = np.where(rng.random(n) < 0.5, rng.choice([53, 123, 1900, 11211], n), rng.integers(1024, 65536, n))
+    packets = rng.integers(500, 5001, n)
+    return (ports, np.full(n, 17), packets, rng.integers(512, 1501, n),
+            rng.uniform(0.1, 2.0, n), np.zeros(n, dtype=np.int64),
+            *source_context(rng, n, packets, rng.integers(1, 21, n), rng.integers(1, 4, n), (1, 20)))
+
+
+def legacy(rng, n):
+    """The original generator's mix: random high ports, scan-or-flood packet counts."""
+    ports = np.where(rng.random(n) < 2 / 64513, rng.choice([80, 443], n), rng.integers(1024, 65535, n))
+    packets = np.where(rng.random(n) > 0.5, rng.integers(1, 51, n), rng.integers(500, 5001, n))
+    return (ports, rng.choice([6, 17], n), packets, rng.integers(60, 1501, n),
+            rng.uniform(0.001, 2.0, n), rng.choice([SYN, ACK, SYN_ACK, NULL, XMAS], n),
+            *source_context(rng, n, packets, rng.integers(1, 51, n), rng.integers(1, 6, n)))
+
+
+FAMILIES = {
+    "syn_scan": syn_scan,
+    "slow_scan": slow_scan,
+    "stealth_scan": stealth_scan,
+    "syn_flood": syn_flood,
+    "udp_flood": udp_flood,
+    "legacy": legacy
+}
+
+DEFAULT_MIX = {"syn_scan": 0.3, "slow_scan": 0.15, "stealth_scan": 0.15, "syn_flood": 0.2, "udp_flood": 0.2}
+
+
+def generate_chunk(rng, n, mix):
+    """n attack flows, families drawn by the mix weights and interleaved."""
+    names = list(mix)
+    weights = np.array([mix[name] for name in names], dtype=np.float64)
+    counts = rng.multinomial(n, weights / weights.sum())
+
+    parts = [FAMILIES[name](rng, count) for name, count in zip(names, counts) if count]
+    port, proto, packets, packet_bytes, duration, flags, src_ports, src_hosts, src_packets = (
+        np.concatenate(column) for column in zip(*parts))
+    flow_bytes = packets * packet_bytes
+
+    df = pd.DataFrame({
+        "Dst_Port": port.astype(np.int64),
+        "Protocol": proto.astype(np.int64),
+        "Flow_Packets": packets.astype(np.int64),
+        "Flow_Bytes": flow_bytes.astype(np.int64),
+        "Flow_Duration": duration,
+        # ATTACK BEHAVIOR: Massive Packet Rate (The key anomaly)
+        "Packet_Rate": packets / duration,
+        "Byte_Rate": flow_bytes / duration,
+        "TCP_Flags_Sum": flags.astype(np.int64),
+        "Src_Distinct_Ports": src_ports.astype(np.int64),
+        "Src_Distinct_Hosts": src_hosts.astype(np.int64),
+        "Src_Packets": src_packets.astype(np.int64)
+    }, columns=COLUMNS)
+    return df.iloc[rng.permutation(n)].reset_index(drop=True)
+
+
+class ChunkWriter:
+    """Appends DataFrame chunks to one CSV or Parquet file."""
+
+    def __init__(self, path):
+        self.path = path
+        self.parquet = path.endswith(".parquet")
+        self._writer = None
+        self._header = True
+
+    def write(self, df):
+        if not self.parquet:
+            df.to_csv(self.path, mode="w" if self._header else "a", header=self._header, index=False)
+            self._header = False
+            return
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        if self._writer is None:
+            self._writer = pq.ParquetWriter(self.path, table.schema)
+        self._writer.write_table(table)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+
+def parse_mix(text):
+    """'syn_scan=0.5,udp_flood=0.5' -> {family: weight}."""
+    mix = {}
+    for item in text.split(","):
+        name, _, weight = item.partition("=")
+        if name not in FAMILIES:
+            raise argparse.ArgumentTypeError(f"unknown attack family {name!r} (choose from {', '.join(FAMILIES)})")
+        try:
+            mix[name] = float(weight or 1)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"weight of {name} is not a number: {weight!r}")
+        if not 0 <= mix[name] < float("inf"):
+            raise argparse.ArgumentTypeError(f"weight of {name} must be a finite number >= 0, got {weight}")
+    if sum(mix.values()) <= 0:
+        raise argparse.ArgumentTypeError("at least one family needs a weight above 0")
+    return mix
+
+
+def augment(rows=NUM_ROWS, out=OUTPUT_FILE, mix=None, seed=SEED, chunk_rows=CHUNK_ROWS):
+    """Streams `rows` synthetic attack flows to `out`; same seed + settings -> same file."""
+    mix = mix or DEFAULT_MIX
+    if min(mix.values()) < 0 or sum(mix.values()) <= 0:
+        print(f"❌ Error: mix weights must be >= 0 with at least one above 0, got {mix}")
+        return
+    if out.endswith(".parquet"):
+        try:
+            import pyarrow  # noqa: F401
+        except ModuleNotFoundError:
+            print("❌ Error: Parquet output needs pyarrow (pip install pyarrow), or use a .csv path.")
+            return
+    if os.path.dirname(out):
+        os.makedirs(os.path.dirname(out), exist_ok=True)
+
+    print(f"🧪 generating {rows:,} synthetic attack flows "
+          f"({', '.join(f'{name} {weight:g}' for name, weight in mix.items())})...")
+    rng = np.random.default_rng(seed)
+    writer = ChunkWriter(out)
+    started = time.perf_counter()
+    written = 0
+    try:
+        while written < rows:
+            df = generate_chunk(rng, min(chunk_rows, rows - written), mix)
+            writer.write(df)
+            written += len(df)
+    finally:
+        writer.close()
+
+    elapsed = time.perf_counter() - started
+    print(f"✅ Success! Saved {written:,} rows to {out} in {elapsed:.1f}s ({written / max(elapsed, 1e-9):,.0f} rows/sec)")
+
 
-print(f"🧪 generating {NUM_ROWS} synthetic attack flows...")
-
-data = []
-
-for _ in range(NUM_ROWS):
-    # 1. ATTACK BEHAVIOR: Random High Ports (Scanning)
-    dst_port = random.choice([80, 443] + list(range(1024, 65535)))
-    
-    # 2. ATTACK BEHAVIOR: TCP (Scan) or UDP (Flood)
-    protocol = random.choice([6, 17])
-    
-    # 3. ATTACK BEHAVIOR: Low Packet Count (Scan) or High (Flood)
-    flow_packets = random.randint(1, 50) if random.random() > 0.5 else random.randint(500, 5000)
-    
-    # 4. ATTACK BEHAVIOR: Fast Duration (Machine speed, not Human speed)
-    flow_duration = random.uniform(0.001, 2.0)
-    
-    # 5. ATTACK BEHAVIOR: Massive Packet Rate (The key anomaly)
-    # Normal is ~10-100. Attack is 500-100,000.
-    packet_rate = flow_packets / flow_duration if flow_duration > 0 else 0
-    
-    # Calculate bytes (approximate)
-    flow_bytes = flow_packets * random.randint(60, 1500)
-    byte_rate = flow_bytes / flow_duration if flow_duration > 0 else 0
-    
-    # 6. ATTACK BEHAVIOR: Weird Flags (SYN flood, etc)
-    tcp_flags = random.choice([2, 16, 18, 0, 41]) # SYN, ACK, SYN-ACK, NULL, etc.
-
-    data.append([dst_port, protocol, flow_packets, flow_bytes, flow_duration, packet_rate, byte_rate, tcp_flags])
-
-# Create DataFrame
-columns = ["Dst_Port", "Protocol", "Flow_Packets", "Flow_Bytes", 
-           "Flow_Duration", "Packet_Rate", "Byte_Rate", "TCP_Flags_Sum"]
-df = pd.DataFrame(data, columns=columns)
-
-# Save
-df.to_csv(OUTPUT_FILE, index=False)
-print(f"✅ Success! Saved {len(df)} rows to {OUTPUT_FILE}")
-print(df.head())
\ No newline at end of file
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate synthetic attack flows")
+    parser.add_argument("--rows", type=int, default=NUM_ROWS)
+    parser.add_argument("--out", default=OUTPUT_FILE, help="Output file (.csv or .parquet)")
+    parser.add_argument("--mix", type=parse_mix, default=None,
+                        help=f"family=weight,... from: {', '.join(FAMILIES)} (default: {DEFAULT_MIX})")
+    parser.add_argument("--seed", type=int, default=SEED)
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    args = parser.parse_args()
+    augment(args.rows, args.out, args.mix, args.seed, args.chunk_rows)
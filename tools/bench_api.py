@@ -0,0 +1,98 @@
+import sys
+import os
+
+# --- BULLETPROOF IMPORT FIX ---
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.dirname(current_dir))
+# -----------------------------
+
+import argparse
+import asyncio
+import random
+import time
+import warnings
+import numpy as np
+import httpx
+
+warnings.filterwarnings("ignore")  # sklearn version chatter on model load
+import api
+from src.micro_batcher import MicroBatcher
+
+# Concurrent-load benchmark for /analyze, run in-process over ASGI.
+# Compares one decision_function call per request (MAX_BATCH <= 1) with
+# the micro-batcher, reporting p50/p99 latency and throughput.
+
+
+def random_flow(rng):
+    packets = rng.randint(1, 500)
+    duration = rng.uniform(0.001, 5.0)
+    flow_bytes = packets * rng.randint(60, 1500)
+    return {
+        "dst_port": rng.choice([53, 80, 443, rng.randint(1024, 65535)]),
+        "protocol": rng.choice([6, 17]),
+        "flow_packets": packets,
+        "flow_bytes": flow_bytes,
+        "flow_duration": duration,
+        "packet_rate": packets / duration,
+        "byte_rate": flow_bytes / duration,
+        "tcp_flags_sum": rng.choice([2, 16, 18, 24])
+    }
+
+
+async def run_load(total, concurrency, seed=42):
+    rng = random.Random(seed)
+    flows = [random_flow(rng) for _ in range(total)]
+    latencies = []
+    transport = httpx.ASGITransport(app=api.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        queue = asyncio.Queue()
+        for flow in flows:
+            queue.put_nowait(flow)
+
+        async def client_loop():
+            while not queue.empty():
+                flow = queue.get_nowait()
+                t0 = time.perf_counter()
+                r = await client.post("/analyze", json=flow)
+                latencies.append(time.perf_counter() - t0)
+                r.raise_for_status()
+
+        started = time.perf_counter()
+        await asyncio.gather(*(client_loop() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    ms = np.array(latencies) * 1000
+    return {
+        "requests": total,
+        "throughput_rps": total / elapsed,
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p99_ms": float(np.percentile(ms, 99))
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark /analyze under concurrent load")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--max-wait-ms", type=float, default=api.MICROBATCH_MAX_WAIT_MS)
+    parser.add_argument("--max-batch", type=int, default=api.MICROBATCH_MAX_BATCH)
+    args = parser.parse_args()
+
+    modes = [
+        ("per-request", None),
+        (f"micro-batch (wait {args.max_wait_ms}ms, max {args.max_batch})",
+         MicroBatcher(api.score_matrix, args.max_wait_ms, args.max_batch))
+    ]
+    print(f"⏱️  /analyze: {args.requests} requests, {args.concurrency} concurrent clients")
+    for name, batcher in modes:
+        api.batcher = batcher
+        result = asyncio.run(run_load(args.requests, args.concurrency))
+        extra = ""
+        if batcher is not None and batcher.batches:
+            extra = f" | mean batch {batcher.rows / batcher.batches:.1f} rows"
+        print(f"   {name:<40} {result['throughput_rps']:8.0f} req/s | "
+              f"p50 {result['p50_ms']:7.1f} ms | p99 {result['p99_ms']:7.1f} ms{extra}")
+
+
+if __name__ == "__main__":
+    main()
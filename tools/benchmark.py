@@ -0,0 +1,423 @@
+import sys
+import os
+
+# --- BULLETPROOF IMPORT FIX ---
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.dirname(current_dir))
+# -----------------------------
+
+import argparse
+import asyncio
+import json
+import platform
+import subprocess
+import tempfile
+import time
+import warnings
+from datetime import datetime, timezone
+import numpy as np
+import pandas as pd
+
+warnings.filterwarnings("ignore")  # sklearn version chatter on model load
+from main import collapse_thresholds
+from src.feature_extractor import FLOW_TABLES, model_columns
+from src.model_registry import ModelRegistry
+from src.pcap_reader import replay_windows
+from src.sketches import SourceSketches, collapse_sources
+from src.synthetic_traffic import DEFAULT_RATES, Packets, frames, packet_stream, parse_rates, \
+    scapy_packets, write_pcap
+from src.verdicts import source_verdicts
+
+# Reproducible end-to-end benchmark on synthetic traffic (src/synthetic_traffic.py):
+#   ingest   packets/sec through each flow table (raw frames and Scapy packets)
+#   extract  extract_features() latency against the number of open flows
+#   score    model rows/sec against batch size
+#   window   per-window analysis latency (extract + sketch + score + verdicts),
+#            checked against the WINDOW_BUDGET_MS claim
+#   replay   pcap replay packets/sec, read to scored flows
+#   api      /analyze requests/sec through an in-process ASGI client
+#   startup  cold-start time, peak RSS and heavy modules loaded per entry point
+# Results are written as JSON; --compare flags regressions against an
+# earlier run (e.g. the previous commit's) on the same machine.
+
+MODEL_ARTIFACT = "models/isolation_forest.flat"
+MODEL_PATH = "models/isolation_forest.pkl"
+WINDOW = 5  # Seconds per tumbling window (main.py CAPTURE_WINDOW)
+TICK = 1  # Seconds between sliding-table emissions (main.py CAPTURE_TICK)
+WINDOW_BUDGET_MS = 50  # README: "<50ms processing time per window"
+REGRESSION_THRESHOLD = 0.10  # --compare: relative slowdown reported as a regression
+
+# Entry points started from a cold interpreter: script + argv, or code to run
+STARTUP_ENTRIES = {
+    "main": ("main.py", ["--help"]),
+    "agent_ready": (None, ["import main; main.NIDS(backend='raw', metrics_port=0)"]),  # Model loaded, capture built
+    "api": (None, ["import api"]),
+    "collector": ("collector.py", ["--help"]),
+    "capture_baseline": ("tools/capture_baseline.py", ["--help"])
+}
+HEAVY_MODULES = ["scapy.all", "scapy.layers.inet", "pandas", "sklearn", "joblib", "fastapi"]
+_STARTUP_PROBE = """
+import json, runpy, sys, time
+started = time.perf_counter()
+script, args = sys.argv[1], sys.argv[2:]
+if script:
+    sys.argv = [script] + args
+    try:
+        runpy.run_path(script, run_name="__main__")
+    except SystemExit:
+        pass
+else:
+    exec(args[0])
+seconds = time.perf_counter() - started
+try:  # Peak RSS of this process after exec (ru_maxrss would include the forking parent's on Linux)
+    with open("/proc/self/status") as f:
+        rss_mb = next(int(line.split()[1]) for line in f if line.startswith("VmHWM")) / 1024
+except OSError:
+    import resource
+    rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1 << 20)  # bytes on macOS
+print(json.dumps({"seconds": seconds, "rss_mb": rss_mb,
+                  "modules": [name for name in %r if name in sys.modules]}))
+""" % (HEAVY_MODULES,)
+
+# (full run, --quick)
+SIZES = {
+    "ingest_packets": (200_000, 30_000),
+    "scapy_packets": (20_000, 3_000),
+    "flow_counts": ([1_000, 10_000, 100_000], [1_000, 10_000]),
+    "batch_sizes": ([1, 16, 256, 4096, 65536], [1, 256, 4096]),
+    "window_seconds": (60, 20),
+    "api_requests": (2_000, 300),
+    "repeat": (5, 3)
+}
+
+
+def timed(fn, repeat):
+    """Median wall time of fn() over `repeat` runs, in seconds."""
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - started)
+    return float(np.median(times))
+
+
+def unique_flows(n, start=1_700_000_000.0):
+    """n packets, each opening a flow of its own (distinct sources and ports)."""
+    i = np.arange(n, dtype=np.int64)
+    return Packets(start + i * 1e-6, 0x0A000000 + i // 1000, np.full(n, 0xAC100001), 40000 + i % 1000,
+                   1 + i % 1000, np.full(n, 6), np.full(n, 0x02), np.full(n, 60))
+
+
+def fill(table, rendered, timestamps):
+    for frame, timestamp in zip(rendered, timestamps):
+        table.process_frame(frame, timestamp)
+
+
+# --- SECTIONS ---
+def bench_ingest(args, stream):
+    """Packets/sec accounted by each flow table."""
+    rendered, timestamps = frames(stream), stream.timestamp.tolist()
+    packets = scapy_packets(Packets(*(column[:args.scapy_packets] for column in stream)))
+    results = {}
+    for name, table_class in FLOW_TABLES.items():
+        def frames_run():
+            fill(table_class(), rendered, timestamps)
+
+        def scapy_run():
+            table = table_class()
+            for packet in packets:
+                table.process_packet(packet)
+
+        results[name] = {
+            "frame_pps": len(rendered) / timed(frames_run, args.repeat),
+            "scapy_pps": len(packets) / timed(scapy_run, args.repeat)
+        }
+        print(f"   {name:<8} frames {results[name]['frame_pps']:10,.0f} packets/sec | "
+              f"scapy {results[name]['scapy_pps']:9,.0f} packets/sec")
+    return results
+
+
+def bench_extract(args):
+    """extract_features() latency by open-flow count (persistent tables flushed first)."""
+    results = {}
+    for n in args.flow_counts:
+        stream = unique_flows(n)
+        rendered, timestamps = frames(stream), stream.timestamp.tolist()
+        for name, table_class in FLOW_TABLES.items():
+            times = []
+            for _ in range(args.repeat):
+                table = table_class()
+                fill(table, rendered, timestamps)
+                table.flush()
+                started = time.perf_counter()
+                df, _ = table.extract_features()
+                times.append(time.perf_counter() - started)
+                assert len(df) == n, f"{name}: {len(df)} flows extracted, expected {n}"
+            results[f"{name}_{n}_ms"] = float(np.median(times)) * 1000
+        print(f"   {n:>7} flows  " + " | ".join(f"{name} {results[f'{name}_{n}_ms']:7.2f} ms"
+                                                for name in FLOW_TABLES))
+    return results
+
+
+def feature_matrix(model, stream, rows):
+    """`rows` model input rows drawn from the flows of the synthetic stream."""
+    table = FLOW_TABLES["array"]()
+    fill(table, frames(stream), stream.timestamp.tolist())
+    df, flow_keys = table.extract_features()
+    SourceSketches().annotate(df, flow_keys, float(stream.timestamp[-1]))
+    matrix = df[model_columns(model.n_features)].to_numpy(dtype=np.float64)
+    return matrix[np.arange(rows) % len(matrix)]
+
+
+def bench_score(args, model, stream):
+    """Model throughput and per-call latency by batch size."""
+    matrix = feature_matrix(model, stream, max(args.batch_sizes))
+    results = {}
+    for size in args.batch_sizes:
+        batch = matrix[:size]
+        calls = max(args.repeat, 20_000 // size)  # Enough calls to time small batches
+        seconds = timed(lambda: [model.decision_function(batch) for _ in range(calls)], args.repeat)
+        results[f"batch_{size}"] = {"rows_per_sec": size * calls / seconds, "call_ms": seconds / calls * 1000}
+        print(f"   batch {size:>6}  {results[f'batch_{size}']['rows_per_sec']:12,.0f} rows/sec | "
+              f"{results[f'batch_{size}']['call_ms']:8.3f} ms/call")
+    return results
+
+
+def bench_window(args, model, stream):
+    """
+    Per-window analysis latency as in NIDS.analyze_traffic: extract, source
+    sketches and rows, scoring and per-source verdicts. Packet accounting happens on
+    the capture thread and is not part of a window's processing time.
+    """
+    columns = model_columns(model.n_features)
+    thresholds = collapse_thresholds(model.n_features)
+    results = {}
+    for name, options, interval in (("array", {}, WINDOW), ("sliding", {"window": WINDOW, "tick": TICK}, TICK)):
+        table, sketches = FLOW_TABLES[name](**options), SourceSketches()
+        timestamps = stream.timestamp
+        edges = np.arange(timestamps[0] - timestamps[0] % interval, timestamps[-1] + interval, interval)
+        bounds = np.searchsorted(timestamps, edges)
+        rendered = frames(stream)
+        latencies, flows = [], []
+        for end_time, lo, hi in zip(edges[1:], bounds[:-1], bounds[1:]):
+            fill(table, rendered[lo:hi], timestamps[lo:hi].tolist())
+            started = time.perf_counter()
+            df, flow_keys = table.extract_features(end_time) if table.persistent else table.extract_features()
+            if not df.empty:
+                flow_keys = sketches.annotate(df, flow_keys, end_time)
+                flows.append(len(df))
+                df, flow_keys = collapse_sources(df, flow_keys, *thresholds)
+                scores, predictions = model.score(df[columns])
+                for _ in source_verdicts(flow_keys, scores, predictions, df["Source_Flows"], df["Source_Ports"]):
+                    pass
+            else:
+                flows.append(0)
+            latencies.append(time.perf_counter() - started)
+        ms = np.array(latencies[1:] or latencies) * 1000  # The first window warms caches
+        results[name] = {
+            "interval_s": interval,
+            "windows": len(latencies),
+            "mean_flows": float(np.mean(flows)),
+            "p50_ms": float(np.percentile(ms, 50)),
+            "p99_ms": float(np.percentile(ms, 99)),
+            "max_ms": float(ms.max())
+        }
+        status = "✅" if results[name]["p99_ms"] < WINDOW_BUDGET_MS else "❌ over budget"
+        print(f"   {name:<8} {interval}s windows, {results[name]['mean_flows']:,.0f} flows avg | "
+              f"p50 {results[name]['p50_ms']:6.2f} ms | p99 {results[name]['p99_ms']:6.2f} ms "
+              f"(budget {WINDOW_BUDGET_MS} ms) {status}")
+    return results
+
+
+def bench_replay(args, model, stream, pcap_path):
+    """Offline replay of the synthetic pcap: read, parse, account, extract and score."""
+    write_pcap(pcap_path, stream)
+    columns = model_columns(model.n_features)
+    sketches = SourceSketches()
+    started = time.perf_counter()
+    packets = flows = 0
+    for window_start, window_packets, df, flow_keys in replay_windows(pcap_path, FLOW_TABLES["array"](), WINDOW):
+        sketches.annotate(df, flow_keys, window_start + WINDOW)
+        model.score(df[columns])
+        packets += window_packets
+        flows += len(df)
+    elapsed = time.perf_counter() - started
+    results = {"packets": packets, "flows": flows, "pps": packets / elapsed}
+    print(f"   {os.path.basename(pcap_path)}: {packets} packets, {flows} flows | {results['pps']:,.0f} packets/sec")
+    return results
+
+
+def bench_api(args):
+    """/analyze requests/sec, one client and many (tools/bench_api.py load generator)."""
+    import api  # Loads the model from models/ like a served worker
+    from bench_api import run_load
+    results = {}
+    for concurrency in (1, 64):
+        result = asyncio.run(run_load(args.api_requests, concurrency, args.seed))
+        results[f"concurrency_{concurrency}"] = {key: result[key] for key in ("throughput_rps", "p50_ms", "p99_ms")}
+        print(f"   {concurrency:>3} client(s) {result['throughput_rps']:8.0f} req/s | "
+              f"p50 {result['p50_ms']:7.2f} ms | p99 {result['p99_ms']:7.2f} ms")
+    return results
+
+
+def startup_run(script, args):
+    """One cold start: (wall seconds, import/run seconds, peak RSS MB, heavy modules)."""
+    root = os.path.dirname(current_dir)
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [root, os.environ.get("PYTHONPATH")])))
+    started = time.perf_counter()
+    out = subprocess.run([sys.executable, "-c", _STARTUP_PROBE, os.path.join(root, script) if script else "", *args],
+                         capture_output=True, text=True, env=env, check=True).stdout
+    wall = time.perf_counter() - started
+    probe = json.loads(out.strip().splitlines()[-1])
+    return wall, probe["seconds"], probe["rss_mb"], probe["modules"]
+
+
+def bench_startup(args):
+    """Cold-start latency and memory of each entry point (run from a directory with models/)."""
+    results = {}
+    for name, (script, entry_args) in STARTUP_ENTRIES.items():
+        runs = [startup_run(script, entry_args) for _ in range(args.repeat)]
+        results[name] = {
+            "wall_ms": float(np.median([run[0] for run in runs])) * 1000,
+            "import_ms": float(np.median([run[1] for run in runs])) * 1000,
+            "rss_mb": max(run[2] for run in runs),
+            "heavy_modules": runs[-1][3]
+        }
+        print(f"   {name:<17} {results[name]['wall_ms']:7.0f} ms wall | {results[name]['import_ms']:7.0f} ms "
+              f"import | {results[name]['rss_mb']:6.1f} MB | {', '.join(runs[-1][3]) or 'no heavy modules'}")
+    return results
+
+
+SECTIONS = ["ingest", "extract", "score", "window", "replay", "api", "startup"]
+
+
+# --- RESULTS ---
+def run_meta(args):
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(current_dir), timeout=10).stdout.strip() or None
+    except (OSError, subprocess.TimeoutExpired):
+        commit = None
+    return {
+        "commit": commit,
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "seed": args.seed,
+        "rates": args.rates,
+        "quick": args.quick
+    }
+
+
+def flatten(results, prefix=""):
+    """{"score": {"batch_1": {"rows_per_sec": x}}} -> {"score.batch_1.rows_per_sec": x}."""
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{prefix}{key}."))
+        else:
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+
+def higher_is_better(metric):
+    return metric.endswith(("pps", "rows_per_sec", "throughput_rps"))
+
+
+def lower_is_better(metric):
+    return metric.endswith(("_ms", "_mb"))
+
+
+def compare(old_path, meta, results, threshold=REGRESSION_THRESHOLD):
+    """Prints metrics that moved more than `threshold`; returns the regression count."""
+    with open(old_path) as f:
+        old = json.load(f)
+    before, after = flatten(old["results"]), flatten(results)
+    regressions = 0
+    print(f"\n📈 Against {old_path} (commit {old['meta'].get('commit')}, threshold {threshold:.0%})")
+    for key in ("seed", "rates", "quick", "cpus"):
+        if old["meta"].get(key) != meta[key]:
+            print(f"   ⚠️  {key} differs ({old['meta'].get(key)} vs {meta[key]}): results are not comparable")
+    for metric in sorted(before.keys() & after.keys()):
+        if not (higher_is_better(metric) or lower_is_better(metric)) or not before[metric]:
+            continue
+        change = (after[metric] - before[metric]) / before[metric]
+        worse = -change if higher_is_better(metric) else change
+        if abs(change) < threshold:
+            continue
+        regressions += worse > 0
+        print(f"   {'❌' if worse > 0 else '✅'} {metric:<42} {before[metric]:14,.2f} -> {after[metric]:14,.2f} "
+              f"({change:+.1%})")
+    if not regressions:
+        print("   No regressions.")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reproducible 0xGuard benchmark on synthetic traffic")
+    parser.add_argument("--rate", default=",".join(f"{name}={pps}" for name, pps in DEFAULT_RATES.items()),
+                        help="Traffic mix as profile=packets_per_sec,... (normal, syn_scan, udp_flood)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--quick", action="store_true", help="Smaller sizes for a fast smoke run")
+    parser.add_argument("--only", nargs="+", choices=SECTIONS, default=SECTIONS)
+    parser.add_argument("--out", help="Write results as JSON (default: benchmarks/<commit>.json)")
+    parser.add_argument("--compare", help="Earlier results JSON to diff against")
+    parser.add_argument("--pcap-out", help="Keep the synthetic replay pcap at this path")
+    args = parser.parse_args()
+
+    args.rates = parse_rates(args.rate)
+    for name, sizes in SIZES.items():
+        setattr(args, name, sizes[args.quick])
+
+    meta = run_meta(args)
+    total_rate = sum(args.rates.values())
+    print(f"⏱️  0xGuard benchmark @ {meta['commit']} ({meta['cpus']} CPUs, seed {args.seed}, "
+          f"{total_rate:,.0f} packets/sec: {args.rate})")
+    stream = packet_stream(args.ingest_packets, args.rates, args.seed)
+    window_stream = packet_stream(int(total_rate * args.window_seconds), args.rates, args.seed)
+    model = None
+    if {"score", "window", "replay"} & set(args.only):
+        models = ModelRegistry(MODEL_ARTIFACT, MODEL_PATH)
+        models.load()
+        model = models.current
+
+    results = {}
+    if "ingest" in args.only:
+        print("📥 Ingest")
+        results["ingest"] = bench_ingest(args, stream)
+    if "extract" in args.only:
+        print("🧮 Feature extraction")
+        results["extract"] = bench_extract(args)
+    if "score" in args.only:
+        print(f"🧠 Scoring (model {model.version}, {model.n_features} features)")
+        results["score"] = bench_score(args, model, stream)
+    if "window" in args.only:
+        print(f"🪟 Window analysis ({args.window_seconds}s of traffic)")
+        results["window"] = bench_window(args, model, window_stream)
+    if "replay" in args.only:
+        print("🔁 Pcap replay")
+        with tempfile.TemporaryDirectory() as tmp:
+            results["replay"] = bench_replay(args, model, window_stream,
+                                             args.pcap_out or os.path.join(tmp, "synthetic.pcap"))
+    if "api" in args.only:
+        print("🌐 /analyze")
+        results["api"] = bench_api(args)
+    if "startup" in args.only:
+        print("🚀 Cold start")
+        results["startup"] = bench_startup(args)
+
+    out = args.out or os.path.join("benchmarks", f"{meta['commit'] or 'results'}.json")
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w") as f:
+        json.dump({"meta": meta, "results": results}, f, indent=2)
+    print(f"💾 Results written to {out}")
+
+    if args.compare and compare(args.compare, meta, results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
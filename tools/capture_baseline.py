@@ -3,36 +3,174 @@ import os
 
 # --- BULLETPROOF IMPORT FIX ---
 current_dir = os.path.dirname(os.path.abspath(__file__))
-sys.path.append(current_dir)
+sys.path.append(os.path.dirname(current_dir))
 # -----------------------------
 
-from scapy.all import sniff
-from src.feature_extractor import FlowExtractor
-import pandas as pd
+from main import EMIT_INTERVAL, FLOW_OPTIONS, FLOW_TABLE, SKETCH_PERIOD, collapse_thresholds
+from src.capture_backends import CAPTURE_BACKENDS
+from src.feature_extractor import FEATURE_COLUMNS, FLOW_TABLES, SOURCE_FEATURE_COLUMNS
+from src.pcap_reader import replay_windows
+from src.sketches import SourceSketches, collapse_sources
+import argparse
+import json
+import threading
+import numpy as np
 import time
 
 # CONFIGURATION
 # 1200 seconds = 20 Minutes (The "Gold Standard" for baseline)
-CAPTURE_SECONDS = 1200 
+CAPTURE_SECONDS = 1200
+OUTPUT_FILE = os.path.join(current_dir, "data/normal_shiva.csv")
+# Flows are built with main.py's FLOW_TABLE / FLOW_OPTIONS, extracted every EMIT_INTERVAL and
+# collapsed per scanning source, so the model (trained with the source features) sees the rows the agent scores
+PROGRESS_SECONDS = 10  # How often live progress is printed
+CHECKPOINT_SECONDS = 60  # How often progress and open flows are saved for --resume
 
-print(f"🔵 STARTING BASELINE CAPTURE ({CAPTURE_SECONDS}s)...")
-print("⚡ ACTION REQUIRED: Go watch 4K YouTube, download files, and browse now!")
 
-extractor = FlowExtractor()
+class BaselineRecorder:
+    """
+    Capture sink that writes flows to a CSV as they are emitted, so memory
+    holds only the open flows however long the capture runs. checkpoint()
+    saves progress and the open flows; resume() picks up from the last one.
+    """
 
-# Capture packets
-sniff(timeout=CAPTURE_SECONDS, prn=extractor.process_packet)
+    def __init__(self, out, flow_table=FLOW_TABLE):
+        self.out = out
+        self.checkpoint_path = f"{out}.checkpoint.npz"
+        self.table = FLOW_TABLES[flow_table](**FLOW_OPTIONS.get(flow_table, {}))
+        self.sketches = SourceSketches(SKETCH_PERIOD)  # Not checkpointed: refills within a period
+        self._lock = threading.Lock()
+        self._header = True
+        self.rows = 0
+        self.elapsed = 0.0  # Capture seconds recorded before this run
 
-# Extract and Save
-df, _ = extractor.extract_features()
+    # Capture sink interface (backend threads)
+    def process_packet(self, packet):
+        with self._lock:
+            self.table.process_packet(packet)
+
+    def process_frames(self, frames):
+        with self._lock:
+            self.table.process_frames(frames)
+
+    def flush(self, now=None, final=False):
+        """Appends every flow emitted by `now` (all flows if final) to the output."""
+        with self._lock:
+            if final:
+                self.table.flush()
+            if self.table.persistent:
+                df, flow_keys = self.table.extract_features(now)
+            else:
+                df, flow_keys = self.table.extract_features()
+            clock = getattr(self.table, "clock", time.time()) if now is None else now
+        return self.write(df, flow_keys, clock)
+
+    def write(self, df, flow_keys, now):
+        """Adds the source features to one window's flows and appends them to the output."""
+        if len(df):
+            flow_keys = self.sketches.annotate(df, flow_keys, now)
+            df, _ = collapse_sources(df, flow_keys, *collapse_thresholds(len(FEATURE_COLUMNS + SOURCE_FEATURE_COLUMNS)))
+            # Model features only (Tick_Packets and the Source_* counts are bookkeeping)
+            df[FEATURE_COLUMNS + SOURCE_FEATURE_COLUMNS].to_csv(
+                self.out, mode="w" if self._header else "a", header=self._header, index=False)
+            self._header = False
+            self.rows += len(df)
+        return len(df)
+
+    def checkpoint(self, elapsed):
+        with self._lock:
+            # Windowed and sliding tables hold at most a window of traffic: they restart empty
+            snapshot = self.table.snapshot() if hasattr(self.table, "snapshot") else {}
+        meta = {
+            "elapsed": elapsed,
+            "rows": self.rows,
+            "bytes": os.path.getsize(self.out) if not self._header else 0
+        }
+        tmp_path = f"{self.out}.checkpoint.tmp.npz"
+        np.savez(tmp_path, meta=np.array(json.dumps(meta)), **snapshot)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def resume(self):
+        """Restores the last checkpoint, if any. Rows written after it are dropped and re-emitted."""
+        if not os.path.exists(self.checkpoint_path):
+            return False
+        with np.load(self.checkpoint_path) as checkpoint:
+            meta = json.loads(str(checkpoint["meta"]))
+            if "keys" in checkpoint and hasattr(self.table, "restore"):
+                self.table.restore({"keys": checkpoint["keys"], "stats": checkpoint["stats"]})
+        if os.path.exists(self.out):
+            with open(self.out, "r+b") as f:
+                f.truncate(meta["bytes"])
+        self._header = meta["bytes"] == 0
+        self.rows = meta["rows"]
+        self.elapsed = meta["elapsed"]
+        return True
+
+    def finish(self):
+        self.flush(final=True)
+        if os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
+
+
+def record_live(recorder, backend, seconds):
+    remaining = seconds - recorder.elapsed
+    backend.start(recorder)
+    started = last_checkpoint = last_progress = time.monotonic()
+    try:
+        while (done := time.monotonic() - started) < remaining:
+            time.sleep(min(EMIT_INTERVAL, remaining - done))
+            recorder.flush(time.time())  # Wall clock, so idle flows close even in silence
+            if time.monotonic() - last_checkpoint >= CHECKPOINT_SECONDS:
+                recorder.checkpoint(recorder.elapsed + time.monotonic() - started)
+                last_checkpoint = time.monotonic()
+            if time.monotonic() - last_progress >= PROGRESS_SECONDS:
+                print(f"⏳ {recorder.elapsed + time.monotonic() - started:,.0f}s / {seconds:,}s | "
+                      f"{recorder.rows:,} flows written | {len(recorder.table):,} open")
+                last_progress = time.monotonic()
+    except KeyboardInterrupt:
+        backend.stop()
+        recorder.checkpoint(recorder.elapsed + time.monotonic() - started)
+        print(f"⏸️  Interrupted. Progress saved; rerun with --resume to continue.")
+        raise SystemExit(1)
+    backend.stop()
+
+
+def record_pcap(recorder, path):
+    # Packet time drives the windows and timeouts, exactly as main.py --pcap replays
+    for window_start, _, df, flow_keys in replay_windows(path, recorder.table, EMIT_INTERVAL):
+        recorder.write(df, flow_keys, window_start + EMIT_INTERVAL)
+
+
+parser = argparse.ArgumentParser(description="Record a normal-traffic baseline")
+parser.add_argument("--backend", choices=list(CAPTURE_BACKENDS), default="scapy",
+                    help="Packet capture backend ('raw' = Linux AF_PACKET, no Scapy dissection)")
+parser.add_argument("--iface", default=None, help="Interface to capture on (default: all)")
+parser.add_argument("--pcap", default=None, help="Build the baseline from a pcap/pcapng file instead")
+parser.add_argument("--seconds", type=int, default=CAPTURE_SECONDS, help="Capture length (hours/days are fine)")
+parser.add_argument("--out", default=OUTPUT_FILE, help="Baseline CSV to write")
+parser.add_argument("--resume", action="store_true", help="Continue an interrupted capture from its checkpoint")
+args = parser.parse_args()
 
 # Ensure data folder exists
-if not os.path.exists(os.path.join(current_dir, "data")):
-    os.makedirs(os.path.join(current_dir, "data"))
+if os.path.dirname(args.out):
+    os.makedirs(os.path.dirname(args.out), exist_ok=True)
 
-# --- FIX: Saving as NORMAL traffic, not ATTACK ---
-output_path = os.path.join(current_dir, "data/normal_shiva.csv")
-df.to_csv(output_path, index=False)
+recorder = BaselineRecorder(args.out)
+if args.resume and recorder.resume():
+    print(f"🔁 Resuming at {recorder.elapsed:,.0f}s with {recorder.rows:,} flows written "
+          f"and {len(recorder.table):,} open flows restored")
+
+if args.pcap:
+    print(f"🔵 BUILDING BASELINE FROM {args.pcap}...")
+    record_pcap(recorder, args.pcap)
+else:
+    print(f"🔵 STARTING BASELINE CAPTURE ({args.seconds}s, {args.backend} backend)...")
+    print("⚡ ACTION REQUIRED: Go watch 4K YouTube, download files, and browse now!")
+    record_live(recorder, CAPTURE_BACKENDS[args.backend](iface=args.iface), args.seconds)
 
-print(f"✅ Baseline saved with {len(df)} flow records to {output_path}")
-print(df.head())
\ No newline at end of file
+# --- FIX: Saving as NORMAL traffic, not ATTACK ---
+recorder.finish()
+table = recorder.table
+closed = (f" (closed: {table.idle_closed} idle, {table.active_closed} active timeout, {table.evicted} evicted)"
+          if hasattr(table, "idle_closed") else "")
+print(f"✅ Baseline saved with {recorder.rows} flow records ({FLOW_TABLE} flow table) to {args.out}{closed}")
@@ -0,0 +1,45 @@
+import sys
+import os
+
+# --- BULLETPROOF IMPORT FIX ---
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.dirname(current_dir))
+# -----------------------------
+
+import argparse
+import time
+from src.forest_engine import FlatForest
+
+# Compiles the pickled IsolationForest into the flat, memory-mappable
+# artifact. Running sensors and the API pick up the new file on their next
+# poll without a restart (the write is atomic).
+
+PICKLE_PATH = "models/isolation_forest.pkl"
+ARTIFACT_PATH = "models/isolation_forest.flat"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the model as a flat artifact")
+    parser.add_argument("--model", default=PICKLE_PATH, help="Pickled IsolationForest")
+    parser.add_argument("--out", default=ARTIFACT_PATH, help="Artifact to write")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.model):
+        print(f"❌ Error: {args.model} not found. Run train_model.py first!")
+        return
+
+    t0 = time.perf_counter()
+    flat = FlatForest.load(args.model)
+    compile_s = time.perf_counter() - t0
+    flat.save(args.out)
+
+    t0 = time.perf_counter()
+    FlatForest.open(args.out)
+    open_s = time.perf_counter() - t0
+    print(f"✅ Exported model {flat.version} ({flat.n_trees} trees) to {args.out} "
+          f"({os.path.getsize(args.out) / 1024:.0f} KB)")
+    print(f"   pickle load+compile {compile_s * 1000:.1f} ms | artifact open {open_s * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
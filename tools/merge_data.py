@@ -1,66 +1,227 @@
-import pandas as pd
+import sys
 import os
 
+# --- BULLETPROOF IMPORT FIX ---
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.dirname(current_dir))
+# -----------------------------
+
+import argparse
+import glob
+import shutil
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+from src.dataset_store import FORMATS, RECORD, DatasetWriter
+from src.feature_extractor import FEATURE_COLUMNS, SOURCE_FEATURE_COLUMNS
+
+# Out-of-core merge: inputs are read in chunks and every row is sent to a
+# random bucket file on disk; each bucket is then shuffled in memory and
+# written as one partition. Memory stays around MEMORY_MB whatever the
+# total size, and the result is a uniform shuffle of all rows.
+
 # CONFIGURATION
 DATA_DIR = "data"
-OUTPUT_FILE = "data/master_merged.csv"
+OUTPUT_DIR = "data/master_merged"  # Partitioned dataset read by train_model.py
+MEMORY_MB = 256  # Working-memory budget: sizes the read chunks and the buckets
+OUTPUT_FORMAT = "npy"  # "npy" (memory-mappable columns) or "parquet" (needs pyarrow)
+SEED = 42
 
-# FILES TO MERGE
-FILE_SHIVA = "data/normal_shiva.csv"
-FILE_FRIEND = "data/normal_friend.csv"
-FILE_ATTACK = "data/attack_traffic.csv"
+# INPUTS TO MERGE: (glob pattern, label); 1 = Normal, -1 = Attack (Anomaly)
+DEFAULT_INPUTS = [
+    ("data/normal_*.csv", 1),
+    ("data/normal_*.parquet", 1),
+    ("data/attack_traffic*.csv", -1),
+    ("data/attack_traffic*.parquet", -1)
+]
 
-def merge_datasets():
-    print("🔄 STARTING FEDERATED DATA MERGE...")
-    dfs = []
-
-    # 1. Load Shiva's Normal Data (Label = 1)
-    if os.path.exists(FILE_SHIVA):
-        df_shiva = pd.read_csv(FILE_SHIVA)
-        df_shiva['Label'] = 1  # 1 = Normal
-        dfs.append(df_shiva)
-        print(f"   ✅ Loaded Shiva's Data: {len(df_shiva)} rows")
-    else:
-        print(f"   ⚠️ Warning: {FILE_SHIVA} not found (Skipping)")
-
-    # 2. Load Friend's Normal Data (Label = 1)
-    if os.path.exists(FILE_FRIEND):
-        df_friend = pd.read_csv(FILE_FRIEND)
-        df_friend['Label'] = 1  # 1 = Normal
-        dfs.append(df_friend)
-        print(f"   ✅ Loaded Friend's Data: {len(df_friend)} rows")
-    else:
-        print(f"   ⚠️ Warning: {FILE_FRIEND} not found (Skipping)")
-
-    # 3. Load Synthetic Attack Data (Label = -1)
-    if os.path.exists(FILE_ATTACK):
-        df_attack = pd.read_csv(FILE_ATTACK)
-        df_attack['Label'] = -1  # -1 = Attack (Anomaly)
-        dfs.append(df_attack)
-        print(f"   🔴 Loaded Attack Data: {len(df_attack)} rows")
+
+def read_manifest(path):
+    """Input list file: one '<glob pattern> <label>' per line, # comments allowed."""
+    inputs = []
+    with open(path) as f:
+        for line in f:
+            line = line.split("#", 1)[0].strip()
+            if line:
+                pattern, label = line.rsplit(maxsplit=1)
+                inputs.append((pattern, int(label)))
+    return inputs
+
+
+def count_rows(path):
+    """Data rows in a CSV (newline count) or Parquet file (footer metadata)."""
+    if path.endswith(".parquet"):
+        import pyarrow.parquet as pq
+        return pq.ParquetFile(path).metadata.num_rows
+    lines = 0
+    last = b"\n"
+    with open(path, "rb") as f:
+        while block := f.read(1 << 24):
+            lines += block.count(b"\n")
+            last = block[-1:]
+    return max(lines + (last != b"\n") - 1, 0)  # Header line out, unterminated last line in
+
+
+def file_columns(path):
+    if path.endswith(".parquet"):
+        import pyarrow.parquet as pq
+        return pq.ParquetFile(path).schema_arrow.names
+    return list(pd.read_csv(path, nrows=0).columns)
+
+
+def read_chunks(path, chunk_rows, columns):
+    """DataFrames of the given columns, at most chunk_rows rows each."""
+    if path.endswith(".parquet"):
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_rows, columns=columns):
+            yield batch.to_pandas()
     else:
-        print(f"   ❌ CRITICAL: {FILE_ATTACK} not found! Run augment_data.py first.")
-        return
+        yield from pd.read_csv(path, usecols=columns, chunksize=chunk_rows)
 
-    # 4. Merge & Shuffle
-    if dfs:
-        master_df = pd.concat(dfs, ignore_index=True)
-        
-        # Shuffle rows so the model doesn't memorize the order
-        master_df = master_df.sample(frac=1, random_state=42).reset_index(drop=True)
-        
-        # Save
-        master_df.to_csv(OUTPUT_FILE, index=False)
-        
-        print("-" * 30)
-        print(f"🎉 MERGE COMPLETE!")
-        print(f"📊 Total Rows: {len(master_df)}")
-        print(f"   - Normal (1):  {len(master_df[master_df['Label'] == 1])}")
-        print(f"   - Attack (-1): {len(master_df[master_df['Label'] == -1])}")
-        print(f"💾 Saved to: {OUTPUT_FILE}")
-        print("-" * 30)
+
+def to_records(df, label):
+    records = np.empty(len(df), dtype=RECORD)
+    for column in FEATURE_COLUMNS:
+        records[column] = df[column].to_numpy()
+    if SOURCE_FEATURE_COLUMNS[0] in df:
+        for column in SOURCE_FEATURE_COLUMNS:
+            records[column] = df[column].to_numpy()
     else:
+        # Recorded before the source sketches: each flow is its own source context
+        records["Src_Distinct_Ports"] = 1
+        records["Src_Distinct_Hosts"] = 1
+        records["Src_Packets"] = records["Flow_Packets"]
+    records["Label"] = label
+    return records
+
+
+class BucketSpill:
+    """Appends records to `buckets` files, each row to a uniformly random one."""
+
+    def __init__(self, directory, buckets, rng):
+        self.rng = rng
+        self.paths = [os.path.join(directory, f"bucket-{i:05d}.bin") for i in range(buckets)]
+        self._files = [open(path, "wb") for path in self.paths]
+
+    def add(self, records):
+        bucket = self.rng.integers(0, len(self._files), len(records))
+        order = np.argsort(bucket, kind="stable")
+        bounds = np.searchsorted(bucket[order], np.arange(len(self._files) + 1))
+        records = records[order]
+        for i, f in enumerate(self._files):
+            if bounds[i + 1] > bounds[i]:
+                f.write(records[bounds[i]:bounds[i + 1]].tobytes())
+
+    def close(self):
+        for f in self._files:
+            f.close()
+        return self.paths
+
+
+def write_buckets(paths, writer, rng, budget_rows, chunk_rows):
+    """Shuffles each bucket into a partition; oversized buckets are split again first."""
+    for path in paths:
+        rows = os.path.getsize(path) // RECORD.itemsize
+        if rows > budget_rows:
+            # Unlucky/skewed bucket: spread it over sub-buckets that fit
+            directory = tempfile.mkdtemp(dir=os.path.dirname(path))
+            spill = BucketSpill(directory, -(-rows // budget_rows) + 1, rng)
+            for start in range(0, rows, chunk_rows):
+                spill.add(np.fromfile(path, dtype=RECORD, count=chunk_rows, offset=start * RECORD.itemsize))
+            os.remove(path)
+            write_buckets(spill.close(), writer, rng, budget_rows, chunk_rows)
+            os.rmdir(directory)
+        else:
+            records = np.fromfile(path, dtype=RECORD)
+            os.remove(path)
+            if len(records):
+                writer.write(records[rng.permutation(len(records))])
+
+
+def merge_datasets(inputs=None, out=OUTPUT_DIR, memory_mb=MEMORY_MB, fmt=OUTPUT_FORMAT, seed=SEED):
+    print("🔄 STARTING FEDERATED DATA MERGE...")
+    inputs = DEFAULT_INPUTS if inputs is None else inputs
+    if fmt == "parquet" or any(pattern.endswith(".parquet") for pattern, _ in inputs):
+        try:
+            import pyarrow  # noqa: F401
+        except ModuleNotFoundError:
+            if fmt == "parquet":
+                print("❌ Error: Parquet output needs pyarrow (pip install pyarrow).")
+                return
+            inputs = [(pattern, label) for pattern, label in inputs if not pattern.endswith(".parquet")]
+
+    # 1. Resolve inputs
+    files = []
+    for pattern, label in inputs:
+        matched = sorted(glob.glob(pattern))
+        if not matched and "*" not in pattern:
+            print(f"   ⚠️ Warning: {pattern} not found (Skipping)")
+        for path in matched:
+            rows = count_rows(path)
+            kind = "Normal" if label == 1 else "Attack"
+            print(f"   {'✅' if label == 1 else '🔴'} {path}: {rows} rows ({kind})")
+            columns = FEATURE_COLUMNS + SOURCE_FEATURE_COLUMNS
+            if not set(SOURCE_FEATURE_COLUMNS) <= set(file_columns(path)):
+                columns = FEATURE_COLUMNS
+                print(f"   ⚠️ Warning: {path} has no source features; filling neutral values")
+            files.append((path, label, rows, columns))
+
+    if not any(label == -1 for _, label, _, _ in files):
+        print("   ❌ CRITICAL: no attack data found! Run augment_data.py first.")
+        return
+    total = sum(rows for _, _, rows, _ in files)
+    if total == 0:
         print("❌ No data loaded. Check your filenames.")
+        return
+
+    # 2. Size the buckets so one (plus its shuffled copy) fits the budget
+    budget_rows = max(1, (memory_mb << 20) // (3 * RECORD.itemsize))
+    chunk_rows = max(1000, budget_rows // 4)  # pandas parses a CSV chunk at a few times its final size
+    buckets = -(-total // budget_rows)
+    rng = np.random.default_rng(seed)
+    started = time.perf_counter()
+
+    parent = os.path.dirname(os.path.abspath(out))
+    os.makedirs(parent, exist_ok=True)
+    spill_dir = tempfile.mkdtemp(prefix="merge-", dir=parent)
+    try:
+        # 3. Scatter rows to random buckets, one chunk at a time
+        spill = BucketSpill(spill_dir, buckets, rng)
+        for path, label, _, columns in files:
+            for df in read_chunks(path, chunk_rows, columns):
+                spill.add(to_records(df, label))
+        paths = spill.close()
+
+        # 4. Shuffle each bucket in memory and write it as a partition
+        writer = DatasetWriter(out, fmt, seed=seed, inputs=[[path, label] for path, label, _, _ in files])
+        write_buckets(paths, writer, rng, budget_rows, chunk_rows)
+        manifest = writer.close()
+    finally:
+        shutil.rmtree(spill_dir, ignore_errors=True)
+
+    print("-" * 30)
+    print(f"🎉 MERGE COMPLETE! ({time.perf_counter() - started:.1f}s)")
+    print(f"📊 Total Rows: {manifest['rows']} in {len(manifest['partitions'])} partitions")
+    print(f"   - Normal (1):  {manifest['labels'].get('1', 0)}")
+    print(f"   - Attack (-1): {manifest['labels'].get('-1', 0)}")
+    print(f"💾 Saved to: {out}/ ({fmt})")
+    print("-" * 30)
 
 if __name__ == "__main__":
-    merge_datasets()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Merge labeled flow datasets into a shuffled, partitioned dataset")
+    parser.add_argument("--input", nargs=2, action="append", metavar=("PATTERN", "LABEL"),
+                        help="Glob pattern and label (1 normal, -1 attack); repeatable")
+    parser.add_argument("--manifest", default=None, help="File listing '<pattern> <label>' lines")
+    parser.add_argument("--out", default=OUTPUT_DIR, help="Output dataset directory")
+    parser.add_argument("--memory-mb", type=int, default=MEMORY_MB, help="Working-memory budget")
+    parser.add_argument("--format", choices=FORMATS, default=OUTPUT_FORMAT)
+    parser.add_argument("--seed", type=int, default=SEED)
+    args = parser.parse_args()
+
+    inputs = None
+    if args.input or args.manifest:
+        inputs = [(pattern, int(label)) for pattern, label in args.input or []]
+        if args.manifest:
+            inputs += read_manifest(args.manifest)
+    merge_datasets(inputs, args.out, args.memory_mb, args.format, args.seed)
@@ -1,17 +1,41 @@
+import sys
+import os
+
+# --- BULLETPROOF IMPORT FIX ---
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.dirname(current_dir))
+# -----------------------------
+
+import argparse
+import time
 import pandas as pd
 import numpy as np
 import joblib
-import os
+from joblib import Parallel, delayed
 from sklearn.ensemble import IsolationForest
-from sklearn.model_selection import ParameterGrid
-from sklearn.metrics import precision_score, recall_score, f1_score
+from sklearn.model_selection import ParameterGrid, train_test_split
+from src.dataset_store import Dataset
+from src.forest_engine import FlatForest, file_digest
 
 # CONFIGURATION
-DATA_FILE = "data/master_merged.csv"
+DATA_FILE = "data/master_merged"  # Partitioned dataset from merge_data.py (a .csv file also works)
 MODEL_PATH = "models/isolation_forest.pkl"
+ARTIFACT_PATH = "models/isolation_forest.flat"  # Memory-mapped copy the sensors/API hot-reload
+HOLDOUT_FRACTION = 0.2  # Share of rows kept out of training and used for scoring (0 = score on training data)
+MIN_PRECISION = 0.90
+
+# Features to train on (Must match feature_extractor.py!)
+FLOW_FEATURES = ["Dst_Port", "Protocol", "Flow_Packets", "Flow_Bytes",
+                 "Flow_Duration", "Packet_Rate", "Byte_Rate", "TCP_Flags_Sum"]
+# Per-source scan / fan-out context (src/sketches.py), used when the data has it
+SOURCE_FEATURES = ["Src_Distinct_Ports", "Src_Distinct_Hosts", "Src_Packets"]
+FEATURES = FLOW_FEATURES + SOURCE_FEATURES
 
 # 🧠 THE "HYPERPARAMETER GRID"
 # We test ALL these combinations to find the perfect brain.
+# Contamination only moves the score threshold, so the forest is fitted
+# once per (n_estimators, max_samples) and every contamination value is
+# read off the same sorted scores.
 param_grid = {
     'n_estimators': [100, 200],         # More trees = More stable (but slower)
     'max_samples': [128, 256, 'auto'],  # How many samples each tree sees
@@ -19,58 +43,150 @@ param_grid = {
     'random_state': [42]
 }
 
-def train_and_tune():
+
+def fit_forest(params, X_train, X_eval, features):
+    """One forest per tree config -> (model, train scores, eval scores, fit s, score s)."""
+    started = time.perf_counter()
+    clf = IsolationForest(**params, n_jobs=1)  # Parallelism is across configs
+    clf.fit(pd.DataFrame(X_train, columns=features))
+    fit_s = time.perf_counter() - started
+
+    started = time.perf_counter()
+    train_scores = clf.score_samples(pd.DataFrame(X_train, columns=features))
+    eval_scores = train_scores if X_eval is None else clf.score_samples(pd.DataFrame(X_eval, columns=features))
+    return clf, train_scores, eval_scores, fit_s, time.perf_counter() - started
+
+
+def threshold_curve(scores, y_true):
+    """Precision/recall of flagging the k lowest scores, for every k."""
+    order = np.argsort(scores, kind="stable")
+    attacks = y_true[order] == -1
+    tp = np.cumsum(attacks)
+    flagged = np.arange(1, len(scores) + 1)
+    return scores[order], tp / flagged, tp / max(int(attacks.sum()), 1)
+
+
+def sweep(train_scores, eval_scores, y_eval, contaminations):
+    """Precision/recall per contamination, with sklearn's threshold (training-score percentile)."""
+    sorted_scores, precision, recall = threshold_curve(eval_scores, y_eval)
+    results = []
+    for contamination in contaminations:
+        offset = np.percentile(train_scores, 100.0 * contamination)
+        flagged = int(np.searchsorted(sorted_scores, offset, side="left"))  # score < offset -> -1
+        prec = float(precision[flagged - 1]) if flagged else 0.0
+        rec = float(recall[flagged - 1]) if flagged else 0.0
+        f1 = 2 * prec * rec / (prec + rec) if prec + rec else 0.0
+        results.append((contamination, offset, prec, rec, f1))
+    return results, (sorted_scores, precision, recall)
+
+
+def load_data(path, rows=None, features=FEATURES):
+    """
+    (X, y, features) from a merge_data.py dataset directory (read lazily)
+    or a CSV file. Source features are dropped if the data predates them.
+    """
+    if os.path.isdir(path):
+        dataset = Dataset(path)
+        available = dataset.columns
+    else:
+        dataset = None
+        available = pd.read_csv(path, nrows=0).columns
+    missing = [name for name in features if name not in available]
+    if missing and all(name in SOURCE_FEATURES for name in missing):
+        print(f"   ⚠️ Warning: {path} has no {', '.join(missing)} (re-run merge_data.py); "
+              f"training a flow-only model")
+        features = FLOW_FEATURES
+
+    if dataset is not None:
+        # Rows are already shuffled, so the first `rows` are a random sample
+        columns = dataset.read(features + ['Label'], rows)
+        X = np.column_stack([columns[name] for name in features]).astype(np.float64)
+        return X, columns['Label'].astype(np.int64), features
+    df = pd.read_csv(path, nrows=rows)
+    return np.ascontiguousarray(df[features].to_numpy(dtype=np.float64)), df['Label'].to_numpy(), features
+
+
+def train_and_tune(holdout=HOLDOUT_FRACTION, jobs=-1, curves_path=None, data_path=DATA_FILE, rows=None,
+                   features=FEATURES):
     print("⚔️  ENTERING THE BATTLE ARENA (Auto-Tuning)...")
     
-    if not os.path.exists(DATA_FILE):
-        print(f"❌ Error: {DATA_FILE} not found. Run merge_data.py first!")
+    if not os.path.exists(data_path):
+        print(f"❌ Error: {data_path} not found. Run merge_data.py first!")
         return
 
     # 1. Load Data
-    df = pd.read_csv(DATA_FILE)
-    
-    # Features to train on (Must match feature_extractor.py!)
-    features = ["Dst_Port", "Protocol", "Flow_Packets", "Flow_Bytes", 
-                "Flow_Duration", "Packet_Rate", "Byte_Rate", "TCP_Flags_Sum"]
-    
-    X = df[features]
-    y_true = df['Label'] # 1 = Normal, -1 = Attack
+    X, y_true, features = load_data(data_path, rows, features) # 1 = Normal, -1 = Attack
+    print(f"🧬 Features: {', '.join(features)}")
+
+    if holdout > 0:
+        X_train, X_eval, _, y_eval = train_test_split(X, y_true, test_size=holdout,
+                                                      stratify=y_true, random_state=42)
+        print(f"📊 Training on {len(X_train)} rows, scoring on {len(X_eval)} held-out rows")
+    else:
+        X_train, X_eval, y_eval = X, None, y_true
+        print(f"📊 Training and scoring on all {len(X_train)} rows")
+
+    grid = {key: values for key, values in param_grid.items() if key != 'contamination'}
+    configs = list(ParameterGrid(grid))
+    contaminations = sorted(param_grid['contamination'])
+
+    # 2. One fit per tree config, in parallel. joblib memory-maps the
+    # arrays for the worker processes instead of pickling a copy per task.
+    print(f"🔎 Testing {len(configs) * len(contaminations)} model configurations "
+          f"({len(configs)} forests x {len(contaminations)} thresholds)...")
+    started = time.perf_counter()
+    fits = Parallel(n_jobs=jobs, max_nbytes="1M", mmap_mode="r")(
+        delayed(fit_forest)(params, X_train, X_eval, features) for params in configs
+    )
+    print(f"   ⏱️  {len(configs)} forests fitted and scored in {time.perf_counter() - started:.1f}s")
 
     best_score = 0
     best_params = None
     best_model = None
-    
-    # 2. Grid Search Loop
-    print(f"🔎 Testing {len(list(ParameterGrid(param_grid)))} different model configurations...")
-    
-    for params in ParameterGrid(param_grid):
-        # Train Model
-        clf = IsolationForest(**params, n_jobs=-1)
-        clf.fit(X)
-        
-        # Predict
-        y_pred = clf.predict(X)
-        
-        # 3. Custom Scoring: "The Recruiter Score"
-        # We value Precision (No False Positives) more than Recall.
-        # If we block YouTube (False Positive), we fail.
-        prec = precision_score(y_true, y_pred, pos_label=-1, zero_division=0)
-        rec = recall_score(y_true, y_pred, pos_label=-1, zero_division=0)
-        
-        # We filter out models that are too trigger-happy (Low Precision)
-        if prec < 0.90: 
-            score = 0 # Disqualify models with <90% Precision
-        else:
-            # F1 Score weighted towards precision
-            score = f1_score(y_true, y_pred, pos_label=-1, zero_division=0)
-
-        print(f"   👉 Config: {params} | Precision: {prec:.2f} | Recall: {rec:.2f}")
-
-        # Save Winner
-        if score > best_score:
-            best_score = score
-            best_params = params
-            best_model = clf
+    curves = []
+
+    for params, (clf, train_scores, eval_scores, fit_s, score_s) in zip(configs, fits):
+        started = time.perf_counter()
+        results, (sorted_scores, precision, recall) = sweep(train_scores, eval_scores, y_eval, contaminations)
+        sweep_s = time.perf_counter() - started
+        print(f"   🌲 Forest: {params} | fit {fit_s:.2f}s | score {score_s:.2f}s | sweep {sweep_s * 1000:.1f}ms")
+        if curves_path:
+            curves.append(pd.DataFrame({**{key: [value] * len(sorted_scores) for key, value in params.items()},
+                                        "Threshold": sorted_scores, "Precision": precision, "Recall": recall}))
+
+        for contamination, offset, prec, rec, f1 in results:
+            # 3. Custom Scoring: "The Recruiter Score"
+            # We value Precision (No False Positives) more than Recall.
+            # If we block YouTube (False Positive), we fail.
+            # We filter out models that are too trigger-happy (Low Precision)
+            if prec < MIN_PRECISION:
+                score = 0 # Disqualify models with <90% Precision
+            else:
+                # F1 Score weighted towards precision
+                score = f1
+
+            print(f"   👉 Config: { {**params, 'contamination': contamination} } | "
+                  f"Precision: {prec:.2f} | Recall: {rec:.2f}")
+
+            # Save Winner
+            if score > best_score:
+                best_score = score
+                best_params = {**params, 'contamination': contamination}
+                # Same threshold fit() would have set for this contamination
+                best_model = (clf, contamination, offset)
+
+    if curves_path:
+        pd.concat(curves, ignore_index=True).to_csv(curves_path, index=False)
+        print(f"📈 Precision/recall curves written to {curves_path}")
+
+    if best_model is None:
+        print(f"\n❌ No configuration reached {MIN_PRECISION:.0%} precision; model not saved.")
+        return
+
+    clf, contamination, offset = best_model
+    clf.set_params(contamination=contamination)
+    clf.offset_ = offset
+    best_model = clf
 
     # 4. Final Result
     print("\n🏆 CHAMPION MODEL FOUND!")
@@ -80,6 +196,21 @@ def train_and_tune():
     # Save to disk
     joblib.dump(best_model, MODEL_PATH)
     print(f"✅ Saved optimized brain to {MODEL_PATH}")
+    flat = FlatForest.from_model(best_model)
+    flat.source = file_digest(MODEL_PATH)  # Lets the model registry tell this artifact is current
+    flat.save(ARTIFACT_PATH)
+    print(f"✅ Exported flat artifact {flat.version} to {ARTIFACT_PATH}")
 
 if __name__ == "__main__":
-    train_and_tune()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Tune and train the Isolation Forest")
+    parser.add_argument("--holdout", type=float, default=HOLDOUT_FRACTION,
+                        help="Fraction of rows held out for scoring (0 = score on training data)")
+    parser.add_argument("--jobs", type=int, default=-1, help="Parallel fits (-1 = all cores)")
+    parser.add_argument("--curves", default=None, help="Write per-forest precision/recall curves to this CSV")
+    parser.add_argument("--data", default=DATA_FILE, help="Dataset directory (merge_data.py) or CSV file")
+    parser.add_argument("--rows", type=int, default=None, help="Train on the first N rows only")
+    parser.add_argument("--flow-only", action="store_true",
+                        help="Train on the 8 per-flow features only (no per-source context)")
+    args = parser.parse_args()
+    train_and_tune(args.holdout, args.jobs, args.curves, args.data, args.rows,
+                   FLOW_FEATURES if args.flow_only else FEATURES)